@@ -0,0 +1,162 @@
+import logging
+
+# Pass band (in Hz) of the filter applied before beat detection.  Below it
+# lies baseline wander from breathing and electrode drift, above it muscle
+# noise and mains hum, while the QRS complex sits well inside it
+BANDPASS = (0.5, 40.0)
+# Order of the Butterworth filter (doubled by the pass band, and doubled
+# again by the forward-backward pass of the zero-phase filter)
+FILTER_ORDER = 2
+# Fraction of the Nyquist frequency above which an upper cutoff is dropped,
+# leaving only a high-pass filter for slowly sampled recordings
+NYQUIST_MARGIN = 0.95
+
+
+def estimate_sample_rate(times):
+    """ Estimates the sample rate of time data from its median time step, so
+    that a few dropped or repeated samples do not skew it
+
+    :param times: Array of time data
+    :return: Float sample rate (in Hz), or None if there are fewer than two
+    distinct times
+    """
+    import numpy
+    steps = numpy.diff(numpy.asarray(times, dtype=float))
+    steps = steps[steps > 0]
+    if steps.size == 0:
+        return None
+    return 1.0 / float(numpy.median(steps))
+
+
+def design_bandpass(sample_rate, band=BANDPASS, order=FILTER_ORDER):
+    """ Designs a Butterworth band-pass filter as second-order sections
+
+    :param sample_rate: Sample rate (in Hz) of the data to filter
+    :param band: (low, high) cutoff frequencies in Hz.  A low cutoff of 0 or
+    less gives a low-pass filter, and a high cutoff too close to the Nyquist
+    frequency (or None) gives a high-pass filter
+    :param order: Order of the Butterworth filter
+    :return: (sections x 6) array of second-order sections
+    """
+    import scipy.signal
+    low, high = band
+    nyquist = sample_rate / 2.0
+    if high is not None and high >= NYQUIST_MARGIN * nyquist:
+        logging.warning("Upper cutoff %f Hz too close to the Nyquist "
+                        "frequency %f Hz, not applied" % (high, nyquist))
+        high = None
+    if low is not None and low <= 0:
+        low = None
+    if low is not None and high is not None and not low < high:
+        raise ValueError("Low cutoff {} Hz is not below high cutoff {} Hz"
+                         .format(low, high))
+    if low is None and high is None:
+        raise ValueError("A filter needs a low or a high cutoff below the "
+                         "Nyquist frequency")
+    if high is None:
+        return scipy.signal.butter(order, low, "highpass", fs=sample_rate,
+                                   output="sos")
+    if low is None:
+        return scipy.signal.butter(order, high, "lowpass", fs=sample_rate,
+                                   output="sos")
+    return scipy.signal.butter(order, [low, high], "bandpass",
+                               fs=sample_rate, output="sos")
+
+
+def bandpass_filter(times, voltages, band=BANDPASS, order=FILTER_ORDER,
+                    sample_rate=None):
+    """ Removes baseline wander and high-frequency noise from a whole
+    recording with a zero-phase (forward-backward) band-pass filter, which
+    leaves the peaks where they were
+
+    :param times: Array of time data
+    :param voltages: Array of voltage data (samples, or samples x leads)
+    :param band: (low, high) cutoff frequencies in Hz
+    :param order: Order of the Butterworth filter
+    :param sample_rate: Sample rate (in Hz) of the data.  If None, it is
+    estimated from the times
+    :return: Numpy array of filtered voltages, shaped like voltages
+    """
+    import numpy
+    import scipy.signal
+    voltages = numpy.asarray(voltages, dtype=float)
+    if sample_rate is None:
+        sample_rate = estimate_sample_rate(times)
+    if sample_rate is None or voltages.shape[0] < 2:
+        return voltages.copy()
+    sos = design_bandpass(sample_rate, band, order)
+    # The default padding is longer than a very short strip
+    padlen = min(3 * (2 * len(sos) + 1), voltages.shape[0] - 1)
+    return scipy.signal.sosfiltfilt(sos, voltages, axis=0, padlen=padlen)
+
+
+class StreamingBandpassFilter(object):
+    """ Causal band-pass filter for voltage data that arrives in consecutive
+    chunks.  The filter state is carried from one chunk to the next, so
+    filtering a recording chunk by chunk gives the same output as filtering
+    it in one go.  Unlike bandpass_filter, the output lags the input by the
+    filter's group delay (up to about 10 milliseconds with the default
+    band).
+    """
+
+    def __init__(self, sample_rate, band=BANDPASS, order=FILTER_ORDER):
+        """ Creates the filter
+
+        :param sample_rate: Sample rate (in Hz) of the data to filter
+        :param band: (low, high) cutoff frequencies in Hz
+        :param order: Order of the Butterworth filter
+        """
+        self.sos = design_bandpass(sample_rate, band, order)
+        self._state = None
+
+    def filter(self, voltages):
+        """ Filters the next chunk of voltage data
+
+        :param voltages: Array of voltage data (samples, or samples x leads)
+        :return: Numpy array of filtered voltages, shaped like voltages
+        """
+        import numpy
+        import scipy.signal
+        voltages = numpy.asarray(voltages, dtype=float)
+        if voltages.shape[0] == 0:
+            return voltages.copy()
+        if self._state is None:
+            # Start as if the first voltage had always been there, so the
+            # output does not open with a step response
+            zi = scipy.signal.sosfilt_zi(self.sos)
+            self._state = zi.reshape(zi.shape + (1,) * (voltages.ndim - 1)) \
+                * voltages[0]
+        filtered, self._state = scipy.signal.sosfilt(
+            self.sos, voltages, axis=0, zi=self._state)
+        return filtered
+
+
+def filter_chunks(chunks, band=BANDPASS, order=FILTER_ORDER):
+    """ Filters a stream of (time, voltage) chunks with a
+    StreamingBandpassFilter, whose sample rate is estimated from the first
+    few samples.  Chunks are held back only until two samples have arrived.
+
+    :param chunks: Iterable of (time, voltage) array chunks
+    :param band: (low, high) cutoff frequencies in Hz
+    :param order: Order of the Butterworth filter
+    :return: Generator of (time, voltage, filtered voltage) chunks
+    """
+    import numpy
+    pending = []
+    streaming = None
+    for time, voltage in chunks:
+        if streaming is None:
+            pending.append((time, voltage))
+            times = numpy.concatenate([part[0] for part in pending])
+            sample_rate = estimate_sample_rate(times)
+            if sample_rate is None:
+                continue
+            streaming = StreamingBandpassFilter(sample_rate, band, order)
+            for time, voltage in pending:
+                yield time, voltage, streaming.filter(voltage)
+            pending = []
+        else:
+            yield time, voltage, streaming.filter(voltage)
+    # Too few samples to estimate a sample rate: nothing to filter
+    for time, voltage in pending:
+        yield time, voltage, numpy.asarray(voltage, dtype=float).copy()
@@ -0,0 +1,110 @@
+import logging
+import json
+import argparse
+import glob
+import os
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import heartRateMonitor
+
+
+def batch_main(path, endtime, workers=None, chunksize=None,
+               manifest_filepath="manifest.json", cache_dir=None):
+    """ Driver function that analyzes every csv file in a directory (or
+    matching a glob pattern) across a pool of worker processes
+
+    :param path: A String representing a directory of csv files, or a glob
+    pattern such as "data/*.csv"
+    :param endtime: Time (in seconds) at which each recording should end
+    :param workers: Number of worker processes (defaults to the CPU count)
+    :param chunksize: Number of csv rows each worker holds in memory at once.
+    If None, each file is read in at once
+    :param manifest_filepath: Filepath of the JSON summary manifest
+    :param cache_dir: Directory of cached preprocessed recordings shared by
+    the workers.  If None, no cache is used
+    :returns: Dictionary containing the manifest that was written
+    """
+    heartRateMonitor.configure_logging()
+    logging.info("Batch started")
+    start = time.time()
+    filepaths = find_files(path)
+    logging.info("Found %d csv files" % len(filepaths))
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=heartRateMonitor.configure_logging,
+                             initargs=('a',)) as pool:
+        results = list(pool.map(analyze_one, filepaths,
+                                itertools.repeat(endtime),
+                                itertools.repeat(chunksize),
+                                itertools.repeat(cache_dir)))
+    manifest = {"path": path,
+                "endtime": endtime,
+                "num_files": len(results),
+                "num_failed": sum(result["status"] != "ok"
+                                  for result in results),
+                "seconds": time.time() - start,
+                "files": results}
+    with open(manifest_filepath, "w") as file:
+        json.dump(manifest, file, indent=2)
+    logging.info("Manifest written: %s" % manifest_filepath)
+    logging.info("Batch finished")
+    return manifest
+
+
+def find_files(path):
+    """ Lists the data files to analyze
+
+    :param path: A String representing a directory of csv (and raw binary)
+    files, or a glob pattern
+    :returns: Sorted list of filepaths
+    """
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.csv")) +
+                      glob.glob(os.path.join(path, "*.bin")))
+    return sorted(glob.glob(path))
+
+
+def analyze_one(filepath, endtime, chunksize=None, cache_dir=None):
+    """ Analyzes a single file inside a worker process, recording (rather
+    than raising) any error so that one bad file does not stop the batch
+
+    :param filepath: A String representing the path to the ECG data
+    :param endtime: Time (in seconds) at which the data should end
+    :param chunksize: Number of csv rows to hold in memory at once
+    :param cache_dir: Directory of cached preprocessed recordings
+    :returns: Dictionary with the file's status, JSON filepath, error message
+    and processing time (in seconds)
+    """
+    start = time.time()
+    result = {"file": filepath, "status": "ok", "json": None, "error": None}
+    try:
+        result["json"] = heartRateMonitor.analyze_file(
+            filepath, endtime, chunksize=chunksize, cache_dir=cache_dir)
+    except Exception as error:
+        logging.error("Analysis of %s failed: %s" % (filepath, error))
+        result["status"] = "failed"
+        result["error"] = "{}: {}".format(type(error).__name__, error)
+    result["seconds"] = time.time() - start
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="Directory of csv files, or a glob "
+                                     "pattern matching them")
+    parser.add_argument("endtime", help="Time (in seconds) at which each "
+                                        "recording should end")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes (defaults to the "
+                             "number of CPUs)")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream each file this many rows at a time")
+    parser.add_argument("--manifest", default="manifest.json",
+                        help="Filepath of the JSON summary manifest")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory in which to cache preprocessed "
+                             "recordings between runs")
+    args = parser.parse_args()
+    batch_main(args.path, args.endtime, workers=args.workers,
+               chunksize=args.chunksize, manifest_filepath=args.manifest,
+               cache_dir=args.cache_dir)
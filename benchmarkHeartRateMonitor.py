@@ -0,0 +1,327 @@
+import json
+import argparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy
+import pandas
+import heartRateMonitor
+
+# The in-memory pipeline holds each recording whole (several arrays of 8
+# bytes a sample while it is parsed and cleaned), so larger sizes are left
+# to --sizes on machines with the memory for them
+DEFAULT_SIZES = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+# Importing heartRateMonitor (what every CLI launch pays before -h or input
+# validation) must stay within this many seconds, and must not pull in
+# any of HEAVY_MODULES
+IMPORT_TIME_BUDGET = 0.15
+HEAVY_MODULES = ["numpy", "pandas", "peakutils", "scipy"]
+STAGES = ["extract_file", "convert_to_floats", "interpolate", "voltage_clip",
+          "check_time_data", "user_specify_time", "metrics_to_dict",
+          "dict_to_json"]
+# (amplitude in mV, center and width as fractions of one beat) of the P, Q,
+# R, S and T waves
+WAVES = [(0.15, 0.20, 0.025),
+         (-0.10, 0.30, 0.010),
+         (1.00, 0.33, 0.010),
+         (-0.25, 0.36, 0.010),
+         (0.30, 0.60, 0.050)]
+
+
+def synthetic_ecg(duration, sample_rate=360.0, heart_rate=72.0, noise=0.0,
+                  missing_rate=0.0, spike_rate=0.0, seed=0, start=0):
+    """ Generates a synthetic ECG signal made of Gaussian P, QRS and T waves,
+    with optional noise, missing samples and out-of-range spikes
+
+    :param duration: Length of the signal (in seconds)
+    :param sample_rate: Sampling rate in Hz
+    :param heart_rate: Heart rate in bpm
+    :param noise: Standard deviation (in mV) of added Gaussian noise
+    :param missing_rate: Fraction of voltages replaced with NaN
+    :param spike_rate: Fraction of voltages replaced with spikes above 300mV
+    :param seed: Seed of the random number generator
+    :param start: Index of the first sample, so that consecutive pieces of
+    one long signal can be generated separately
+    :returns: Arrays of time and voltage data
+    """
+    rng = numpy.random.RandomState(seed)
+    num_samples = int(round(duration * sample_rate))
+    times = numpy.arange(start, start + num_samples) / float(sample_rate)
+    phase = (times * heart_rate / 60.0) % 1.0
+    voltages = numpy.zeros(num_samples)
+    for amplitude, center, width in WAVES:
+        voltages += amplitude * numpy.exp(-0.5 * ((phase - center) / width)
+                                          ** 2)
+    if noise:
+        voltages += rng.normal(0.0, noise, num_samples)
+    spikes = rng.rand(num_samples) < spike_rate
+    voltages[spikes] = rng.uniform(301.0, 1000.0, spikes.sum())
+    voltages[rng.rand(num_samples) < missing_rate] = numpy.nan
+    return times, voltages
+
+
+def write_synthetic_csv(filepath, duration, sample_rate=360.0,
+                        chunk_seconds=3600.0, **kwargs):
+    """ Writes a synthetic ECG signal to a csv file one piece at a time, so
+    that recordings larger than memory can be generated.  Missing voltages
+    are written as empty fields.
+
+    :param filepath: A String representing the path of the new csv file
+    :param duration: Length of the signal (in seconds)
+    :param sample_rate: Sampling rate in Hz
+    :param chunk_seconds: Length (in seconds) of each piece
+    :param kwargs: Other keyword arguments of synthetic_ecg
+    :returns: Total number of samples written
+    """
+    seed = kwargs.pop("seed", 0)
+    total = int(round(duration * sample_rate))
+    chunk_samples = max(1, int(chunk_seconds * sample_rate))
+    with open(filepath, "w") as file:
+        for index, start in enumerate(range(0, total, chunk_samples)):
+            num_samples = min(chunk_samples, total - start)
+            times, voltages = synthetic_ecg(
+                num_samples / float(sample_rate), sample_rate,
+                seed=seed + index, start=start, **kwargs)
+            pandas.DataFrame({"Time": times, "Voltage": voltages}).to_csv(
+                file, header=False, index=False, na_rep="",
+                float_format="%.6f")
+    return total
+
+
+def measure_import_time(module="heartRateMonitor"):
+    """ Measures how long a fresh interpreter takes to import a module, and
+    which heavy dependencies that import loads
+
+    :param module: Name of the module to import
+    :returns: Float representing the import time in seconds, and the list of
+    HEAVY_MODULES that were loaded
+    """
+    script = ("import sys, time\n"
+              "start = time.perf_counter()\n"
+              "import {}\n"
+              "print(time.perf_counter() - start)\n"
+              "print(' '.join(name for name in {!r} if name in sys.modules))"
+              .format(module, HEAVY_MODULES))
+    output = subprocess.check_output(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        universal_newlines=True).split("\n")
+    return float(output[0]), output[1].split()
+
+
+def time_stages(filepath, endtime):
+    """ Runs the in-memory pipeline of heartRateMonitor.py on one file,
+    timing each stage separately
+
+    :param filepath: A String representing the path to the ECG data
+    :param endtime: Time (in seconds) at which the data should end
+    :returns: Dictionary of wall time (in seconds) per stage, and arrays of
+    the time and voltage data the metrics were computed from
+    """
+    timings = {}
+    start = time.perf_counter()
+    times, voltages = heartRateMonitor.extract_file(filepath)
+    timings["extract_file"] = time.perf_counter() - start
+    start = time.perf_counter()
+    times, time_invalid = heartRateMonitor.convert_to_floats(times)
+    voltages, voltage_invalid = heartRateMonitor.convert_to_floats(voltages)
+    timings["convert_to_floats"] = time.perf_counter() - start
+    start = time.perf_counter()
+    times, voltages = heartRateMonitor.interpolate(times, voltages,
+                                                   time_invalid,
+                                                   voltage_invalid)
+    timings["interpolate"] = time.perf_counter() - start
+    start = time.perf_counter()
+    voltages = heartRateMonitor.voltage_clip(voltages)
+    timings["voltage_clip"] = time.perf_counter() - start
+    start = time.perf_counter()
+    times, voltages, _ = heartRateMonitor.check_time_data(times, voltages,
+                                                          "sort")
+    timings["check_time_data"] = time.perf_counter() - start
+    start = time.perf_counter()
+    times, voltages = heartRateMonitor.user_specify_time(times, voltages,
+                                                         endtime)
+    timings["user_specify_time"] = time.perf_counter() - start
+    start = time.perf_counter()
+    metrics = heartRateMonitor.metrics_to_dict(times, voltages)
+    timings["metrics_to_dict"] = time.perf_counter() - start
+    start = time.perf_counter()
+    heartRateMonitor.dict_to_json(metrics, filepath)
+    timings["dict_to_json"] = time.perf_counter() - start
+    return timings, times, voltages
+
+
+def compare_detectors(times, voltages, threshold=0.80,
+                      refractory=heartRateMonitor.REFRACTORY_PERIOD):
+    """ Times the beat detection of heartRateMonitor.py against
+    peakutils.peak.indexes on one cleaned recording
+
+    :param times: Array of time data
+    :param voltages: Array of voltage data
+    :param threshold: Relative peak threshold, as a fraction of the voltage
+    range
+    :param refractory: Shortest time (in seconds) between two beats
+    :returns: Dictionary of wall times (in seconds) and beat counts; the
+    peakutils entries are None if peakutils is not installed
+    """
+    start = time.perf_counter()
+    native = heartRateMonitor.ECGAnalysis(times, voltages, threshold,
+                                          refractory).beat_indices
+    native_seconds = time.perf_counter() - start
+    unfiltered = heartRateMonitor.ECGAnalysis(times, voltages, threshold,
+                                              0.0).beat_indices
+    result = {"native_seconds": native_seconds,
+              "native_beats": int(native.size),
+              "native_beats_without_refractory": int(unfiltered.size),
+              "peakutils_seconds": None,
+              "peakutils_beats": None,
+              "matches_peakutils": None}
+    try:
+        import peakutils
+    except ImportError:
+        return result
+    start = time.perf_counter()
+    expected = peakutils.peak.indexes(voltages, thres=threshold)
+    result["peakutils_seconds"] = time.perf_counter() - start
+    result["peakutils_beats"] = int(expected.size)
+    result["matches_peakutils"] = bool(numpy.array_equal(unfiltered,
+                                                         expected))
+    return result
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, output_filepath="benchmark.json",
+                   sample_rate=360.0, noise=0.02, missing_rate=0.001,
+                   spike_rate=0.0001, seed=0, recordings=()):
+    """ Times every pipeline stage on synthetic recordings of each size, and
+    writes the results (with the package versions) to a JSON file.  Beat
+    detection is also compared against peakutils, on the cleaned synthetic
+    recordings that were timed and on any real recordings given
+
+    :param sizes: List of recording sizes (in samples)
+    :param output_filepath: Filepath of the JSON results file
+    :param sample_rate: Sampling rate in Hz
+    :param noise: Standard deviation (in mV) of added Gaussian noise
+    :param missing_rate: Fraction of voltages that are missing
+    :param spike_rate: Fraction of voltages that spike above 300mV
+    :param seed: Seed of the random number generator
+    :param recordings: List of csv files of real recordings
+    :returns: Dictionary containing the results that were written
+    """
+    results = []
+    workdir = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            duration = size / float(sample_rate)
+            filepath = os.path.join(workdir, "synthetic_%d.csv" % size)
+            write_synthetic_csv(filepath, duration, sample_rate, noise=noise,
+                                missing_rate=missing_rate,
+                                spike_rate=spike_rate, seed=seed)
+            timings, times, voltages = time_stages(filepath, 0.9 * duration)
+            file_bytes = os.path.getsize(filepath)
+            os.remove(filepath)
+            detectors = compare_detectors(times, voltages)
+            del times, voltages
+            results.append({"num_samples": size,
+                            "file_bytes": file_bytes,
+                            "stages": timings,
+                            "total": sum(timings.values()),
+                            "detectors": detectors})
+        real = []
+        for filepath in recordings:
+            times, voltages = heartRateMonitor.preprocess_file(filepath)
+            real.append(dict(compare_detectors(times, voltages),
+                             file=filepath, num_samples=int(times.size)))
+    finally:
+        shutil.rmtree(workdir)
+    import_seconds, heavy_modules = measure_import_time()
+    report = {"import_seconds": import_seconds,
+              "import_heavy_modules": heavy_modules,
+              "versions": {"python": platform.python_version(),
+                           "numpy": numpy.__version__,
+                           "pandas": pandas.__version__,
+                           "preprocessing": heartRateMonitor
+                           .PREPROCESSING_VERSION},
+              "settings": {"sample_rate": sample_rate, "noise": noise,
+                           "missing_rate": missing_rate,
+                           "spike_rate": spike_rate, "seed": seed},
+              "results": results,
+              "recordings": real}
+    with open(output_filepath, "w") as file:
+        json.dump(report, file, indent=2)
+    return report
+
+
+def compare_benchmarks(baseline_filepath, current_filepath):
+    """ Compares two benchmark result files stage by stage
+
+    :param baseline_filepath: Filepath of the older JSON results
+    :param current_filepath: Filepath of the newer JSON results
+    :returns: List of (size, stage, baseline seconds, current seconds,
+    current / baseline) tuples for every size present in both files
+    """
+    with open(baseline_filepath, "r") as file:
+        baseline = {result["num_samples"]: result
+                    for result in json.load(file)["results"]}
+    with open(current_filepath, "r") as file:
+        current = json.load(file)["results"]
+    rows = []
+    for result in current:
+        if result["num_samples"] not in baseline:
+            continue
+        old_stages = baseline[result["num_samples"]]["stages"]
+        for stage in STAGES + ["total"]:
+            if stage != "total" and stage not in old_stages:
+                # Stages added since the baseline was run
+                continue
+            new = result["total"] if stage == "total" else \
+                result["stages"][stage]
+            old = baseline[result["num_samples"]]["total"] \
+                if stage == "total" else old_stages[stage]
+            rows.append((result["num_samples"], stage, old, new,
+                         new / old if old else numpy.inf))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Recording sizes (in samples) to benchmark")
+    parser.add_argument("--output", default="benchmark.json",
+                        help="Filepath of the JSON results file")
+    parser.add_argument("--sample-rate", type=float, default=360.0,
+                        help="Sampling rate of the synthetic ECG in Hz")
+    parser.add_argument("--noise", type=float, default=0.02,
+                        help="Standard deviation of the noise in mV")
+    parser.add_argument("--missing-rate", type=float, default=0.001,
+                        help="Fraction of missing voltage values")
+    parser.add_argument("--spike-rate", type=float, default=0.0001,
+                        help="Fraction of voltages above 300mV")
+    parser.add_argument("--compare", default=None,
+                        help="Earlier results file to compare against")
+    parser.add_argument("--recordings", nargs="*", default=[],
+                        help="Csv files of real recordings on which to "
+                             "compare beat detection against peakutils")
+    args = parser.parse_args()
+    report = run_benchmarks(args.sizes, args.output, args.sample_rate,
+                            args.noise, args.missing_rate, args.spike_rate,
+                            recordings=args.recordings)
+    print("import heartRateMonitor: {:.4f} s (budget {} s)"
+          .format(report["import_seconds"], IMPORT_TIME_BUDGET))
+    for result in report["results"]:
+        print("{:>11d} samples: {:.3f} s".format(result["num_samples"],
+                                                 result["total"]))
+    for result in ([result["detectors"] for result in report["results"]] +
+                   report["recordings"]):
+        print("beat detection {:.4f} s, {} beats (peakutils {} s, {} beats)"
+              .format(result["native_seconds"], result["native_beats"],
+                      result["peakutils_seconds"],
+                      result["peakutils_beats"]))
+    if args.compare:
+        for size, stage, old, new, ratio in compare_benchmarks(args.compare,
+                                                               args.output):
+            print("{:>11d} {:<18} {:9.4f} -> {:9.4f} s ({:.2f}x)"
+                  .format(size, stage, old, new, ratio))
@@ -0,0 +1,144 @@
+import logging
+import json
+import os
+
+BINARY_EXTENSION = ".bin"
+HEADER_EXTENSION = ".hdr"
+HEADER_DEFAULTS = {"gain": 1.0,
+                   "offset": 0.0,
+                   "dtype": "<i2",
+                   "start_time": 0.0,
+                   "header_bytes": 0}
+
+
+def read_header(filepath):
+    """ Reads the sidecar header that describes a raw binary recording.  The
+    header is a JSON file with the same name as the recording and a .hdr
+    extension, e.g. {"sample_rate": 360, "gain": 200, "offset": 1024,
+    "dtype": "<i2"}.  Voltages (in mV) are (sample - offset) / gain.
+
+    :param filepath: A String representing the path to the binary ECG data
+    :returns: Dictionary with the sample_rate, gain, offset, dtype,
+    start_time and header_bytes of the recording
+    """
+    header_filepath = os.path.splitext(filepath)[0] + HEADER_EXTENSION
+    try:
+        with open(header_filepath, "r") as file:
+            header = json.load(file)
+    except FileNotFoundError:
+        logging.error("Header file not found")
+        raise FileNotFoundError("The header file {} describing the binary "
+                                "recording could not be found."
+                                .format(header_filepath))
+    return check_header(header)
+
+
+def check_header(header):
+    """ Checks that a binary recording's header is usable and fills in the
+    default value of every optional entry
+
+    :param header: Dictionary read from a header file (or request)
+    :returns: The header dictionary, raises ValueError if the sample rate or
+    gain is invalid
+    """
+    if "sample_rate" not in header or not header["sample_rate"] > 0:
+        logging.error("Header has no valid sample rate")
+        raise ValueError("The header must give a positive sample_rate.")
+    if not header.get("gain", 1.0):
+        raise ValueError("The header gain cannot be zero.")
+    for key, value in HEADER_DEFAULTS.items():
+        header.setdefault(key, value)
+    return header
+
+
+def open_binary(filepath):
+    """ Memory-maps the raw samples of a binary recording without reading
+    them from disk
+
+    :param filepath: A String representing the path to the binary ECG data
+    :returns: Read-only memory-mapped array of raw samples, and the
+    recording's header dictionary
+    """
+    import numpy
+    header = read_header(filepath)
+    samples = numpy.memmap(filepath, dtype=numpy.dtype(header["dtype"]),
+                           mode="r", offset=header["header_bytes"])
+    return samples, header
+
+
+def scale_samples(samples, header, start=0):
+    """ Converts raw samples into voltages (in mV) and synthesizes their time
+    axis from the sample rate.  When the samples are already float64 mV
+    (gain 1, offset 0) the voltages are returned as a view, without a copy.
+    Otherwise, e.g. for int16 samples, the voltages are a new float64 array
+    (four times the size of int16 samples).  The times are always a new
+    float64 array, so scaling a whole recording at once holds up to 16 bytes
+    a sample in memory; read_binary_chunks bounds this to one chunk.
+
+    :param samples: Array (or memory-mapped slice) of raw samples
+    :param header: The recording's header dictionary
+    :param start: Index of the first sample within the whole recording
+    :returns: Arrays of time and voltage data
+    """
+    import numpy
+    times = header["start_time"] + numpy.arange(
+        start, start + samples.size) / float(header["sample_rate"])
+    if (samples.dtype == numpy.float64 and header["gain"] == 1 and
+            header["offset"] == 0):
+        return times, samples
+    voltages = numpy.subtract(samples, header["offset"], dtype=float)
+    voltages /= header["gain"]
+    return times, voltages
+
+
+def read_binary(filepath):
+    """ Reads in a raw binary recording, and returns the data in array format.
+    The whole recording is scaled at once (see scale_samples for the memory
+    this takes).
+
+    :param filepath: A String representing the path to the binary ECG data
+    :returns: Numpy arrays containing time and voltage values, respectively
+    """
+    samples, header = open_binary(filepath)
+    return scale_samples(samples, header)
+
+
+def read_binary_chunks(filepath, chunksize):
+    """ Reads in a raw binary recording a fixed number of samples at a time.
+    Each chunk is scaled straight from the memory-mapped file, so only one
+    chunk is ever held in memory.
+
+    :param filepath: A String representing the path to the binary ECG data
+    :param chunksize: Number of samples per chunk
+    :returns: Generator of (time, voltage) numpy array pairs
+    """
+    samples, header = open_binary(filepath)
+    for start in range(0, samples.size, chunksize):
+        yield scale_samples(samples[start:start + chunksize], header, start)
+
+
+def write_binary(filepath, voltages, sample_rate, gain=1.0, offset=0.0,
+                 dtype="<i2", start_time=0.0):
+    """ Writes voltages (in mV) as a raw binary recording plus its sidecar
+    header, e.g. to convert a csv file with uniform sampling
+
+    :param filepath: A String representing the path of the new binary file
+    :param voltages: Array of voltage data
+    :param sample_rate: Sampling rate in Hz
+    :param gain: Raw units per mV
+    :param offset: Raw value corresponding to 0 mV
+    :param dtype: Numpy dtype string of the raw samples
+    :param start_time: Time (in seconds) of the first sample
+    :returns: String representing filepath of the header file
+    """
+    import numpy
+    raw = numpy.asarray(voltages, dtype=float) * gain + offset
+    if numpy.issubdtype(numpy.dtype(dtype), numpy.integer):
+        raw = numpy.round(raw)
+    raw.astype(dtype).tofile(filepath)
+    header_filepath = os.path.splitext(filepath)[0] + HEADER_EXTENSION
+    with open(header_filepath, "w") as file:
+        json.dump({"sample_rate": sample_rate, "gain": gain,
+                   "offset": offset, "dtype": dtype,
+                   "start_time": start_time, "header_bytes": 0}, file)
+    return header_filepath
@@ -0,0 +1,152 @@
+import logging
+import logging.handlers
+import collections
+import contextlib
+import multiprocessing.util
+import os
+import queue
+
+# Number of offending values kept (and logged) as examples of each kind of
+# anomaly
+MAX_EXAMPLES = 3
+
+
+class QualityReport(object):
+    """ Counts the anomalies found while cleaning a recording (missing or
+    non-numeric entries, clipped voltages, dropped rows, bad times), by
+    kind, with the first few offending values of each kind as examples.
+    Nothing is logged until the whole recording has been seen, and then one
+    summary line per kind, rather than one line per sample.
+    """
+
+    def __init__(self):
+        """ Creates an empty report
+        """
+        self.counts = collections.OrderedDict()
+        self.descriptions = {}
+        self.examples = {}
+
+    def add(self, kind, description, count, examples=()):
+        """ Counts anomalies of one kind
+
+        :param kind: String naming the kind of anomaly, e.g. "voltage_missing"
+        :param description: String describing the kind in the log, e.g.
+        "Missing voltage values"
+        :param count: Number of anomalies found
+        :param examples: Iterable of offending values, in the order found
+        (only the first few are kept)
+        :returns: Void
+        """
+        if not count:
+            return
+        self.counts[kind] = self.counts.get(kind, 0) + int(count)
+        self.descriptions.setdefault(kind, description)
+        kept = self.examples.setdefault(kind, [])
+        for example in examples:
+            if len(kept) >= MAX_EXAMPLES:
+                break
+            kept.append(example_value(example))
+
+    def merge(self, other):
+        """ Adds the anomalies of another report, e.g. that of a later part
+        of the same recording cleaned by another worker process
+
+        :param other: QualityReport
+        :returns: This QualityReport
+        """
+        for kind, count in other.counts.items():
+            self.add(kind, other.descriptions[kind], count,
+                     other.examples[kind])
+        return self
+
+    def log(self):
+        """ Logs one warning per kind of anomaly found, with its count and
+        examples
+
+        :returns: Void
+        """
+        for kind, count in self.counts.items():
+            message = "%s: %d" % (self.descriptions[kind], count)
+            if self.examples[kind]:
+                message += " (e.g. %s)" % ", ".join(
+                    repr(example) for example in self.examples[kind])
+            logging.warning(message)
+
+    def to_dict(self):
+        """ Creates the quality section of the metrics dictionary
+
+        :returns: Dictionary with the count and examples of each kind of
+        anomaly found, by kind
+        """
+        return {kind: {"count": self.counts[kind],
+                       "examples": list(self.examples[kind])}
+                for kind in sorted(self.counts)}
+
+
+@contextlib.contextmanager
+def collecting(quality=None):
+    """ Context manager for functions that can add to a caller's report:
+    yields that report, or a new one that is logged when the block ends
+
+    :param quality: QualityReport to add to, or None
+    :returns: Generator yielding a QualityReport
+    """
+    if quality is not None:
+        yield quality
+        return
+    quality = QualityReport()
+    yield quality
+    quality.log()
+
+
+def example_value(value):
+    """ Converts an offending value into a JSON value
+
+    :param value: Float, numpy scalar, string or other entry
+    :returns: Float for numeric values, String otherwise
+    """
+    # Booleans (numpy's included) would otherwise pass for numbers
+    boolean = type(value).__name__ in ("bool", "bool_")
+    if boolean or isinstance(value, (str, bytes)) or not hasattr(
+            value, "__float__"):
+        return str(value)
+    return float(value)
+
+
+def configure_queue_logging(filename, filemode, level, format, datefmt):
+    """ Sets up the root logger to put its records on a queue, which a
+    background thread writes to the log file, so that logging never makes
+    the pipeline wait on the disk.  Like logging.basicConfig, it does
+    nothing if the root logger already has handlers, except for those
+    inherited from the parent of a forked process, which are replaced.
+
+    :param filename: A String representing the path of the log file
+    :param filemode: 'w' to start a fresh log file, 'a' to append to it
+    :param level: Level of the root logger
+    :param format: Format string of the log lines
+    :param datefmt: Format string of their dates
+    :returns: Void
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if getattr(handler, "pid", os.getpid()) != os.getpid():
+            # Its queue is no longer read by any thread of this process
+            root.removeHandler(handler)
+    if root.handlers:
+        return
+    if filemode == 'w':
+        open(filename, 'w').close()
+    # Opened for appending even when fresh, so that the lines of worker
+    # processes writing to the same file are never overwritten
+    file_handler = logging.FileHandler(filename, 'a')
+    file_handler.setFormatter(logging.Formatter(format, datefmt))
+    records = queue.Queue()
+    listener = logging.handlers.QueueListener(records, file_handler)
+    handler = logging.handlers.QueueHandler(records)
+    handler.pid = os.getpid()
+    root.addHandler(handler)
+    root.setLevel(level)
+    listener.start()
+    # Writes out the queued records on exit; unlike atexit, this also runs
+    # in the worker processes of a multiprocessing pool
+    multiprocessing.util.Finalize(listener, listener.stop, exitpriority=0)
@@ -0,0 +1,261 @@
+import math
+
+# Most significant digits of a sample rate.  Rates are tried from the
+# fewest digits up, so that times printed with few decimals still give a
+# round rate
+RATE_DIGITS = 9
+# Most decimals looked for in printed times, and the number of times looked
+# at to find how many were printed
+MAX_DECIMALS = 15
+PRECISION_SAMPLES = 1000
+
+
+class ECGRecord(object):
+    """ Time and voltage data of one recording, held in contiguous numpy
+    arrays.  Voltages may be stored as float32 to halve their size, and when
+    the samples are evenly spaced the time axis is not stored at all but
+    synthesized from the sample rate whenever it is needed (rounded to the
+    decimals the times were printed with, so that it gives exactly the
+    times that were read).  Slicing a
+    record returns a new record that shares its data (only a strided slice
+    of an implicit time axis needs a time array of its own).
+    """
+    __slots__ = ("voltages", "_times", "sample_rate", "start_time", "first",
+                 "decimals")
+
+    def __init__(self, times, voltages, sample_rate=None, start_time=0.0,
+                 dtype="float64", first=0, decimals=None):
+        """ Creates the record
+
+        :param times: Array of time data, or None if the time axis is
+        implicit (then sample_rate is required)
+        :param voltages: Array of voltage data (samples, or samples x leads)
+        :param sample_rate: Sample rate (in Hz) of an implicit time axis
+        :param start_time: Time (in seconds) of sample 0 of an implicit time
+        axis
+        :param dtype: Storage type of the voltages, "float64" or "float32"
+        :param first: Index of the first sample on an implicit time axis, so
+        that slices synthesize exactly the times of the whole record
+        :param decimals: Number of decimals that the times of an implicit
+        time axis are rounded to, or None to leave them unrounded
+        """
+        import numpy
+        self.voltages = numpy.ascontiguousarray(voltages, dtype=dtype)
+        if times is None:
+            if sample_rate is None or not sample_rate > 0:
+                raise ValueError("An implicit time axis needs a positive "
+                                 "sample rate")
+            self._times = None
+            self.sample_rate = float(sample_rate)
+        else:
+            self._times = numpy.ascontiguousarray(times, dtype=float)
+            if self._times.shape != self.voltages.shape[:1]:
+                raise ValueError("Expected {} times, got {}".format(
+                    len(self.voltages), self._times.size))
+            self.sample_rate = None
+        self.start_time = float(start_time)
+        self.first = int(first)
+        self.decimals = decimals
+
+    @classmethod
+    def from_arrays(cls, times, voltages, dtype="float64"):
+        """ Creates a record from time and voltage arrays, dropping the time
+        array if a fixed sample rate reproduces it (see uniform_sample_rate)
+
+        :param times: Array of time data
+        :param voltages: Array of voltage data
+        :param dtype: Storage type of the voltages, "float64" or "float32"
+        :return: ECGRecord
+        """
+        import numpy
+        times = numpy.asarray(times, dtype=float)
+        decimals = time_decimals(times)
+        sample_rate = uniform_sample_rate(times, decimals)
+        if sample_rate is None:
+            return cls(times, voltages, dtype=dtype)
+        return cls(None, voltages, sample_rate, times[0], dtype,
+                   decimals=decimals)
+
+    @property
+    def times(self):
+        """ Numpy array of time data, synthesized if it is implicit
+        """
+        import numpy
+        if self._times is not None:
+            return self._times
+        return self.times_at(numpy.arange(len(self)))
+
+    def times_at(self, indices):
+        """ Finds the times of some samples without synthesizing the whole
+        of an implicit time axis
+
+        :param indices: Array of sample indices
+        :return: Numpy array of times (floats)
+        """
+        import numpy
+        if self._times is not None:
+            return self._times[indices]
+        times = self.start_time + (self.first + numpy.asarray(
+            indices)) / self.sample_rate
+        if self.decimals is not None:
+            times = numpy.round(times, self.decimals)
+        return times
+
+    @property
+    def uniform(self):
+        """ True if the time axis is implicit
+        """
+        return self._times is None
+
+    @property
+    def nbytes(self):
+        """ Number of bytes held by the voltage (and time) arrays
+        """
+        return self.voltages.nbytes + (0 if self._times is None
+                                       else self._times.nbytes)
+
+    def __len__(self):
+        return len(self.voltages)
+
+    def __getitem__(self, key):
+        """ Slices the record along its samples without copying any data
+
+        :param key: Slice of sample indices
+        :return: ECGRecord sharing this record's arrays
+        """
+        if not isinstance(key, slice):
+            raise TypeError("ECGRecord indices must be slices")
+        start, stop, step = key.indices(len(self))
+        part = ECGRecord.__new__(ECGRecord)
+        part.voltages = self.voltages[key]
+        part.sample_rate = self.sample_rate
+        part.start_time = self.start_time
+        part.first = self.first
+        part.decimals = self.decimals
+        if self._times is not None:
+            part._times = self._times[key]
+        elif step != 1:
+            part._times = self.times[key]
+            part.sample_rate = None
+        else:
+            part._times = None
+            part.first += start
+        return part
+
+    def time_at(self, index):
+        """ Finds the time of one sample without synthesizing an implicit
+        time axis
+
+        :param index: Int index of the sample (negative counts from the end)
+        :return: Float time (in seconds)
+        """
+        if index < 0:
+            index += len(self)
+        if self._times is not None:
+            return float(self._times[index])
+        return float(self.times_at(index))
+
+    def search(self, time, side="left"):
+        """ Finds where a time falls among the samples, like
+        numpy.searchsorted, without synthesizing an implicit time axis
+
+        :param time: Float time (in seconds)
+        :param side: "left" or "right", as for numpy.searchsorted
+        :return: Int index of the first sample at (side "left") or after
+        (side "right") the time
+        """
+        import numpy
+        if self._times is not None:
+            return int(numpy.searchsorted(self._times, time, side=side))
+        at = self.time_at
+        index = math.ceil((time - self.start_time) * self.sample_rate -
+                          self.first)
+        index = min(max(index, 0), len(self))
+        # The estimate can be one sample off after rounding
+        if side == "left":
+            while index > 0 and at(index - 1) >= time:
+                index -= 1
+            while index < len(self) and at(index) < time:
+                index += 1
+        else:
+            while index > 0 and at(index - 1) > time:
+                index -= 1
+            while index < len(self) and at(index) <= time:
+                index += 1
+        return index
+
+    def time_slice(self, start_time=None, end_time=None):
+        """ Slices the record to the samples within [start_time, end_time]
+        by binary search, without copying any data
+
+        :param start_time: Earliest time to keep (None for no lower bound)
+        :param end_time: Latest time to keep (None for no upper bound)
+        :return: ECGRecord sharing this record's arrays
+        """
+        begin = 0 if start_time is None else self.search(start_time, "left")
+        stop = (len(self) if end_time is None
+                else self.search(end_time, "right"))
+        return self[begin:max(begin, stop)]
+
+
+def uniform_sample_rate(times, decimals=None):
+    """ Finds the sample rate of evenly spaced times.  The times may have
+    been rounded when they were printed, so a rate is accepted if the time
+    axis it implies, rounded to the same decimals, gives every time; it is
+    then within half a unit in the last printed digit of every time.  Of
+    the rates accepted, the one with the fewest significant digits is
+    taken, e.g. exactly 360 Hz for times printed to 3 decimals.
+
+    :param times: Array of time data
+    :param decimals: Number of decimals the times were printed with.  If
+    None, it is found with time_decimals
+    :return: Float sample rate (in Hz), or None if the times are not evenly
+    spaced (or there are fewer than two)
+    """
+    import numpy
+    times = numpy.asarray(times, dtype=float)
+    if times.size < 2 or not times[-1] > times[0]:
+        return None
+    estimate = (times.size - 1) / (times[-1] - times[0])
+    if not math.isfinite(estimate):
+        return None
+    if decimals is None:
+        decimals = time_decimals(times)
+    # Times computed rather than printed may be a rounding error off
+    noise = 4 * float(numpy.spacing(numpy.abs(times).max()))
+    ends = numpy.array([0, times.size - 1])
+    magnitude = int(math.floor(math.log10(estimate)))
+    for digits in range(1, RATE_DIGITS + 1):
+        sample_rate = round(estimate, digits - 1 - magnitude)
+        if not sample_rate > 0:
+            continue
+        record = ECGRecord(None, numpy.empty((times.size, 0)), sample_rate,
+                           times[0], decimals=decimals)
+        # The last time is the furthest from the first, so most rates are
+        # ruled out without synthesizing the whole axis
+        if (numpy.abs(record.times_at(ends) - times[ends]).max() <= noise
+                and numpy.abs(record.times - times).max() <= noise):
+            return sample_rate
+    return None
+
+
+def time_decimals(times):
+    """ Finds the number of decimals that times were printed with: the
+    fewest that rounding the times to gives them back exactly
+
+    :param times: Array of time data
+    :return: Int number of decimals, or None if the times were not rounded
+    to at most MAX_DECIMALS (or there are none)
+    """
+    import numpy
+    times = numpy.asarray(times, dtype=float)
+    if times.size == 0 or not numpy.isfinite(times).all():
+        return None
+    # A few times give the candidate, which all of them must then fit
+    head = times[:PRECISION_SAMPLES]
+    for decimals in range(MAX_DECIMALS + 1):
+        if numpy.array_equal(numpy.round(head, decimals), head):
+            if numpy.array_equal(numpy.round(times, decimals), times):
+                return decimals
+            return None
+    return None
@@ -1,42 +1,537 @@
-import pandas
 import logging
-import peakutils
-import numpy
 # from matplotlib import pyplot
 import json
+import math
+import os
+import csv
+import io
 import argparse
+import collections
+import cProfile
+import itertools
+import shutil
+import tempfile
+import recordingCache
+import binaryRecording
+import ecgRecord
+import timeIndex
+import bandpassFilter
+import resultCache
+import partialMetrics
+import dataQuality
+from stageTimer import StageTimer
 
+# Bump whenever a change to the preprocessing functions would alter the
+# cleaned data, so that cached recordings made by older code are not reused
+PREPROCESSING_VERSION = "2"
+# Bump whenever a change to beat detection or to the metrics would alter
+# the results, so that cached results made by older code are not reused
+ANALYSIS_VERSION = "5"
+# Csv files smaller than this are parsed without importing pandas, whose
+# import takes longer than reading a short strip
+SMALL_FILE_BYTES = 64 * 1024
+# Shortest time (in seconds) between two beats, i.e. a rate of 300 bpm.  Of
+# several peaks closer together than this, only the tallest is a beat
+REFRACTORY_PERIOD = 0.2
+# Longest run of missing or non-numeric samples that is filled in by
+# interpolation.  Longer runs are gaps: they are dropped, and beats on their
+# edges are discarded
+MAX_GAP = 5
+# Number of array entries converted to text at a time when writing output,
+# so that long beat lists are never boxed into one huge Python list
+OUTPUT_CHUNK = 64 * 1024
+# Number of samples of an ECGRecord converted to float64 at a time by the
+# passes over it, so that float32 storage and implicit time axes last
+# through the analysis
+RECORD_CHUNK = 256 * 1024
+# Beat times are written inline in the JSON file, or to a .npy sidecar file
+# that the JSON file references
+BEATS_FORMATS = ("json", "npy")
+# Windowed metrics are written as one JSON object of lists, or as NDJSON
+# with one object per window
+WINDOWS_FORMATS = ("json", "ndjson")
+# Ways of handling time data that is negative, out of order or duplicated
+# (see check_time_data)
+TIME_REPAIRS = ("sort", "dedupe", "reject")
+# Directory backed by memory, through which the worker processes of a
+# parallel analysis exchange arrays (the default temporary directory is
+# used where it does not exist)
+SHARED_DIR = "/dev/shm"
 
-def main(filepath, endtime):
+
+def main(filepath, endtime, chunksize=None, cache_dir=None, timing=False,
+         profile_filepath=None, window=None, step=None, start=None,
+         index_every=None, beats_format="json", windows_format="json",
+         dtype="float64", time_repair="sort", max_gap=MAX_GAP, band=None,
+         result_cache_dir=None, workers=None):
     """ Driver function that runs the program
 
     :param filepath: A String representing the path to the ECG data
     :param endtime: Time (in seconds) at which the data should end
+    :param chunksize: Number of csv rows to hold in memory at once.  If None,
+    the whole file is read in at once
+    :param cache_dir: Directory of cached preprocessed recordings.  If None,
+    no cache is used
+    :param timing: True to write a per-stage timing report next to the
+    metrics JSON file
+    :param profile_filepath: Filepath to dump cProfile statistics to.  If
+    None, the run is not profiled
+    :param window: Length (in seconds) of the windows of a windowed heart
+    rate time series.  If None, only the summary is written
+    :param step: Time (in seconds) between the starts of consecutive windows
+    (defaults to the window length)
+    :param start: Time (in seconds) at which the data should start.  If
+    None, the data starts at the beginning of the recording
+    :param index_every: Number of rows between two entries of a new sparse
+    time index.  If None, timeIndex.DEFAULT_EVERY is used
+    :param beats_format: "json" to write the beat times into the metrics
+    JSON file, or "npy" to write them to a .npy sidecar file
+    :param windows_format: "json" or "ndjson" (one line per window) for the
+    windowed metrics file
+    :param dtype: Storage type of the voltages held in memory for analysis,
+    "float64" or "float32"
+    :param time_repair: How to handle negative, out of order or duplicate
+    times: "sort", "dedupe" or "reject" (see check_time_data)
+    :param max_gap: Longest run of missing or non-numeric samples to fill in
+    by interpolation; longer runs are dropped and excluded from beat
+    detection
+    :param band: (low, high) cutoff frequencies (in Hz) of a band-pass
+    filter applied before beat detection.  If None, nothing is filtered
+    :param result_cache_dir: Directory of cached analysis results.  If None,
+    no result cache is used
+    :param workers: Number of worker processes to split the cleaning and
+    beat detection of the recording across.  If None, the recording is
+    analyzed in this process
     :returns: Void
     """
-    logging.basicConfig(filename="log.txt",
-                        filemode='w',
-                        level=logging.DEBUG,
-                        format='%(asctime)s %(message)s',
-                        datefmt='%m/%d/%Y %I:%M:%S %p')
+    configure_logging()
     logging.info("Started")
-    check_file_existence(filepath)
-    check_extension(filepath)
-    time, voltage = extract_file(filepath)
-    logging.info("Csv file successfully read and extracted")
-    time, interp_time_inds = convert_to_floats(time)
-    voltage, interp_voltage_inds = convert_to_floats(voltage)
-    time, voltage = interpolate(time, voltage, interp_time_inds,
-                                interp_voltage_inds)
-    voltage = voltage_clip(voltage)
-    time, voltage = user_specify_time(time, voltage, endtime)
-    metrics = metrics_to_dict(time, voltage)
-    dict_to_json(metrics)
+    timer = StageTimer(enabled=timing)
+    profiler = None
+    if profile_filepath is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    result_cache = None
+    if result_cache_dir is not None:
+        result_cache = resultCache.ResultCache(result_cache_dir)
+    analyze_file(filepath, endtime, chunksize=chunksize, cache_dir=cache_dir,
+                 timer=timer, window=window, step=step, start=start,
+                 index_every=index_every, beats_format=beats_format,
+                 windows_format=windows_format, dtype=dtype,
+                 time_repair=time_repair, max_gap=max_gap, band=band,
+                 result_cache=result_cache, workers=workers)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_filepath)
+        logging.info("Profile written: %s" % profile_filepath)
+    if timing:
+        timer.to_json(filepath)
     # pyplot.plot(time, voltage)
     # pyplot.show()
     logging.info("Finished")
 
 
+def configure_logging(filemode='w'):
+    """ Sets up the log file that the program writes its messages to.  The
+    messages are queued and written by a background thread (see
+    dataQuality.configure_queue_logging).
+
+    :param filemode: 'w' to start a fresh log.txt, 'a' to append to it
+    :returns: Void
+    """
+    dataQuality.configure_queue_logging(filename="log.txt",
+                                        filemode=filemode,
+                                        level=logging.DEBUG,
+                                        format='%(asctime)s %(message)s',
+                                        datefmt='%m/%d/%Y %I:%M:%S %p')
+
+
+def analyze_file(filepath, endtime, chunksize=None, cache_dir=None,
+                 timer=None, window=None, step=None, start=None,
+                 index_every=None, beats_format="json",
+                 windows_format="json", dtype="float64",
+                 time_repair="sort", max_gap=MAX_GAP, band=None,
+                 result_cache=None, workers=None):
+    """ Runs the full pipeline on one data file and writes its metrics to JSON
+
+    :param filepath: A String representing the path to the ECG data
+    :param endtime: Time (in seconds) at which the data should end
+    :param chunksize: Number of csv rows to hold in memory at once.  If None,
+    the whole file is read in at once
+    :param cache_dir: Directory of cached preprocessed recordings.  If None,
+    no cache is used
+    :param timer: StageTimer that records each stage.  If None, nothing is
+    recorded
+    :param window: Length (in seconds) of the windows of a windowed heart
+    rate time series, written next to the summary.  If None, only the
+    summary is written
+    :param step: Time (in seconds) between the starts of consecutive windows
+    (defaults to the window length)
+    :param start: Time (in seconds) at which the data should start.  If
+    given, chunksize is ignored, and for a csv file that is not cached only
+    the rows around [start, endtime] are read, through a sparse time index
+    of the file
+    :param index_every: Number of rows between two entries of a new sparse
+    time index.  If None, timeIndex.DEFAULT_EVERY is used
+    :param beats_format: "json" to write the beat times into the metrics
+    JSON file, or "npy" to write them to a .npy sidecar file
+    :param windows_format: "json" or "ndjson" (one line per window) for the
+    windowed metrics file
+    :param dtype: Storage type of the voltages held in memory for analysis,
+    "float64" or "float32" (half the memory, with voltages rounded to about
+    seven significant digits).  Evenly spaced times are not held at all
+    :param time_repair: How to handle negative, out of order or duplicate
+    times: "sort", "dedupe" or "reject" (see check_time_data).  Streamed
+    files are not checked
+    :param max_gap: Longest run of missing or non-numeric samples to fill in
+    by interpolation; longer runs are dropped and excluded from beat
+    detection
+    :param band: (low, high) cutoff frequencies (in Hz) of a band-pass
+    filter that removes baseline wander and noise before beat detection:
+    zero-phase for data held in memory, causal (with beat times delayed by
+    its group delay) for streamed files.  The voltage extremes are still
+    those of the unfiltered data.  If None, nothing is filtered
+    :param result_cache: resultCache.ResultCache to answer the query from,
+    keyed by the file's contents and the analysis parameters, and to store
+    the new result in.  A cached analysis also answers queries for a prefix
+    of its range (see cached_metrics).  Runs with windowed metrics bypass
+    it.  If None, no result cache is used
+    :param workers: Number of worker processes.  If more than one, a csv
+    file that is read in whole is cleaned in overlapping segments in
+    parallel (see parallel_preprocess_file), and beats are detected in
+    parallel (see parallel_beat_indices), with the same results as in one
+    process.  Ignored for streamed files
+    :returns: String representing filepath of new JSON file
+    """
+    if timer is None:
+        timer = StageTimer(enabled=False)
+    check_file_existence(filepath)
+    check_extension(filepath)
+    names, _ = read_lead_names(filepath)
+    if len(names) > 1 and (chunksize or window is not None or
+                           (workers or 1) > 1):
+        raise ValueError("Streaming, windowed metrics and parallel analysis "
+                         "only support single-lead recordings")
+    parallel = (workers or 1) > 1
+    windows = None if window is None else WindowedMetrics(window, step)
+    version = "{}.{}".format(PREPROCESSING_VERSION, ANALYSIS_VERSION)
+    metrics = None
+    previous = None
+    if result_cache is not None and windows is None:
+        with timer.stage("load_result"):
+            previous = result_cache.get(result_cache.key(
+                filepath, version, result_params(
+                    start, max_gap, band, time_repair, dtype,
+                    chunksize and start is None)))
+            metrics = cached_metrics(previous, endtime, start)
+    cached = None
+    if metrics is None and cache_dir is not None:
+        with timer.stage("load_cache") as record:
+            key = recordingCache.cache_key(filepath, "{}-{}".format(
+                PREPROCESSING_VERSION, max_gap))
+            cached = recordingCache.load_recording(cache_dir, key)
+            record["rows"] = 0 if cached is None else cached[0].size
+    seek = cached is None and start is not None and not is_binary(filepath)
+    # Anomalies found while cleaning the recording, unless it was cleaned
+    # by an earlier run
+    quality = dataQuality.QualityReport() if cached is None else None
+    if metrics is not None:
+        logging.info("Metrics taken from the result cache")
+    elif cached is None and chunksize and start is None:
+        with timer.stage("stream_metrics_to_dict"):
+            metrics = stream_metrics_to_dict(filepath, endtime, chunksize,
+                                             windows, max_gap, band, quality)
+        logging.info("Csv file streamed in chunks of %d rows" % chunksize)
+        add_quality(metrics, quality)
+    else:
+        if seek:
+            with timer.stage("extract_window") as record:
+                time, voltage = extract_window(filepath, start, endtime,
+                                               index_every, max_gap)
+                record["rows"] = time.size
+            time, voltage = preprocess(time, voltage, timer, max_gap,
+                                       quality)
+        elif cached is None:
+            if parallel and not is_binary(filepath) and (
+                    os.path.getsize(filepath) >= SMALL_FILE_BYTES):
+                with timer.stage("parallel_preprocess_file") as record:
+                    time, voltage = parallel_preprocess_file(
+                        filepath, workers, max_gap, quality)
+                    record["rows"] = time.size
+            else:
+                time, voltage = preprocess_file(filepath, timer, max_gap,
+                                                quality)
+            if cache_dir is not None:
+                with timer.stage("store_cache", time.size):
+                    recordingCache.store_recording(cache_dir, key, time,
+                                                   voltage)
+        else:
+            time, voltage = cached
+        with timer.stage("check_time_data", time.size):
+            time, voltage, report = check_time_data(time, voltage,
+                                                    time_repair, quality)
+        record = checked_record(time, voltage, report, dtype)
+        del time, voltage
+        full = record
+        with timer.stage("user_specify_time", len(record)):
+            record = user_specify_time(record, None, endtime, start)
+        with timer.stage("metrics_to_dict", len(record)):
+            if parallel:
+                metrics = parallel_metrics_to_dict(record, workers=workers,
+                                                   max_gap=max_gap, band=band)
+            else:
+                metrics = metrics_to_dict(
+                    record, names=names if len(names) > 1 else None,
+                    max_gap=max_gap, band=band)
+        add_quality(metrics, quality)
+        if windows is not None:
+            with timer.stage("windowed_metrics", len(record)):
+                windows.update(record)
+        elif result_cache is not None:
+            with timer.stage("store_result", len(record)):
+                entry = result_entry(full, record, metrics, band is None)
+                # Keep the entry that covers the longer range
+                if previous is None or (previous["stop_time"] <=
+                                        entry["stop_time"]):
+                    result_cache.put(result_cache.key(
+                        filepath, version, result_params(
+                            start, max_gap, band, time_repair, dtype)),
+                        entry)
+    if windows is not None:
+        with timer.stage("windows_to_json"):
+            windows_to_json(windows.to_dict(metrics["beats"]), filepath,
+                            windows_format)
+    with timer.stage("dict_to_json", metrics.get("num_beats")):
+        return dict_to_json(metrics, filepath, beats_format)
+
+
+def add_quality(metrics, quality):
+    """ Logs the anomalies found while cleaning a recording, and adds them
+    to its metrics as a "quality" section
+
+    :param metrics: Dictionary of metrics
+    :param quality: dataQuality.QualityReport, or None if the recording was
+    not cleaned in this run (the metrics then get no quality section)
+    :returns: Void
+    """
+    if quality is None:
+        return
+    quality.log()
+    metrics["quality"] = quality.to_dict()
+
+
+def preprocess_file(filepath, timer=None, max_gap=MAX_GAP, quality=None):
+    """ Reads in a data file and runs every preprocessing step on it
+
+    :param filepath: A String representing the path to the ECG data
+    :param timer: StageTimer that records each stage.  If None, nothing is
+    recorded
+    :param max_gap: Longest run of invalid samples to fill in
+    :param quality: dataQuality.QualityReport to count the anomalies found
+    in.  If None, they are counted in a report of their own, which is
+    logged
+    :returns: Arrays of cleaned time and voltage data
+    """
+    if timer is None:
+        timer = StageTimer(enabled=False)
+    with timer.stage("extract_file") as record:
+        time, voltage = extract_file(filepath)
+        record["rows"] = time.size
+    logging.info("Csv file successfully read and extracted")
+    return preprocess(time, voltage, timer, max_gap, quality)
+
+
+def preprocess(time, voltage=None, timer=None, max_gap=MAX_GAP,
+               quality=None):
+    """ Runs every preprocessing step on raw time and voltage data
+
+    :param time: Array-like of raw time data, or an ECGRecord holding both
+    the time and voltage data (voltage is then omitted)
+    :param voltage: Array-like of raw voltage data
+    :param timer: StageTimer that records each stage.  If None, nothing is
+    recorded
+    :param max_gap: Longest run of invalid samples to fill in
+    :param quality: dataQuality.QualityReport to count the anomalies found
+    in.  If None, they are counted in a report of their own, which is
+    logged once every step has run
+    :returns: Arrays of cleaned time and voltage data, or an ECGRecord of
+    them (with the same voltage storage type) if given one
+    """
+    if timer is None:
+        timer = StageTimer(enabled=False)
+    time, voltage, record = record_arrays(time, voltage)
+    if record is not None:
+        return record_like(record, *preprocess(time, voltage, timer,
+                                               max_gap, quality))
+    with dataQuality.collecting(quality) as quality:
+        with timer.stage("convert_to_floats", len(time)):
+            time, interp_time_inds = convert_to_floats(time, quality, "time")
+            voltage, interp_voltage_inds = convert_to_floats(
+                voltage, quality, "voltage")
+        with timer.stage("interpolate", time.size):
+            time, voltage = interpolate(time, voltage, interp_time_inds,
+                                        interp_voltage_inds, max_gap,
+                                        quality)
+        with timer.stage("voltage_clip", time.size):
+            voltage = voltage_clip(voltage, quality)
+    return time, voltage
+
+
+def result_params(start=None, max_gap=MAX_GAP, band=None,
+                  time_repair="sort", dtype="float64", causal=False):
+    """ Collects the analysis parameters that a cached result depends on
+    (the end time is not among them: shorter ranges are answered from
+    longer ones, see cached_metrics)
+
+    :param start: Time (in seconds) at which the data starts, or None
+    :param max_gap: Longest run of invalid samples to fill in
+    :param band: (low, high) band-pass cutoff frequencies in Hz, or None
+    :param time_repair: How bad time data is handled
+    :param dtype: Storage type of the voltages
+    :param causal: True if the band-pass filter is the causal one of
+    streamed files
+    :return: Dictionary of JSON values
+    """
+    return {"start": start, "max_gap": max_gap,
+            "band": None if band is None else list(band),
+            "time_repair": time_repair, "dtype": dtype,
+            "threshold": 0.80, "refractory": REFRACTORY_PERIOD,
+            "causal": bool(band is not None and causal)}
+
+
+def result_entry(full, record, metrics, prefixes=True):
+    """ Builds the result cache entry of an analysis.  Besides the metrics,
+    it holds what is needed to answer a query for a shorter range from them
+    (see cached_metrics): the time axis of the range (implicit if the
+    samples are evenly spaced) and, for each lead, the runs of samples above
+    the peak threshold and the time by which the voltage extremes are
+    reached.
+
+    :param full: ECGRecord of the whole cleaned recording
+    :param record: ECGRecord of the analyzed range (a slice of full)
+    :param metrics: Metrics dictionary of the analyzed range
+    :param prefixes: False if shorter ranges cannot be answered from this
+    one (because the voltages were filtered before beat detection)
+    :return: Dictionary entry for a resultCache.ResultCache
+    """
+    import numpy
+    begin = full.search(record.time_at(0))
+    stop = begin + len(record)
+    entry = {"metrics": metrics,
+             "max_time": full.time_at(-1),
+             "previous_time": full.time_at(begin - 1) if begin else -math.inf,
+             "first_time": record.time_at(0),
+             "stop_time": record.time_at(-1),
+             "next_time": full.time_at(stop) if stop < len(full)
+             else math.inf,
+             "axis": None,
+             "leads": None}
+    if not prefixes:
+        return entry
+    if record.uniform:
+        entry["axis"] = {"start_time": record.start_time,
+                         "sample_rate": record.sample_rate,
+                         "first": record.first, "count": len(record),
+                         "decimals": record.decimals}
+    else:
+        entry["axis"] = {"times": record.times}
+    times = record.times
+    voltages = numpy.asarray(record.voltages, dtype=float)
+    if voltages.ndim == 1:
+        leads = [(metrics, voltages)]
+    else:
+        leads = zip(metrics["leads"].values(), voltages.T)
+    entry["leads"] = []
+    for lead_metrics, lead_voltages in leads:
+        min_voltage, max_voltage = lead_metrics["voltage_extremes"]
+        hot = lead_voltages > 0.80 * (max_voltage - min_voltage) + min_voltage
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(
+            ([0], hot.view(numpy.int8), [0]))))
+        closes = numpy.append(times, math.inf)[edges[1::2]]
+        entry["leads"].append({
+            "extremes_time": float(max(times[numpy.argmin(lead_voltages)],
+                                       times[numpy.argmax(lead_voltages)])),
+            "hot_runs": numpy.column_stack((times[edges[::2]], closes))})
+    return entry
+
+
+def cached_metrics(entry, end_time, start_time=None):
+    """ Answers a query from a result cache entry.  A query for the same
+    range returns the cached metrics.  A query for a prefix of the range is
+    answered by truncating the cached beats, when that is known to give
+    exactly the beats a new analysis would find: the prefix must reach the
+    voltage extremes of the range (so the peak threshold is the same), and
+    no run of samples above the threshold may lie within one refractory
+    period of its end (so no beat near the end could have been chosen
+    differently).
+
+    :param entry: Dictionary entry from result_entry, or None
+    :param end_time: Time (in seconds) at which the data should end
+    :param start_time: Time (in seconds) at which the data should start, or
+    None
+    :return: Metrics dictionary, or None if the query cannot be answered
+    from the entry
+    """
+    import numpy
+    if entry is None:
+        return None
+    start_time, end_time = check_time_window(start_time, end_time,
+                                             entry["max_time"])
+    if start_time is None:
+        same_start = entry["previous_time"] == -math.inf
+    else:
+        same_start = (entry["previous_time"] < start_time <=
+                      entry["first_time"])
+    if not same_start:
+        return None
+    end = math.inf if end_time is None else end_time
+    if end >= entry["stop_time"] and (end < entry["next_time"] or
+                                      entry["next_time"] == math.inf):
+        return entry["metrics"]
+    if end >= entry["stop_time"] or entry["axis"] is None:
+        return None
+    axis = entry["axis"]
+    # A record without voltages, to look samples up on the time axis
+    if "times" in axis:
+        axis = ecgRecord.ECGRecord(axis["times"],
+                                   numpy.empty((len(axis["times"]), 0)))
+    else:
+        axis = ecgRecord.ECGRecord(None, numpy.empty((axis["count"], 0)),
+                                   axis["sample_rate"], axis["start_time"],
+                                   first=axis["first"],
+                                   decimals=axis["decimals"])
+    count = axis.search(end, "right")
+    if count < 2:
+        return None
+    for lead in entry["leads"]:
+        runs = numpy.asarray(lead["hot_runs"]).reshape(-1, 2)
+        if lead["extremes_time"] > end or (
+                (runs[:, 0] <= end + REFRACTORY_PERIOD) &
+                (runs[:, 1] > end - REFRACTORY_PERIOD)).any():
+            return None
+    time_range = (axis.time_at(0), axis.time_at(count - 1))
+
+    def truncated(metrics):
+        beats = metrics["beats"][:numpy.searchsorted(metrics["beats"], end,
+                                                     side="right")]
+        return partialMetrics.PartialMetrics(
+            time_range, metrics["voltage_extremes"], beats).to_dict()
+
+    logging.info("Metrics answered from a cached analysis up to %f s"
+                 % entry["stop_time"])
+    metrics = entry["metrics"]
+    if "leads" not in metrics:
+        answer = truncated(metrics)
+    else:
+        answer = {"num_leads": metrics["num_leads"],
+                  "leads": {name: truncated(lead)
+                            for name, lead in metrics["leads"].items()}}
+    # The quality of the recording does not depend on the range analyzed
+    if "quality" in metrics:
+        answer["quality"] = metrics["quality"]
+    return answer
+
+
 # FILE I/O FUNCTIONS
 def check_file_existence(filepath):
     """ Checks to see if a file exists in the filepath
@@ -46,7 +541,8 @@ def check_file_existence(filepath):
     terminate program
     """
     try:
-        open(filepath, 'r')
+        with open(filepath, 'r'):
+            pass
     except FileNotFoundError:
         logging.error("Csv file not found")
         raise FileNotFoundError("The inputted csv file could not be found.  "
@@ -54,259 +550,2312 @@ def check_file_existence(filepath):
 
 
 def check_extension(filepath):
-    """ Checks to see if a file has .csv as its extension
-    (and by extension, that a string has been passed in for the filepath)
+    """ Checks to see if a file has .csv (or .bin, for raw binary recordings)
+    as its extension (and by extension, that a string has been passed in for
+    the filepath)
 
     :param filepath: A String representing the path to the ECG data
-    :returns: Void if file is of type csv, raises TypeError otherwise
+    :returns: Void if file is of type csv or bin, raises TypeError otherwise
     (including for non-string datatypes)
     """
     length = len(filepath)
     extension = filepath.lower()[length-4:length]
-    if not extension == ".csv":
+    if extension not in (".csv", binaryRecording.BINARY_EXTENSION):
         logging.error("File not csv")
-        raise TypeError("The inputted file is not a csv.")
+        raise TypeError("The inputted file is not a csv or bin file.")
+
+
+def is_binary(filepath):
+    """ Checks whether a file is a raw binary recording rather than a csv
+
+    :param filepath: A String representing the path to the ECG data
+    :returns: True if the file has the .bin extension, False otherwise
+    """
+    return filepath.lower().endswith(binaryRecording.BINARY_EXTENSION)
 
 
 def extract_file(filepath):
-    """ Reads in a csv file containing time and voltage data, and returns the
-    data in list format
+    """ Reads in a csv file (or a memory-mapped raw binary recording)
+    containing time and voltage data, and returns the data in array format
+
+    :param filepath: A String representing the path to the ECG data
+    :returns: Numpy arrays containing time and voltage values, respectively
+    (float64 when every entry is numeric)
+    """
+    if is_binary(filepath):
+        return binaryRecording.read_binary(filepath)
+    with open(filepath, "r", newline="") as file:
+        return extract_csv(file, os.path.getsize(filepath))
+
+
+def extract_csv(file, size):
+    """ Reads in csv time and voltage data, with its leads found from the
+    first row (see csv_lead_names)
+
+    :param file: Seekable text file-like object of csv data, opened with
+    newline=""
+    :param size: Size of the data in bytes; data smaller than
+    SMALL_FILE_BYTES is parsed without pandas
+    :returns: Numpy arrays containing time and voltage values, respectively
+    (float64 when every entry is numeric); the voltages are (samples x
+    leads) if there are several leads
+    """
+    names, header = csv_lead_names(file)
+    file.seek(0)
+    if size < SMALL_FILE_BYTES:
+        return parse_csv_rows(file, len(names), header)
+    return read_csv_dataframe(file, len(names), header)
+
+
+def read_lead_names(filepath):
+    """ Finds the leads of a data file from the first row of a csv file.  A
+    csv file with more than one voltage column holds one lead per column,
+    and may start with a header row naming the columns.
+
+    :param filepath: A String representing the path to the ECG data
+    :returns: List of lead names (one per voltage column), and True if the
+    first row is a header row rather than data
+    """
+    if is_binary(filepath):
+        return ["voltage"], False
+    with open(filepath, "r", newline="") as file:
+        return csv_lead_names(file)
+
+
+def csv_lead_names(lines):
+    """ Finds the leads of csv data from its first row (see read_lead_names)
+
+    :param lines: Iterable of csv lines (e.g. an open text file)
+    :returns: List of lead names (one per voltage column), and True if the
+    first row is a header row rather than data
+    """
+    row = []
+    for row in csv.reader(lines):
+        if row:
+            break
+    if len(row) <= 2:
+        return ["voltage"], False
+    if all(math.isnan(parse_float(field)) for field in row):
+        return [field.strip() for field in row[1:]], True
+    return ["lead_{}".format(lead) for lead in range(1, len(row))], False
+
+
+def read_small_csv(filepath, num_leads=1, header=False):
+    """ Reads in a small csv file containing time and voltage data with the
+    standard library csv module.  Entries that are not numbers are returned
+    as NaN.
 
     :param filepath: A String representing the path to the ECG data (csv file)
-    :returns: Lists containing time and voltage values, respectively
+    :param num_leads: Number of voltage columns
+    :param header: True to skip the first row
+    :returns: Float64 arrays containing time and voltage values,
+    respectively; the voltages are (samples x leads) if there are several
+    leads
     """
-    dataframe = pandas.read_csv(filepath, names=["Time", "Voltage"])
-    time = dataframe["Time"].tolist()
-    voltage = dataframe["Voltage"].tolist()
+    with open(filepath, "r", newline="") as file:
+        return parse_csv_rows(file, num_leads, header)
+
+
+def parse_csv_rows(lines, num_leads=1, header=False):
+    """ Parses csv lines of time and voltage data with the standard library
+    csv module.  Entries that are not numbers are returned as NaN.
+
+    :param lines: Iterable of csv lines (e.g. an open text file)
+    :param num_leads: Number of voltage columns
+    :param header: True to skip the first row
+    :returns: Float64 arrays containing time and voltage values,
+    respectively; the voltages are (samples x leads) if there are several
+    leads
+    """
+    import numpy
+    time = []
+    voltage = []
+    rows = csv.reader(lines)
+    if header:
+        next(rows, None)
+    for row in rows:
+        if not row:
+            continue
+        row = row + [""] * (num_leads + 1 - len(row))
+        time.append(parse_float(row[0]))
+        voltage.append([parse_float(field)
+                        for field in row[1:num_leads + 1]])
+    voltage = numpy.array(voltage, dtype=float).reshape(-1, num_leads)
+    if num_leads == 1:
+        voltage = voltage[:, 0]
+    return numpy.array(time, dtype=float), voltage
+
+
+def read_csv_dataframe(source, num_leads=1, header=False):
+    """ Reads in csv time and voltage data with pandas
+
+    :param source: Filepath or file-like object of csv data
+    :param num_leads: Number of voltage columns
+    :param header: True to skip the first row
+    :returns: Numpy arrays containing time and voltage values, respectively;
+    the voltages are (samples x leads) if there are several leads
+    """
+    import pandas
+    if num_leads > 1:
+        dataframe = pandas.read_csv(source, header=None,
+                                    skiprows=int(header),
+                                    names=range(num_leads + 1))
+        return dataframe[0].to_numpy(), dataframe.iloc[:, 1:].to_numpy()
+    dataframe = pandas.read_csv(source, names=["Time", "Voltage"],
+                                skiprows=int(header))
+    time = dataframe["Time"].to_numpy()
+    voltage = dataframe["Voltage"].to_numpy()
     return time, voltage
 
 
+def extract_window(filepath, start_time, end_time, every=None,
+                   max_gap=MAX_GAP):
+    """ Reads in only the part of a csv file around [start_time, end_time],
+    seeking to it through the file's sparse time index (built on first use).
+    The rows returned may reach a little past either end of the window;
+    user_specify_time trims them once they are cleaned.
+
+    :param filepath: A String representing the path to the ECG data (csv
+    file)
+    :param start_time: Time (in seconds) at which the data should start
+    :param end_time: Time (in seconds) at which the data should end
+    :param every: Number of rows between two entries of a new index.  If
+    None, timeIndex.DEFAULT_EVERY is used
+    :param max_gap: Longest run of invalid samples that will be filled in
+    :returns: Numpy arrays containing time and voltage values, respectively
+    """
+    if every is None:
+        every = timeIndex.DEFAULT_EVERY
+    names, header = read_lead_names(filepath)
+    index = timeIndex.ensure_index(filepath, every)
+    start_time = check_start_time(start_time, index["last_time"])
+    end_time = check_end_time(end_time, index["last_time"])
+    if None not in (start_time, end_time) and start_time > end_time:
+        start_time = None
+    # As in clean_segment, the rows on the edges may be filled from rows up
+    # to 2 * max_gap + 2 rows away
+    begin, stop = timeIndex.byte_range(index, start_time, end_time,
+                                       2 * max_gap + 2)
+    with open(filepath, "rb") as file:
+        file.seek(begin)
+        data = file.read(stop - begin)
+    logging.info("Read bytes %d to %d of %s" % (begin, stop, filepath))
+    header = header and begin == 0
+    if len(data) < SMALL_FILE_BYTES:
+        return parse_csv_rows(io.StringIO(data.decode(), newline=""),
+                              len(names), header)
+    return read_csv_dataframe(io.BytesIO(data), len(names), header)
+
+
+def parse_float(text):
+    """ Casts a csv field as float
+
+    :param text: String from a csv file
+    :returns: The field as a float, or NaN if it is not a number
+    """
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+
+def read_chunks(filepath, chunksize):
+    """ Reads in a csv file (or a raw binary recording) containing time and
+    voltage data a fixed number of rows at a time, so that only one chunk is
+    ever held in memory.
+
+    :param filepath: A String representing the path to the ECG data
+    :param chunksize: Number of rows per chunk
+    :returns: Generator of (time, voltage) numpy array pairs
+    """
+    import pandas
+    if is_binary(filepath):
+        for chunk in binaryRecording.read_binary_chunks(filepath, chunksize):
+            yield chunk
+        return
+    reader = pandas.read_csv(filepath, names=["Time", "Voltage"],
+                             chunksize=chunksize)
+    for dataframe in reader:
+        yield dataframe["Time"].to_numpy(), dataframe["Voltage"].to_numpy()
+
+
 # DATA PREPROCESSING FUNCTIONS
-def convert_to_floats(datalist):
-    """ Converts a list of data into floats, if possible.  Returns the indices
-    of all values that cannot be casted as float.
-
-    :param datalist: The list of data (either time or voltage)
-    :return: Lists containing float values and indices of non-float values,
-    respectively
-    """
-    float_data = []
-    interp_indices = []
-    for index, entry in enumerate(datalist):
-        try:
-            if pandas.isnull(entry) or type(entry) is bool:
-                raise ValueError
-            cast_val = float(entry)
-            float_data.append(cast_val)
-        except ValueError:
-            logging.warning("Non-float data type: {}".format(entry))
-            float_data.append(entry)
-            interp_indices.append(index)
-    return float_data, interp_indices
-
-
-def interpolate(times, voltages, time_interp_indices, voltage_interp_indices):
-    """ Uses linear interpolation to convert non-float or missing entries to
-    workable values for time and voltage.
+def convert_to_floats(datalist, quality=None, name="data"):
+    """ Converts an array of data into floats, if possible.  Entries that
+    cannot be casted as float (non-numeric strings, booleans, missing values)
+    are set to NaN and flagged in the returned mask.
+
+    :param datalist: The array-like of data (either time or voltage, which
+    may be a (samples x leads) array), or an ECGRecord, whose voltages are
+    converted
+    :param quality: dataQuality.QualityReport to count the flagged entries
+    in, by kind.  If None, they are counted in a report of their own, which
+    is logged
+    :param name: String naming the data in the report ("time" or "voltage")
+    :return: A float64 array of the data (or an ECGRecord of it, if given
+    one), and a boolean array that is True wherever the original entry could
+    not be casted as float, respectively
+    """
+    import numpy
+    datalist, record = record_arrays(None, datalist)[1:]
+    if record is not None:
+        voltages, invalid = convert_to_floats(datalist, quality, name)
+        return record_like(record, None, voltages), invalid
+    data = numpy.asarray(datalist)
+    with dataQuality.collecting(quality) as quality:
+        if data.dtype.kind in "iuf":
+            # Already numeric, as read from binary or small csv files
+            float_data = data.astype(float)
+            invalid = numpy.isnan(float_data)
+            add_non_floats(quality, name, numpy.count_nonzero(invalid))
+            return float_data, invalid
+        import pandas
+        series = pandas.Series(datalist if data.ndim == 1 else data.ravel())
+        if series.dtype == bool:
+            bools = numpy.ones(series.size, dtype=bool)
+        elif series.dtype == object:
+            bools = (series.map(type) == bool).to_numpy()
+        else:
+            bools = numpy.zeros(series.size, dtype=bool)
+        float_data = numpy.array(pandas.to_numeric(series, errors="coerce"),
+                                 dtype=float)
+        float_data[bools] = numpy.nan
+        invalid = numpy.isnan(float_data)
+        # Missing entries make poor examples
+        shown = invalid & ~series.isna().to_numpy()
+        add_non_floats(quality, name, numpy.count_nonzero(invalid),
+                       series[shown][:dataQuality.MAX_EXAMPLES])
+        return float_data.reshape(data.shape), invalid.reshape(data.shape)
+
+
+def add_non_floats(quality, name, count, examples=()):
+    """ Counts entries that could not be casted as float in a report
+
+    :param quality: dataQuality.QualityReport
+    :param name: String naming the data ("time" or "voltage")
+    :param count: Number of entries
+    :param examples: Iterable of the first entries that are not missing
+    :return: Void
+    """
+    quality.add(name + "_non_float", "Non-float {} values".format(name),
+                count, examples)
 
-    :param times: A list of float-converted time data
-    :param voltages: A list of float-converted voltage data
-    :param time_interp_indices: List indices where time data should be
+
+def fill_invalid(times, voltages, time_invalid, voltage_invalid,
+                 max_gap=MAX_GAP):
+    """ Linearly interpolates every run of up to max_gap invalid entries
+    that has valid entries on both sides: times by sample index, so the
+    time axis stays linear across the run, and voltages by time, each lead
+    on its own.  Longer runs (gaps) and runs at either end are not invented
+    but left as NaN, so the returned arrays line up with the inputs.  Every
+    run is filled in the same vectorized pass, however many there are.
+
+    :param times: An array of float-converted time data (NaN where invalid)
+    :param voltages: An array of float-converted voltage data (NaN where
+    invalid), either one value per time or (samples x leads)
+    :param time_invalid: Boolean array that is True where time data should be
     replaced with an interpolated value
-    :param voltage_interp_indices: List indices where voltage data should be
+    :param voltage_invalid: Boolean array that is True where voltage data
+    should be replaced with an interpolated value
+    :param max_gap: Longest run of invalid entries (in samples) to fill
+    :return: Arrays of interpolated time and voltage data, NaN wherever an
+    entry could not be repaired
+    """
+    import numpy
+    times = numpy.array(times, dtype=float)
+    voltages = numpy.array(voltages, dtype=float)
+    time_invalid = numpy.asarray(time_invalid, dtype=bool)
+    voltage_invalid = numpy.asarray(voltage_invalid, dtype=bool)
+    times[time_invalid] = numpy.nan
+    voltages[voltage_invalid] = numpy.nan
+    new_times = fill_runs(times, time_invalid,
+                          numpy.arange(times.size, dtype=float), max_gap)
+    # Rows whose time could not be repaired cannot anchor a voltage either
+    unknown = ~numpy.isfinite(new_times)
+    new_voltages = voltages.reshape(times.size, -1).copy()
+    invalid = voltage_invalid.reshape(times.size, -1)
+    for lead in range(new_voltages.shape[1]):
+        new_voltages[:, lead] = fill_runs(new_voltages[:, lead],
+                                          invalid[:, lead] | unknown,
+                                          new_times, max_gap)
+    return new_times, new_voltages.reshape(voltages.shape)
+
+
+def fill_runs(values, invalid, positions, max_gap):
+    """ Linearly interpolates every run of up to max_gap invalid values that
+    has valid values on both sides, between those two values
+
+    :param values: Array of float values
+    :param invalid: Boolean array that is True where a value should be
+    replaced
+    :param positions: Array of the position of each value (e.g. its sample
+    index or time) to interpolate along
+    :param max_gap: Longest run of invalid values to fill
+    :return: Copy of the values with the runs filled, and other invalid
+    values unchanged
+    """
+    import numpy
+    size = values.size
+    index = numpy.arange(size)
+    # Nearest valid entry on each side of every entry
+    left = numpy.maximum.accumulate(numpy.where(invalid, -1, index))
+    right = numpy.minimum.accumulate(
+        numpy.where(invalid, size, index)[::-1])[::-1]
+    fill = invalid & (left >= 0) & (right < size) & (
+        right - left - 1 <= max_gap)
+    before = left[fill]
+    after = right[fill]
+    filled = values.copy()
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        filled[fill] = values[before] + (
+            positions[fill] - positions[before]) * (
+            values[after] - values[before]) / (
+            positions[after] - positions[before])
+    return filled
+
+
+def interpolate(times, voltages, time_invalid, voltage_invalid,
+                max_gap=MAX_GAP, quality=None):
+    """ Uses linear interpolation to convert non-float or missing entries to
+    workable values for time and voltage.  Runs of more than max_gap invalid
+    entries, and invalid entries at either end of the data, cannot be
+    interpolated and are dropped (and counted); the gaps that they leave are
+    excluded from beat detection (see gap_edges).
+
+    :param times: An array of float-converted time data (NaN where
+    invalid), or an ECGRecord holding both the time and voltage data
+    (voltages is then omitted)
+    :param voltages: An array of float-converted voltage data (NaN where
+    invalid)
+    :param time_invalid: Boolean array that is True where time data should be
     replaced with an interpolated value
-    :return: Lists of properly interpolated (if applicable) time and voltage
-    data
-    """
-    new_times = []
-    new_voltages = []
-    for index in range(len(times)):
-        if index == 0 or index == len(times) - 1:
-            if index in time_interp_indices or index in voltage_interp_indices:
-                continue
-            else:
-                new_times.append(times[index])
-                new_voltages.append(voltages[index])
-        else:
-            if index in time_interp_indices:
-                # Interpolates times data
-                new_times.append(times[index - 1] + (times[index + 1] -
-                                 times[index - 1]) * (voltages[index] -
-                                 voltages[index - 1]) / (voltages[index + 1] -
-                                                         voltages[index - 1]))
-            else:
-                new_times.append(times[index])
-            if index in voltage_interp_indices:
-                # Interpolates voltages data
-                new_voltages.append(voltages[index-1] + (times[index] -
-                                    times[index-1]) * (voltages[index+1] -
-                                    voltages[index-1]) / (times[index+1] -
-                                    times[index-1]))
-            else:
-                new_voltages.append(voltages[index])
-    return new_times, new_voltages
+    :param voltage_invalid: Boolean array that is True where voltage data
+    should be replaced with an interpolated value
+    :param max_gap: Longest run of invalid entries (in samples) to fill
+    :param quality: dataQuality.QualityReport to count the dropped rows in.
+    If None, they are counted in a report of their own, which is logged
+    :return: Arrays of properly interpolated (if applicable) time and voltage
+    data, or an ECGRecord of them if given one.  With several leads, a row
+    is dropped if any lead cannot be repaired
+    """
+    import numpy
+    times, voltages, record = record_arrays(times, voltages)
+    new_times, new_voltages = fill_invalid(times, voltages, time_invalid,
+                                           voltage_invalid, max_gap)
+    keep = numpy.isfinite(new_times) & numpy.isfinite(
+        new_voltages.reshape(new_times.size, -1)).all(axis=1)
+    with dataQuality.collecting(quality) as quality:
+        add_dropped_rows(quality, keep.size - numpy.count_nonzero(keep))
+    if record is not None:
+        return record_like(record, new_times[keep], new_voltages[keep])
+    return new_times[keep], new_voltages[keep]
+
+
+def add_dropped_rows(quality, count):
+    """ Counts rows that could not be interpolated in a report
+
+    :param quality: dataQuality.QualityReport
+    :param count: Number of rows dropped
+    :return: Void
+    """
+    quality.add("rows_dropped", "Rows dropped that could not be "
+                                "interpolated", count)
 
 
-def voltage_clip(voltages):
+def typical_step(times):
+    """ Finds the typical step between the samples of the time data, which
+    gap_edges measures gaps against
+
+    :param times: Array of time data
+    :return: Median step (in seconds) between consecutive times, or None
+    for fewer than two times
+    """
+    import numpy
+    steps = numpy.diff(numpy.asarray(times, dtype=float))
+    return float(numpy.median(steps)) if steps.size else None
+
+
+def gap_edges(times, max_gap=MAX_GAP, step=None):
+    """ Flags the samples on either side of each gap in the time data, such
+    as a run of more than max_gap samples dropped by interpolate.  A gap is
+    a step more than max_gap + 1 times as long as the typical step between
+    samples, so gaps at the start of the data and gaps right after one
+    another are found as well.  A peak on the edge of a gap cannot be told
+    from a signal that carried on rising into it, so beats found there are
+    discarded.
+
+    :param times: Array of time data
+    :param max_gap: Longest run of missing samples that is not a gap
+    :param step: Typical step (in seconds) between samples, for times that
+    are only part of a recording.  If None, the typical_step of the times
+    is used
+    :return: Boolean array that is True for samples bounding a gap
+    """
+    import numpy
+    times = numpy.asarray(times, dtype=float)
+    if step is None:
+        step = typical_step(times)
+    steps = numpy.diff(times)
+    gaps = steps > (max_gap + 1) * (step or 0.0)
+    edges = numpy.zeros(times.size, dtype=bool)
+    edges[:-1] |= gaps
+    edges[1:] |= gaps
+    return edges
+
+
+def clean_chunks(chunks, max_gap=MAX_GAP, quality=None):
+    """ Converts, interpolates and clips a stream of raw time and voltage
+    chunks.  Each chunk's rows from its last valid row onwards (at most
+    max_gap + 2 rows) are carried over to the next one, so values on a chunk
+    boundary are interpolated exactly as they would be if the whole file
+    were in memory.
+
+    :param chunks: Iterable of raw (time, voltage) array pairs
+    :param max_gap: Longest run of invalid entries (in samples) to fill
+    :param quality: dataQuality.QualityReport to count the anomalies found
+    in.  If None, they are counted in a report of their own, which is
+    logged once the last chunk is cleaned
+    :return: Generator of cleaned (time, voltage) array pairs
+    """
+    import numpy
+    with dataQuality.collecting(quality) as quality:
+        carry = None
+        for time, voltage in chunks:
+            time, time_invalid = convert_to_floats(time, quality, "time")
+            voltage, voltage_invalid = convert_to_floats(voltage, quality,
+                                                         "voltage")
+            if carry is not None:
+                time = numpy.concatenate((carry[0], time))
+                voltage = numpy.concatenate((carry[1], voltage))
+                time_invalid = numpy.concatenate((carry[2], time_invalid))
+                voltage_invalid = numpy.concatenate((carry[3],
+                                                     voltage_invalid))
+            # Rows from the last valid one on are held back until the run of
+            # invalid rows after it is known to end
+            valid = numpy.flatnonzero(~(time_invalid | voltage_invalid))
+            hold = valid[-1] if valid.size else time.size
+            hold = max(hold, time.size - (max_gap + 2))
+            new_time, new_voltage = fill_invalid(
+                time[:hold + 1], voltage[:hold + 1],
+                time_invalid[:hold + 1], voltage_invalid[:hold + 1],
+                max_gap)
+            new_time = new_time[:hold]
+            new_voltage = new_voltage[:hold]
+            keep = numpy.isfinite(new_time) & numpy.isfinite(new_voltage)
+            add_dropped_rows(quality, keep.size - numpy.count_nonzero(keep))
+            if keep.any():
+                yield new_time[keep], voltage_clip(new_voltage[keep],
+                                                   quality)
+            carry = (time[hold:], voltage[hold:], time_invalid[hold:],
+                     voltage_invalid[hold:])
+        if carry is not None:
+            new_time, new_voltage = fill_invalid(*carry, max_gap=max_gap)
+            keep = numpy.isfinite(new_time) & numpy.isfinite(new_voltage)
+            add_dropped_rows(quality, keep.size - numpy.count_nonzero(keep))
+            if keep.any():
+                yield new_time[keep], voltage_clip(new_voltage[keep],
+                                                   quality)
+
+
+def voltage_clip(voltages, quality=None):
     """ Ensures that all voltage readings are less than or equal to 300mV,
     and clips those that are not to 300mV.
 
-    :param voltages: List of float-casted, interpolated voltages
-    :return: List of float-casted, interpolated voltages of at most 300mV
-    """
-    ret_voltage = []
-    for voltage in voltages:
-        if voltage > 300.0:
-            try:
-                raise ValueError
-            except ValueError:
-                ret_voltage.append(300.0)
-                logging.warning("Voltage value above 300: %f" % voltage)
-        else:
-            ret_voltage.append(voltage)
-    return ret_voltage
+    :param voltages: Array of float-casted, interpolated voltages, or an
+    ECGRecord
+    :param quality: dataQuality.QualityReport to count the clipped voltages
+    in.  If None, they are counted in a report of their own, which is
+    logged
+    :return: Array of float-casted, interpolated voltages of at most 300mV,
+    or an ECGRecord of them (with the same storage type) if given one
+    """
+    import numpy
+    voltages, record = record_arrays(None, voltages)[1:]
+    if record is None:
+        voltages = numpy.asarray(voltages, dtype=float)
+    above = voltages > 300.0
+    with dataQuality.collecting(quality) as quality:
+        quality.add("voltage_above_300", "Voltage values above 300 mV, "
+                                         "clipped",
+                    numpy.count_nonzero(above),
+                    voltages[above][:dataQuality.MAX_EXAMPLES])
+    if record is not None:
+        return record_like(record, None, numpy.minimum(voltages, 300.0))
+    return numpy.minimum(voltages, 300.0)
 
 
-def check_time_data(times):
-    """ Checks to ensure that the time data consists of non-negative floats
-    and is in ascending order (i.e. the way time data should be expected to
-    look)
+def check_time_data(times, voltages=None, repair="reject", quality=None):
+    """ Checks that the time data consists of non-negative floats in
+    strictly ascending order (i.e. the way time data should be expected to
+    look), and optionally repairs it.  Every check is a single vectorized
+    pass, and sorting only happens when the times are out of order.
 
-    :param times: List of time data
-    :return: Void if time data checks out ok, raises ValueError otherwise to
-    terminate program
+    :param times: Array of time data, or an ECGRecord holding both the time
+    and voltage data (voltages is then omitted)
+    :param voltages: Array of voltage data, kept in line with the times (or
+    None)
+    :param repair: What to do about bad time data: "reject" raises
+    ValueError; "dedupe" drops negative times and all but the first of each
+    run of equal times, but still rejects times out of order; "sort" also
+    puts the samples in order with a stable sort before deduplicating
+    :param quality: dataQuality.QualityReport to count the repairs in.  If
+    None, they are counted in a report of their own, which is logged
+    :return: Arrays of the checked time and voltage data (or an ECGRecord
+    of them, if given one, in their place), and a report
+    dictionary with the number of samples, of negative times, of steps back
+    in time and of duplicate times, the number of decimals the times were
+    printed with and the sample rate (None unless the samples are evenly
+    spaced); raises ValueError to terminate the program
+    if the data cannot be used
     """
-    for index, time in enumerate(times):
-        if time < 0.0:
+    import numpy
+    if repair not in TIME_REPAIRS:
+        raise ValueError("Unknown time repair: {}".format(repair))
+    times, voltages, record = record_arrays(times, voltages)
+    if record is not None:
+        times, voltages, report = check_time_data(times, voltages, repair,
+                                                  quality)
+        return record_like(record, times, voltages), report
+    times = numpy.asarray(times, dtype=float)
+    if voltages is not None:
+        voltages = numpy.asarray(voltages)
+    report = {"num_samples": times.size}
+    negative = times < 0.0
+    report["num_negative"] = int(numpy.count_nonzero(negative))
+    if report["num_negative"]:
+        if repair == "reject":
             raise ValueError("Negative time value!")
-        if index > 0 and times[index] >= times[index-1]:
+        times = times[~negative]
+        voltages = None if voltages is None else voltages[~negative]
+    steps = numpy.diff(times)
+    report["num_out_of_order"] = int(numpy.count_nonzero(steps < 0.0))
+    if report["num_out_of_order"]:
+        if repair != "sort":
             raise ValueError("Time data not in ascending order!")
+        order = numpy.argsort(times, kind="stable")
+        times = times[order]
+        voltages = None if voltages is None else voltages[order]
+        steps = numpy.diff(times)
+    duplicate = steps == 0.0
+    report["num_duplicates"] = int(numpy.count_nonzero(duplicate))
+    if report["num_duplicates"]:
+        if repair == "reject":
+            raise ValueError("Duplicate time values!")
+        keep = numpy.concatenate(([True], ~duplicate))
+        times = times[keep]
+        voltages = None if voltages is None else voltages[keep]
+    with dataQuality.collecting(quality) as quality:
+        quality.add("time_negative", "Negative time values, dropped",
+                    report["num_negative"])
+        quality.add("time_out_of_order", "Steps back in time, sorted",
+                    report["num_out_of_order"])
+        quality.add("time_duplicate", "Duplicate time values, dropped",
+                    report["num_duplicates"])
+    report["time_decimals"] = ecgRecord.time_decimals(times)
+    report["sample_rate"] = ecgRecord.uniform_sample_rate(
+        times, report["time_decimals"])
+    if report["sample_rate"] is not None:
+        logging.info("Uniform sampling at %g Hz" % report["sample_rate"])
+    return times, voltages, report
 
 
 # DATA ANALYSIS FUNCTIONS
-def user_specify_time(times, voltages, end_time):
-    """ Cuts off all time and voltage data that occurs after the user-specified
-    end time.  If the user does not specify an end time, this function will
-    default to keeping the time array untrimmed.
+def checked_record(times, voltages, report, dtype="float64"):
+    """ Holds checked time and voltage data as an ECGRecord, with an
+    implicit time axis if the report found a fixed sample rate
+
+    :param times: Array of checked time data
+    :param voltages: Array of voltage data, in line with the times
+    :param report: Report of check_time_data on the times
+    :param dtype: Storage type of the voltages, "float64" or "float32"
+    :returns: ECGRecord of the data
+    """
+    if report["sample_rate"] is None:
+        return ecgRecord.ECGRecord(times, voltages, dtype=dtype)
+    return ecgRecord.ECGRecord(None, voltages, report["sample_rate"],
+                               times[0], dtype,
+                               decimals=report["time_decimals"])
+
+
+def check_end_time(end_time, max_time):
+    """ Checks that the user-specified end time is a number that lies within
+    the recorded time data.
 
-    :param times: List of time data
-    :param voltages: List of voltage data
     :param end_time: Time (in seconds) at which the data should end
-    :return: Trimmed time and voltage lists
+    :param max_time: Latest time present in the data
+    :return: The end time as a float, or None if the data should not be
+    trimmed at all
+    """
+    end_time = check_time_bound(end_time, max_time, "End")
+    if end_time is None:
+        logging.warning("Using default end time by not trimming data at all.")
+    return end_time
+
+
+def check_start_time(start_time, max_time):
+    """ Checks that the user-specified start time is a number that lies
+    within the recorded time data.  No start time means the data starts at
+    the beginning of the recording.
+
+    :param start_time: Time (in seconds) at which the data should start
+    :param max_time: Latest time present in the data
+    :return: The start time as a float, or None if the data should not be
+    trimmed at the start
+    """
+    if start_time is None:
+        return None
+    start_time = check_time_bound(start_time, max_time, "Start")
+    if start_time is None:
+        logging.warning("Using default start time by not trimming data at "
+                        "the start.")
+    return start_time
+
+
+def check_time_bound(time, max_time, label):
+    """ Checks that a user-specified start or end time is a number that lies
+    within the recorded time data.
+
+    :param time: Time (in seconds) given by the user
+    :param max_time: Latest time present in the data
+    :param label: "Start" or "End", for the log message
+    :return: The time as a float, or None if it is not valid
     """
     try:
-        if pandas.isnull(end_time) or type(end_time) is bool:
+        if time is None or type(time) is bool:
             raise ValueError
-        end_time = float(end_time)
-        if end_time < 0 or end_time > max(times):
+        time = float(time)
+        if math.isnan(time) or time < 0 or time > max_time:
             raise ValueError
     except ValueError:
-        logging.warning("End time not valid: {}".format(end_time))
-        logging.warning("Using default end time by not trimming data at all.")
-        return times, voltages
-    ret_times = []
-    ret_voltages = []
-    for index, time in enumerate(times):
-        if time <= end_time:
-            ret_times.append(time)
-            ret_voltages.append(voltages[index])
+        logging.warning("{} time not valid: {}".format(label, time))
+        return None
+    return time
+
+
+def check_time_window(start_time, end_time, max_time):
+    """ Checks a user-specified start and end time together.  A start time
+    after the end time is ignored.
+
+    :param start_time: Time (in seconds) at which the data should start
+    :param end_time: Time (in seconds) at which the data should end
+    :param max_time: Latest time present in the data
+    :return: The start and end times as floats, each None if the data
+    should not be trimmed at that end
+    """
+    end_time = check_end_time(end_time, max_time)
+    start_time = check_start_time(start_time, max_time)
+    if None not in (start_time, end_time) and start_time > end_time:
+        logging.warning("Start time is after the end time; using default "
+                        "start time.")
+        start_time = None
+    return start_time, end_time
+
+
+def user_specify_time(times, voltages, end_time, start_time=None):
+    """ Cuts off all time and voltage data that occurs before the
+    user-specified start time or after the user-specified end time.  If the
+    user does not specify an end time, this function will default to keeping
+    the time array untrimmed.  The times must be in ascending order, as they
+    are found by binary search.
+
+    :param times: Array of time data, or an ECGRecord holding both the time
+    and voltage data (voltages is then omitted)
+    :param voltages: Array of voltage data
+    :param end_time: Time (in seconds) at which the data should end
+    :param start_time: Time (in seconds) at which the data should start.  If
+    None, the data is not trimmed at the start
+    :return: Trimmed time and voltage arrays, or a slice of the ECGRecord
+    (sharing its data) if given one
+    """
+    import numpy
+    if isinstance(times, ecgRecord.ECGRecord):
+        record = times
+        max_time = record.time_at(-1) if len(record) else -math.inf
+    else:
+        record = None
+        times = numpy.asarray(times, dtype=float)
+        voltages = numpy.asarray(voltages, dtype=float)
+        max_time = times[-1] if times.size else -math.inf
+    start_time, end_time = check_time_window(start_time, end_time, max_time)
+    if record is not None:
+        return record.time_slice(start_time, end_time)
+    begin = 0
+    stop = times.size
+    if start_time is not None:
+        begin = numpy.searchsorted(times, start_time, side="left")
+    if end_time is not None:
+        stop = numpy.searchsorted(times, end_time, side="right")
+    return times[begin:stop], voltages[begin:stop]
+
+
+def record_arrays(times, voltages=None):
+    """ Lets a stage take an ECGRecord in place of its time and voltage
+    arrays, or in place of its voltage array alone
+
+    :param times: Array of time data, or an ECGRecord
+    :param voltages: Array of voltage data, or an ECGRecord (ignored if
+    times is an ECGRecord)
+    :return: The time and voltage data, and the ECGRecord (None if given
+    arrays).  The time axis of a record given in place of the voltages is
+    not synthesized
+    """
+    if isinstance(times, ecgRecord.ECGRecord):
+        return times.times, times.voltages, times
+    if isinstance(voltages, ecgRecord.ECGRecord):
+        return times, voltages.voltages, voltages
+    return times, voltages, None
+
+
+def record_like(record, times, voltages):
+    """ Puts the output of a stage that was given an ECGRecord into a record
+    of its own, with the same voltage storage type, and with the same time
+    axis if every sample was kept
+
+    :param record: ECGRecord given to the stage
+    :param times: Array of time data output, or None if the stage left the
+    times alone
+    :param voltages: Array of voltage data output
+    :return: ECGRecord
+    """
+    dtype = record.voltages.dtype
+    if times is None or (record.uniform and len(times) == len(record)):
+        if record.uniform:
+            return ecgRecord.ECGRecord(None, voltages, record.sample_rate,
+                                       record.start_time, dtype,
+                                       record.first, record.decimals)
+        return ecgRecord.ECGRecord(record.times, voltages, dtype=dtype)
+    return ecgRecord.ECGRecord.from_arrays(times, voltages, dtype)
+
+
+def record_chunks(record, voltages=None):
+    """ Splits an ECGRecord into chunks of float64 time and voltage arrays,
+    so that a stage can make a pass over the recording without a float64
+    copy of all of it, or the whole of an implicit time axis
+
+    :param record: ECGRecord
+    :param voltages: Array of voltage data to split in place of the
+    record's own (e.g. filtered voltages)
+    :return: Generator of (time, voltage) numpy array pairs
+    """
+    import numpy
+    if voltages is None:
+        voltages = record.voltages
+    for begin in range(0, len(record), RECORD_CHUNK):
+        stop = begin + RECORD_CHUNK
+        yield (record[begin:stop].times,
+               numpy.asarray(voltages[begin:stop], dtype=float))
+
+
+class ECGAnalysis(object):
+    """ Analysis context for a single recording.  Beat detection, voltage
+    extremes and duration are each computed at most once, the first time
+    they are needed, and every metric is derived from those shared results.
+    """
+
+    def __init__(self, times, voltages=None, threshold=0.80,
+                 refractory=REFRACTORY_PERIOD, min_prominence=0.0,
+                 max_gap=MAX_GAP, band=None, time_range=None,
+                 voltage_extremes=None, detection_voltages=None,
+                 beat_indices=None):
+        """ Creates the analysis context
+
+        :param times: Array of time data (None if only voltage metrics are
+        needed), or an ECGRecord holding both the time and voltage data
+        (voltages is then omitted).  A record is analyzed as it is stored,
+        without synthesizing its time axis or converting its voltages
+        :param voltages: Array of voltage data (None if only time metrics are
+        needed), or an ECGRecord whose voltages are used
+        :param threshold: Relative peak threshold, as a fraction of the
+        voltage range
+        :param refractory: Shortest time (in seconds) between two beats
+        :param min_prominence: Least rise (in mV) of a beat above the lowest
+        voltage since the previous beat
+        :param max_gap: Longest run of missing samples that is not a gap
+        (see gap_edges)
+        :param band: (low, high) cutoff frequencies (in Hz) of a band-pass
+        filter applied to the voltages before beat detection (see
+        bandpassFilter.bandpass_filter).  If None, beats are detected on the
+        voltages as they are
+        :param time_range: Tuple of the first and last times, if already
+        known (None to compute it when needed)
+        :param voltage_extremes: Tuple of the min and max voltages, if
+        already known (None to compute them when needed)
+        :param detection_voltages: Array of the voltages to detect beats on,
+        if already filtered (None to filter them when needed)
+        :param beat_indices: Array of the sample indices of the beats, if
+        already detected (None to detect them when needed)
+        """
+        import numpy
+        if isinstance(times, ecgRecord.ECGRecord):
+            record = times
+            voltages = record.voltages
         else:
-            break
-    return ret_times, ret_voltages
+            voltages = record_arrays(times, voltages)[1]
+            record = None
+            if times is not None:
+                # Only the time axis is taken from the record
+                times = numpy.asarray(times, dtype=float)
+                record = ecgRecord.ECGRecord(times,
+                                             numpy.empty((times.size, 0)))
+        if voltages is not None:
+            voltages = numpy.asarray(voltages)
+            if voltages.dtype.kind != "f":
+                voltages = voltages.astype(float)
+        self.record = record
+        self.voltages = voltages
+        self.threshold = threshold
+        self.refractory = refractory
+        self.min_prominence = min_prominence
+        self.max_gap = max_gap
+        self.band = band
+        self._beat_indices = beat_indices
+        self._voltage_extremes = voltage_extremes
+        self._detection_voltages = detection_voltages
+        self._time_range = time_range
+
+    @property
+    def times(self):
+        """ Numpy array of time data (synthesized if the time axis is
+        implicit), or None if only voltage metrics are needed
+        """
+        return None if self.record is None else self.record.times
+
+    @property
+    def detection_voltages(self):
+        """ Numpy array of the voltages that beats are detected on: the
+        band-pass filtered voltages if a band is given, the voltages
+        otherwise
+        """
+        if self._detection_voltages is None:
+            if self.band is None:
+                self._detection_voltages = self.voltages
+            else:
+                self._detection_voltages = bandpassFilter.bandpass_filter(
+                    self.times, self.voltages, self.band)
+        return self._detection_voltages
+
+    @property
+    def detection_threshold(self):
+        """ Absolute voltage that a beat must exceed: the relative threshold
+        applied to the range of the detection voltages
+        """
+        if self.band is None:
+            min_voltage, max_voltage = self.voltage_extremes
+        else:
+            voltages = self.detection_voltages
+            min_voltage, max_voltage = voltages.min(), voltages.max()
+        return self.threshold * (max_voltage - min_voltage) + min_voltage
+
+    @property
+    def beat_indices(self):
+        """ Indices of the detected beats, found by running a
+        StreamingBeatDetector once over the whole recording
+        """
+        import numpy
+        if self._beat_indices is None:
+            if self.voltages.size == 0:
+                self._beat_indices = numpy.array([], dtype=int)
+                return self._beat_indices
+            detector = StreamingBeatDetector(self.detection_threshold,
+                                             self.refractory,
+                                             self.min_prominence)
+            indices = [detector.feed_indices(times, voltages)[0]
+                       for times, voltages in record_chunks(
+                           self.record, self.detection_voltages)]
+            indices = numpy.concatenate(indices + [detector.flush()[0]])
+            # Evenly spaced samples have no gaps
+            if not self.record.uniform:
+                indices = indices[
+                    ~gap_edges(self.record.times, self.max_gap)[indices]]
+            self._beat_indices = indices
+        return self._beat_indices
+
+    @property
+    def beat_times(self):
+        """ Numpy array of times (floats) when the beats occurred
+        """
+        return self.record.times_at(self.beat_indices)
+
+    @property
+    def num_beats(self):
+        """ Int representing the number of detected beats
+        """
+        return int(self.beat_indices.size)
+
+    @property
+    def voltage_extremes(self):
+        """ Tuple containing min and max voltages (floats)
+        """
+        if self._voltage_extremes is None:
+            self._voltage_extremes = (float(self.voltages.min()),
+                                      float(self.voltages.max()))
+        return self._voltage_extremes
+
+    @property
+    def time_range(self):
+        """ Tuple containing the first and last times (floats)
+        """
+        if self._time_range is None:
+            if self.record.uniform:
+                self._time_range = (self.record.time_at(0),
+                                    self.record.time_at(-1))
+            else:
+                self._time_range = (float(self.times.min()),
+                                    float(self.times.max()))
+        return self._time_range
+
+    @property
+    def duration(self):
+        """ Float representing duration of ECG data, in seconds
+        """
+        return self.time_range[1] - self.time_range[0]
+
+    @property
+    def mean_hr_bpm(self):
+        """ Float representing the average heart rate in bpm
+        """
+        return self.num_beats / self.duration * 60
+
+    def partial_metrics(self, keep_beats=True):
+        """ Summarizes the shared results in a form that can be merged with
+        the summaries of later recordings or ranges
+
+        :param keep_beats: True to keep the beat times
+        :return: partialMetrics.PartialMetrics of the recording
+        """
+        return partialMetrics.PartialMetrics(
+            self.time_range, self.voltage_extremes, self.beat_times,
+            keep_beats)
+
+    def to_dict(self):
+        """ Creates the metrics dictionary from the shared results
+
+        :return: Dictionary of metrics (beat times kept as a numpy array),
+        including the heart rate variability of the RR intervals
+        """
+        return self.partial_metrics().to_dict()
 
 
 def get_duration(times):
     """ Finds and returns the duration of the ECG in units of seconds.
 
-    :param times: List of time data
+    :param times: Array of time data, or an ECGRecord
     :return: Float representing duration of ECG data
     """
-    return max(times) - min(times)
+    return ECGAnalysis(times, None).duration
 
 
 def get_voltage_extremes(voltages):
     """ Finds and returns the minimum and maximum voltages measured in the
     ECG signal.
 
-    :param voltages: List of voltage measurements
+    :param voltages: Array of voltage measurements, or an ECGRecord
     :return: Tuple containing min and max voltages (floats)
     """
-    return min(voltages), max(voltages)
+    return ECGAnalysis(None, voltages).voltage_extremes
 
 
-def get_beats_times(times, voltages):
+def get_beats_times(times, voltages=None):
     """ Determines the time at which each beat in the sample occurs.  Beats
     are found using a peak detection algorithm that has a minimum threshold
     of 80% of the maximum voltage value present in the data.
 
-    :param times: List of time data
-    :param voltages: List of voltage data
+    :param times: Array of time data, or an ECGRecord
+    :param voltages: Array of voltage data (omitted for an ECGRecord)
     :return: A numpy array of times (floats) when the beats occurred
     """
-    qrs_indexes = peakutils.peak.indexes(voltages, thres=0.80)
-    beat_times = []
-    for index in qrs_indexes:
-        beat_times.append(times[index])
-    return numpy.array(beat_times)
+    return ECGAnalysis(times, voltages).beat_times
 
 
-def get_num_beats(times, voltages):
+def get_num_beats(times, voltages=None):
     """ Calculates the number of beats in the sample.
 
-    :param times: List of time data
-    :param voltages: List of voltage data
+    :param times: Array of time data, or an ECGRecord
+    :param voltages: Array of voltage data (omitted for an ECGRecord)
     :return: Int representing the number of detected beats
     """
-    return get_beats_times(times, voltages).size
+    return ECGAnalysis(times, voltages).num_beats
 
 
-def get_mean_hr_bpm(times, voltages):
+def get_mean_hr_bpm(times, voltages=None):
     """ Calculates the average heart rate over the sample's interval, in beats
     per minute.
 
-    :param times: List of time data
-    :param voltages: List of voltage data
+    :param times: Array of time data, or an ECGRecord
+    :param voltages: Array of voltage data (omitted for an ECGRecord)
     :return: Float representing the average heart rate in bpm
     """
-    return get_num_beats(times, voltages) / get_duration(times) * 60
+    return ECGAnalysis(times, voltages).mean_hr_bpm
 
 
-def metrics_to_dict(times, voltages):
+def metrics_to_dict(times, voltages=None, names=None, max_gap=MAX_GAP,
+                    band=None):
     """ Creates a metrics dictionary with entries for mean heartrate (in bpm),
     voltage extremes, duration of the ECG signal, number of beats detected,
-    and times at which beats were detected.
+    and times at which beats were detected.  Peak detection runs only once.
+
+    :param times: Array of time data, or an ECGRecord holding both the time
+    and voltage data (voltages is then omitted)
+    :param voltages: Array of voltage data, or (samples x leads) array of
+    multi-lead voltage data
+    :param names: List of lead names of multi-lead data (defaults to lead_1,
+    lead_2, ...)
+    :param max_gap: Longest run of missing samples that is not a gap (see
+    gap_edges)
+    :param band: (low, high) cutoff frequencies (in Hz) of a band-pass
+    filter applied before beat detection.  If None, nothing is filtered
+    :return: Dictionary of metrics (beat times kept as a numpy array); for
+    multi-lead data, the metrics of each lead by name
+    """
+    import numpy
+    if isinstance(times, ecgRecord.ECGRecord):
+        voltages = times.voltages
+    if numpy.ndim(voltages) == 2:
+        return MultiLeadAnalysis(times, voltages, names, max_gap=max_gap,
+                                 band=band).to_dict()
+    return ECGAnalysis(times, voltages, max_gap=max_gap,
+                       band=band).to_dict()
+
+
+class MultiLeadAnalysis(object):
+    """ Analysis context for a recording with several leads sharing one time
+    column.  The duration is computed once and the voltage extremes of all
+    leads in one vectorized pass; beats are then detected lead by lead.
+    """
+
+    def __init__(self, times, voltages=None, names=None, threshold=0.80,
+                 refractory=REFRACTORY_PERIOD, min_prominence=0.0,
+                 max_gap=MAX_GAP, band=None):
+        """ Creates the analysis context
+
+        :param times: Array of time data, or an ECGRecord holding both the
+        time and voltage data (voltages is then omitted)
+        :param voltages: (samples x leads) array of voltage data
+        :param names: List of lead names (defaults to lead_1, lead_2, ...)
+        :param threshold: Relative peak threshold, as a fraction of the
+        voltage range of each lead
+        :param refractory: Shortest time (in seconds) between two beats
+        :param min_prominence: Least rise (in mV) of a beat above the lowest
+        voltage since the previous beat
+        :param max_gap: Longest run of missing samples that is not a gap
+        (see gap_edges)
+        :param band: (low, high) cutoff frequencies (in Hz) of a band-pass
+        filter applied to every lead before beat detection.  If None, beats
+        are detected on the voltages as they are
+        """
+        if isinstance(times, ecgRecord.ECGRecord):
+            self.record = times
+        else:
+            self.record = ecgRecord.ECGRecord(times, voltages)
+        num_leads = self.record.voltages.shape[1]
+        if names is None:
+            names = ["lead_{}".format(lead)
+                     for lead in range(1, num_leads + 1)]
+        if len(names) != num_leads:
+            raise ValueError("Expected {} lead names, got {}".format(
+                num_leads, len(names)))
+        self.names = list(names)
+        self.threshold = threshold
+        self.refractory = refractory
+        self.min_prominence = min_prominence
+        self.max_gap = max_gap
+        self.band = band
+
+    def to_dict(self):
+        """ Creates the metrics dictionary of every lead
+
+        :return: Dictionary with the number of leads and, under "leads", the
+        metrics dictionary of each lead by name
+        """
+        record = self.record
+        time_range = ECGAnalysis(record).time_range
+        mins = record.voltages.min(axis=0)
+        maxs = record.voltages.max(axis=0)
+        filtered = [None] * len(self.names)
+        if self.band is not None:
+            # All leads in one pass, along the time axis
+            filtered = bandpassFilter.bandpass_filter(
+                record.times, record.voltages, self.band).T
+        leads = {}
+        for lead, (name, lead_filtered) in enumerate(zip(self.names,
+                                                         filtered)):
+            # One lead at a time, in the record's storage type
+            analysis = ECGAnalysis(
+                record_like(record, None, record.voltages[:, lead]), None,
+                self.threshold, self.refractory, self.min_prominence,
+                self.max_gap, self.band, time_range,
+                (float(mins[lead]), float(maxs[lead])), lead_filtered)
+            leads[name] = analysis.to_dict()
+        return {"num_leads": len(self.names), "leads": leads}
+
+
+class StreamingBeatDetector(object):
+    """ Linear-time beat detector for voltage data that arrives in
+    consecutive chunks (a whole recording is simply a single chunk).  A
+    candidate beat is a local maximum (the middle of a flat-topped peak)
+    above an absolute threshold, which matches peakutils.peak.indexes with
+    thres_abs=True.  Candidates can also be required to rise min_prominence
+    above the lowest voltage since the previous beat, and of several
+    candidates within one refractory period only the tallest (the earliest
+    on ties) is kept.  Only the trailing run of equal voltages and the beat
+    still inside its refractory period are carried over between chunks, so
+    memory use does not grow with the recording length.
+    """
+
+    def __init__(self, threshold, refractory=0.0, min_prominence=0.0):
+        """ Creates the detector
+
+        :param threshold: Absolute voltage that a peak must exceed.  It may
+        be changed between chunks
+        :param refractory: Shortest time (in seconds) between two beats
+        :param min_prominence: Least rise (in mV) of a beat above the lowest
+        voltage since the previous beat
+        """
+        import numpy
+        self.threshold = threshold
+        self.refractory = refractory
+        self.min_prominence = min_prominence
+        self._offset = 0
+        self._prev_value = numpy.nan
+        self._run_value = None
+        self._run_start = 0
+        self._run_times = None
+        self._run_times_start = 0
+        # (index, time, voltage, base) of the beat inside its refractory
+        # period, and the lowest voltage seen since that beat
+        self._pending = None
+        self._base = numpy.inf
+
+    def feed(self, times, voltages=None):
+        """ Processes the next chunk of data
+
+        :param times: Array of time data for this chunk, or an ECGRecord of
+        the chunk (voltages is then omitted)
+        :param voltages: Array of voltage data for this chunk
+        :return: A numpy array of times (floats) of the beats that could be
+        confirmed with the data seen so far
+        """
+        return self.feed_indices(times, voltages)[1]
+
+    def feed_indices(self, times, voltages=None):
+        """ Processes the next chunk of data.  Apart from one comparison
+        against the threshold, only the samples above the threshold are
+        examined, so the cost is dominated by a single pass over the chunk.
+
+        :param times: Array of time data for this chunk, or an ECGRecord of
+        the chunk (voltages is then omitted)
+        :param voltages: Array of voltage data for this chunk
+        :return: Numpy arrays of the sample indices (counted from the start
+        of the first chunk) and of the times of the beats that could be
+        confirmed with the data seen so far
+        """
+        import numpy
+        if isinstance(times, ecgRecord.ECGRecord):
+            found = [self.feed_indices(*chunk) for chunk in
+                     record_chunks(times)]
+            return (numpy.concatenate([indices for indices, _ in found] +
+                                      [numpy.array([], dtype=int)]),
+                    numpy.concatenate([beats for _, beats in found] +
+                                      [numpy.array([])]))
+        times, voltages = record_arrays(times, voltages)[:2]
+        times = numpy.asarray(times, dtype=float)
+        voltages = numpy.asarray(voltages, dtype=float)
+        if voltages.size == 0:
+            return numpy.array([], dtype=int), numpy.array([])
+        offset = self._offset
+        # The open run of the previous chunk stands in for all of its
+        # samples as a single entry, preceded by the voltage before it.
+        # Indices below refer to this prefix followed by the chunk
+        if self._run_value is None:
+            prefix = numpy.array([numpy.nan])
+        else:
+            prefix = numpy.array([self._prev_value, self._run_value])
+        lead = prefix.size
+        last = lead + voltages.size - 1
+
+        def extended(indices):
+            chunk = voltages[numpy.maximum(indices - lead, 0)]
+            return numpy.where(indices < lead, prefix[numpy.minimum(
+                indices, lead - 1)], chunk)
+
+        # Runs of equal voltages above the threshold, as first and last
+        # indices
+        hot = numpy.flatnonzero(voltages > self.threshold) + lead
+        if lead == 2 and prefix[1] > self.threshold:
+            hot = numpy.concatenate(([1], hot))
+        hot_values = extended(hot)
+        breaks = numpy.flatnonzero((numpy.diff(hot) != 1) |
+                                   (numpy.diff(hot_values) != 0)) + 1
+        firsts = hot[numpy.concatenate(([0], breaks))] if hot.size else hot
+        lasts = hot[numpy.concatenate((breaks - 1, [hot.size - 1]))] \
+            if hot.size else hot
+        open_hot = bool(lasts.size) and lasts[-1] == last
+        if open_hot:
+            open_first = firsts[-1]
+            firsts, lasts = firsts[:-1], lasts[:-1]
+        else:
+            open_first = _last_run_start(voltages) + lead
+            if lead == open_first == 2 and prefix[1] == voltages[-1]:
+                open_first = 1
+
+        # Every other run is complete
+        values = extended(firsts)
+        is_peak = ((extended(firsts - 1) < values) &
+                   (extended(lasts + 1) < values))
+        starts = offset + firsts - lead
+        if lead == 2:
+            starts[firsts == 1] = self._run_start
+        middles = starts + (offset + lasts - lead - starts) // 2
+        known_from = (offset if self._run_times is None
+                      else self._run_times_start)
+        is_peak &= middles >= known_from
+        peak_indices = middles[is_peak]
+        peak_values = values[is_peak]
+        local = peak_indices - offset
+        beat_times = numpy.empty(peak_indices.size)
+        in_chunk = local >= 0
+        beat_times[in_chunk] = times[local[in_chunk]]
+        if not in_chunk.all():
+            beat_times[~in_chunk] = self._run_times[
+                peak_indices[~in_chunk] - known_from]
+
+        if self.refractory > 0 or self.min_prominence > 0:
+            peak_indices, beat_times = self._select(
+                peak_indices, beat_times, peak_values,
+                self._lows(voltages, local, in_chunk))
+
+        # Times of the open run are only needed if it could become a peak
+        run_start = (self._run_start if lead == 2 and open_first == 1
+                     else offset + open_first - lead)
+        if not open_hot:
+            self._run_times = None
+        elif run_start >= offset:
+            self._run_times = times[run_start - offset:].copy()
+            self._run_times_start = run_start
+        elif self._run_times is None:
+            self._run_times = times.copy()
+            self._run_times_start = offset
+        else:
+            self._run_times = numpy.concatenate((self._run_times, times))
+        self._prev_value = float(extended(numpy.array([open_first - 1]))[0])
+        self._run_value = voltages[-1]
+        self._run_start = run_start
+        self._offset += voltages.size
+
+        # No later candidate can fall inside the refractory period of the
+        # pending beat once the data has moved far enough past it
+        if self._pending is not None:
+            earliest = (times[-1] if self._run_times is None
+                        else self._run_times[0])
+            if earliest - self._pending[1] >= self.refractory:
+                peak_indices = numpy.append(peak_indices, self._pending[0])
+                beat_times = numpy.append(beat_times, self._pending[1])
+                self._pending = None
+        return peak_indices, beat_times
+
+    def select_candidates(self, indices, times, voltages):
+        """ Applies the prominence and refractory rules to candidate beats
+        found elsewhere in a whole recording (e.g. by feed_indices run on
+        parts of it in other processes), instead of feeding the samples.
+        The detector must not have been fed, and its remaining beat is
+        confirmed by flush, as with feed.
+
+        :param indices: Ascending array of the sample indices of the
+        candidates
+        :param times: Array of times of the candidates
+        :param voltages: Array of voltage data of the whole recording
+        :return: Numpy arrays of the sample indices and of the times of the
+        beats that could be confirmed
+        """
+        import numpy
+        indices = numpy.asarray(indices, dtype=int)
+        times = numpy.asarray(times, dtype=float)
+        if indices.size == 0 or (self.refractory <= 0 and
+                                 self.min_prominence <= 0):
+            return indices, times
+        return self._select(indices, times, voltages[indices],
+                            self._lows(voltages, indices,
+                                       numpy.ones(indices.size, dtype=bool)))
+
+    def _lows(self, voltages, local, in_chunk):
+        """ Finds the lowest voltage between each candidate and the one
+        before it, which the prominence rule needs
+
+        :param voltages: Array of voltage data for this chunk
+        :param local: Array of indices of the candidates within the chunk
+        (negative for candidates carried over from the previous chunk)
+        :param in_chunk: Boolean array marking the candidates in the chunk
+        :return: Array of the lowest voltage before each candidate, followed
+        by the lowest voltage after the last
+        """
+        import numpy
+        if self.min_prominence <= 0:
+            return numpy.full(local.size + 1, -numpy.inf)
+        bounds = numpy.concatenate(([0], numpy.maximum(local, 0)))
+        lows = numpy.minimum.reduceat(voltages, bounds)
+        lows[:-1][~in_chunk] = numpy.inf
+        return lows
+
+    def _select(self, indices, times, values, lows):
+        """ Applies the prominence and refractory rules to the candidates of
+        a chunk, one candidate at a time
+
+        :param indices: Array of sample indices of the candidates
+        :param times: Array of times of the candidates
+        :param values: Array of voltages of the candidates
+        :param lows: Array of the lowest voltage before each candidate (back
+        to the previous one), followed by the lowest voltage after the last
+        :return: Arrays of the sample indices and times of the beats that
+        were confirmed
+        """
+        import numpy
+        if self.min_prominence <= 0 and indices.size:
+            # Usually no two candidates are within one refractory period
+            # of each other, and then every one of them is a beat
+            gaps = numpy.diff(times if self._pending is None else
+                              numpy.concatenate(([self._pending[1]], times)))
+            if not (gaps < self.refractory).any():
+                kept = numpy.arange(indices.size - 1)
+                if self._pending is not None:
+                    indices = numpy.concatenate(([self._pending[0]],
+                                                 indices))
+                    times = numpy.concatenate(([self._pending[1]], times))
+                    kept = numpy.arange(indices.size - 1)
+                self._pending = (int(indices[-1]), float(times[-1]),
+                                 float(values[-1]), -numpy.inf)
+                return indices[kept], times[kept]
+        confirmed = []
+        pending = self._pending
+        base = self._base
+        for index, time, value, low in zip(indices.tolist(), times.tolist(),
+                                           values.tolist(), lows.tolist()):
+            base = min(base, low)
+            within = (pending is not None and
+                      time - pending[1] < self.refractory)
+            candidate_base = min(pending[3], base) if within else base
+            if value - candidate_base < self.min_prominence:
+                continue
+            if within:
+                if value > pending[2]:
+                    pending = (index, time, value, candidate_base)
+                    base = numpy.inf
+                continue
+            if pending is not None:
+                confirmed.append(pending)
+            pending = (index, time, value, candidate_base)
+            base = numpy.inf
+        self._pending = pending
+        self._base = min(base, float(lows[-1]))
+        return (numpy.array([beat[0] for beat in confirmed], dtype=int),
+                numpy.array([beat[1] for beat in confirmed]))
+
+    def flush(self):
+        """ Confirms the beat still inside its refractory period, once the
+        recording has ended
+
+        :return: Numpy arrays of the sample indices and of the times of the
+        remaining beat (empty if there is none)
+        """
+        import numpy
+        if self._pending is None:
+            return numpy.array([], dtype=int), numpy.array([])
+        indices = numpy.array([self._pending[0]])
+        times = numpy.array([self._pending[1]])
+        self._pending = None
+        return indices, times
+
+
+def _last_run_start(values):
+    """ Finds where the trailing run of equal values begins, looking back
+    only as far as needed
+
+    :param values: Non-empty array
+    :return: Index of the first entry of the trailing run
+    """
+    import numpy
+    end = values.size - 1
+    size = 16
+    while end > 0:
+        begin = max(0, end - size)
+        different = numpy.flatnonzero(values[begin:end] != values[-1])
+        if different.size:
+            return begin + int(different[-1]) + 1
+        end = begin
+        size *= 2
+    return 0
+
+
+class OnlineHeartRateMonitor(object):
+    """ Real-time heart rate monitor for samples that arrive in small batches.
+    Beats are detected incrementally with a threshold of 80% of the voltage
+    range inside a sliding time window, and the mean heart rate is kept for
+    that same window.  Each update costs time proportional to the batch plus
+    one vectorized pass over the window, never a re-analysis of the whole
+    recording.
+    """
+
+    def __init__(self, window=10.0, threshold=0.80,
+                 refractory=REFRACTORY_PERIOD):
+        """ Creates the monitor
+
+        :param window: Length (in seconds) of the sliding window
+        :param threshold: Relative peak threshold, as a fraction of the
+        voltage range inside the window
+        :param refractory: Shortest time (in seconds) between two beats.  A
+        beat is only counted once this much later data has arrived
+        """
+        import numpy
+        self.window = window
+        self.threshold = threshold
+        self._times = numpy.empty(1024)
+        self._voltages = numpy.empty(1024)
+        self._start = 0
+        self._end = 0
+        self._detector = StreamingBeatDetector(numpy.inf, refractory)
+        self._beats = collections.deque()
+
+    def update(self, times, voltages=None):
+        """ Adds a batch of samples, detects any newly confirmed beats and
+        slides the window forward
+
+        :param times: Array of time data for this batch (ascending, and later
+        than every previous batch), or an ECGRecord of the batch (voltages
+        is then omitted)
+        :param voltages: Array of voltage data for this batch
+        :return: Float representing the current mean heart rate in bpm
+        """
+        import numpy
+        times, voltages = record_arrays(times, voltages)[:2]
+        times = numpy.asarray(times, dtype=float)
+        voltages = numpy.asarray(voltages, dtype=float)
+        if times.size == 0:
+            return self.mean_hr_bpm
+        self._append(times, voltages)
+        window_start = times[-1] - self.window
+        self._start += int(numpy.searchsorted(
+            self._times[self._start:self._end], window_start))
+        min_voltage, max_voltage = self.voltage_extremes
+        self._detector.threshold = (self.threshold *
+                                    (max_voltage - min_voltage) + min_voltage)
+        self._beats.extend(self._detector.feed(times, voltages))
+        while self._beats and self._beats[0] < window_start:
+            self._beats.popleft()
+        return self.mean_hr_bpm
+
+    def _append(self, times, voltages):
+        """ Copies a batch into the window buffers, compacting or growing
+        them when the batch does not fit
+
+        :param times: Array of time data for this batch
+        :param voltages: Array of voltage data for this batch
+        :return: Void
+        """
+        import numpy
+        live = self._end - self._start
+        if self._end + times.size > self._times.size:
+            capacity = max(self._times.size, 2 * (live + times.size))
+            new_times = numpy.empty(capacity)
+            new_voltages = numpy.empty(capacity)
+            new_times[:live] = self._times[self._start:self._end]
+            new_voltages[:live] = self._voltages[self._start:self._end]
+            self._times, self._voltages = new_times, new_voltages
+            self._start, self._end = 0, live
+        self._times[self._end:self._end + times.size] = times
+        self._voltages[self._end:self._end + times.size] = voltages
+        self._end += times.size
+
+    @property
+    def beats(self):
+        """ Numpy array of times (floats) of the beats inside the window
+        """
+        import numpy
+        return numpy.array(self._beats)
+
+    @property
+    def num_beats(self):
+        """ Int representing the number of beats inside the window
+        """
+        return len(self._beats)
+
+    @property
+    def voltage_extremes(self):
+        """ Tuple containing min and max voltages (floats) inside the window
+        """
+        import numpy
+        voltages = self._voltages[self._start:self._end]
+        if voltages.size == 0:
+            return numpy.nan, numpy.nan
+        return float(voltages.min()), float(voltages.max())
+
+    @property
+    def duration(self):
+        """ Float representing the time (in seconds) covered by the window
+        """
+        if self._end == self._start:
+            return 0.0
+        return float(self._times[self._end - 1] - self._times[self._start])
+
+    @property
+    def mean_hr_bpm(self):
+        """ Float representing the mean heart rate in bpm inside the window,
+        NaN until the window covers a non-zero duration
+        """
+        import numpy
+        if self.duration == 0:
+            return numpy.nan
+        return self.num_beats / self.duration * 60
 
-    :param times: List of time data
-    :param voltages: List of voltage data
+
+class WindowedMetrics(object):
+    """ Heart rate, beat count and voltage extremes for every window of a
+    recording, e.g. every 10 s.  Samples are reduced to per-step voltage
+    extremes as they arrive, in one pass and in any number of chunks; each
+    window then combines the steps it spans, and its beats are counted by
+    a binary search of the beat times.  Windows overlap when the step is
+    shorter than the window.
+    """
+
+    def __init__(self, window, step=None):
+        """ Creates the accumulator
+
+        :param window: Length (in seconds) of each window
+        :param step: Time (in seconds) between the starts of consecutive
+        windows.  Must divide the window evenly; defaults to the window
+        """
+        import numpy
+        window = float(window)
+        step = window if step is None else float(step)
+        if not (window > 0 and step > 0):
+            raise ValueError("Window and step must be positive")
+        steps = window / step
+        if abs(steps - round(steps)) > 1e-9 * steps:
+            raise ValueError("The window must be a whole number of steps")
+        self.window = window
+        self.step = step
+        self.start = None
+        self.end = None
+        self._mins = numpy.empty(0)
+        self._maxs = numpy.empty(0)
+
+    def update(self, times, voltages=None):
+        """ Adds the next chunk of samples
+
+        :param times: Array of time data for this chunk (ascending, and later
+        than every previous chunk), or an ECGRecord of the chunk (voltages
+        is then omitted)
+        :param voltages: Array of voltage data for this chunk
+        :return: Void
+        """
+        import numpy
+        if isinstance(times, ecgRecord.ECGRecord):
+            for chunk in record_chunks(times):
+                self.update(*chunk)
+            return
+        times, voltages = record_arrays(times, voltages)[:2]
+        times = numpy.asarray(times, dtype=float)
+        voltages = numpy.asarray(voltages, dtype=float)
+        if times.size == 0:
+            return
+        if self.start is None:
+            self.start = float(times[0])
+        self.end = float(times[-1])
+        first = self._step_of(times[0])
+        last = self._step_of(times[-1])
+        edges = self.start + self.step * numpy.arange(first + 1, last + 1)
+        bounds = numpy.searchsorted(times, edges)
+        # The first and last steps hold at least one sample each, so only
+        # gaps in the data give empty steps
+        bounds = numpy.concatenate(([0], bounds))
+        counts = numpy.diff(numpy.concatenate((bounds, [times.size])))
+        mins = numpy.where(counts > 0,
+                           numpy.minimum.reduceat(voltages, bounds), numpy.inf)
+        maxs = numpy.where(counts > 0,
+                           numpy.maximum.reduceat(voltages, bounds),
+                           -numpy.inf)
+        if last + 1 > self._mins.size:
+            grown = last + 1 - self._mins.size
+            self._mins = numpy.concatenate((self._mins,
+                                            numpy.full(grown, numpy.inf)))
+            self._maxs = numpy.concatenate((self._maxs,
+                                            numpy.full(grown, -numpy.inf)))
+        self._mins[first:last + 1] = numpy.minimum(self._mins[first:last + 1],
+                                                   mins)
+        self._maxs[first:last + 1] = numpy.maximum(self._maxs[first:last + 1],
+                                                   maxs)
+
+    def _step_of(self, time):
+        """ Finds the step that a time falls in, the same way as the binary
+        search of the step edges does
+
+        :param time: Float time, no earlier than the start
+        :return: Int index of the step
+        """
+        index = int((time - self.start) // self.step)
+        if time >= self.start + self.step * (index + 1):
+            index += 1
+        elif index > 0 and time < self.start + self.step * index:
+            index -= 1
+        return index
+
+    def to_dict(self, beats):
+        """ Computes the metrics of every window
+
+        :param beats: Array of beat times (floats) of the whole recording
+        :return: Dictionary of the window settings and one array per metric,
+        with one entry per window: start time, duration covered, number of
+        beats, mean heart rate in bpm and voltage extremes (NaN for windows
+        without samples)
+        """
+        import numpy
+        beats = numpy.asarray(beats, dtype=float)
+        steps = int(round(self.window / self.step))
+        num_steps = self._mins.size
+        num_windows = max(num_steps - steps + 1, 1) if num_steps else 0
+        # Extremes of steps [i, i + steps), with the last windows cut short
+        mins = numpy.concatenate((self._mins, numpy.full(steps, numpy.inf)))
+        maxs = numpy.concatenate((self._maxs, numpy.full(steps, -numpy.inf)))
+        window_mins = mins[:num_windows].copy()
+        window_maxs = maxs[:num_windows].copy()
+        for shift in range(1, steps):
+            numpy.minimum(window_mins, mins[shift:shift + num_windows],
+                          out=window_mins)
+            numpy.maximum(window_maxs, maxs[shift:shift + num_windows],
+                          out=window_maxs)
+        window_mins[numpy.isinf(window_mins)] = numpy.nan
+        window_maxs[numpy.isinf(window_maxs)] = numpy.nan
+
+        starts = (numpy.empty(0) if self.start is None else
+                  self.start + self.step * numpy.arange(num_windows))
+        ends = numpy.minimum(starts + self.window,
+                             numpy.inf if self.end is None else self.end)
+        num_beats = (numpy.searchsorted(beats, starts + self.window) -
+                     numpy.searchsorted(beats, starts))
+        durations = ends - starts
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            mean_hr_bpm = numpy.where(durations > 0,
+                                      num_beats / durations * 60, numpy.nan)
+        return {"window": self.window,
+                "step": self.step,
+                "start": starts,
+                "duration": durations,
+                "num_beats": num_beats,
+                "mean_hr_bpm": mean_hr_bpm,
+                "voltage_min": window_mins,
+                "voltage_max": window_maxs}
+
+
+def windows_to_json(windows, input_filepath, windows_format="json"):
+    """ Outputs the windowed metrics as a JSON file named after the input
+    file plus a _windows suffix, next to the summary JSON file
+
+    :param windows: Dictionary of windowed metrics
+    :param input_filepath: The filepath of the inputted csv
+    :param windows_format: "json" for one object holding a list per metric,
+    or "ndjson" for one line per window holding the window settings and
+    that window's metrics
+    :return: String representing filepath of new JSON file
+    """
+    if windows_format not in WINDOWS_FORMATS:
+        raise ValueError("Unknown windows format: {}".format(windows_format))
+    json_filepath = input_filepath[:-4] + "_windows." + windows_format
+    with open(json_filepath, "w") as file:
+        if windows_format == "json":
+            write_json(windows, file)
+        else:
+            write_ndjson(windows, file)
+    logging.info("JSON file written: %s" % json_filepath)
+    return json_filepath
+
+
+def write_ndjson(columns, file):
+    """ Writes a dictionary of equal-length arrays as NDJSON, one line per
+    entry, converting only OUTPUT_CHUNK entries to Python objects at a time.
+    Scalar values of the dictionary are repeated on every line.
+
+    :param columns: Dictionary of arrays (and scalars)
+    :param file: Text file to write to
     :return: Void
     """
-    metrics = {"mean_hr_bpm": get_mean_hr_bpm(times, voltages),
-               "voltage_extremes": get_voltage_extremes(voltages),
-               "duration": get_duration(times),
-               "num_beats": get_num_beats(times, voltages),
-               "beats": get_beats_times(times, voltages).tolist()}
-    return metrics
+    import numpy
+    arrays = {key: value for key, value in columns.items()
+              if isinstance(value, numpy.ndarray)}
+    length = min([value.size for value in arrays.values()] or [0])
+    for begin in range(0, length, OUTPUT_CHUNK):
+        chunk = {key: value[begin:begin + OUTPUT_CHUNK].tolist()
+                 for key, value in arrays.items()}
+        for position in range(len(next(iter(chunk.values())))):
+            record = {key: chunk[key][position] if key in chunk else value
+                      for key, value in columns.items()}
+            file.write(json.dumps(record, default=to_json_type) + "\n")
+
+
+def stream_metrics_to_dict(filepath, end_time, chunksize, windows=None,
+                           max_gap=MAX_GAP, band=None, quality=None):
+    """ Creates the same metrics dictionary as metrics_to_dict while holding
+    only one chunk of the data file in memory at a time.  The file is read
+    twice: the first pass finds the time and voltage extremes (needed for the
+    end time check and the relative peak threshold) by merging the
+    partialMetrics.PartialMetrics of each chunk, and the second pass detects
+    the beats.
+
+    :param filepath: A String representing the path to the ECG data
+    :param end_time: Time (in seconds) at which the data should end
+    :param chunksize: Number of rows per chunk
+    :param windows: WindowedMetrics to feed the analyzed samples to during
+    the second pass.  If None, no windowed metrics are computed
+    :param max_gap: Longest run of invalid samples to fill in
+    :param band: (low, high) cutoff frequencies (in Hz) of a causal
+    band-pass filter applied before beat detection, whose state is carried
+    across chunks.  If None, nothing is filtered
+    :param quality: dataQuality.QualityReport to count the anomalies found
+    in the first pass in.  If None, they are counted in a report of their
+    own, which is logged
+    :return: Dictionary of metrics (beat times kept as a numpy array)
+    """
+    import numpy
+    try:
+        candidate_end = float(end_time)
+    except (TypeError, ValueError):
+        candidate_end = numpy.nan
+    summary = partialMetrics.PartialMetrics
+    full = summary(keep_beats=False)
+    trimmed = summary(keep_beats=False)
+    # Extremes of the filtered voltages, for the peak threshold
+    filtered_full = summary(keep_beats=False)
+    filtered_trimmed = summary(keep_beats=False)
+    trimming = True
+    # Typical step of each chunk, for gap_edges
+    steps = []
+    for time, voltage, filtered in detection_chunks(filepath, chunksize,
+                                                    max_gap, band, quality):
+        full.merge(summary.from_arrays(time, voltage, keep_beats=False))
+        if time.size > 1:
+            steps.append(typical_step(time))
+        if band is not None:
+            filtered_full.merge(summary.from_arrays(time, filtered,
+                                                    keep_beats=False))
+        if trimming:
+            past_end = numpy.flatnonzero(time > candidate_end)
+            stop = past_end[0] if past_end.size else time.size
+            trimmed.merge(summary.from_arrays(time[:stop], voltage[:stop],
+                                              keep_beats=False))
+            if band is not None:
+                filtered_trimmed.merge(summary.from_arrays(
+                    time[:stop], filtered[:stop], keep_beats=False))
+            trimming = stop == time.size
+    end_time = check_end_time(end_time, full.max_time)
+    step = float(numpy.median(steps)) if steps else None
+    extremes = full if end_time is None else trimmed
+    low, high = extremes.min_voltage, extremes.max_voltage
+    if band is not None:
+        filtered = filtered_full if end_time is None else filtered_trimmed
+        low, high = filtered.min_voltage, filtered.max_voltage
+
+    detector = StreamingBeatDetector(0.80 * (high - low) + low,
+                                     REFRACTORY_PERIOD)
+    beats = []
+    # Times of the samples on the edges of gaps, found with the last two
+    # times of the previous chunk in front of each chunk
+    edges = []
+    previous = numpy.empty(0)
+    # The anomalies were already counted in the first pass
+    for time, voltage, filtered in detection_chunks(
+            filepath, chunksize, max_gap, band, dataQuality.QualityReport()):
+        if end_time is not None:
+            past_end = numpy.flatnonzero(time > end_time)
+            if past_end.size:
+                time = time[:past_end[0]]
+                voltage = voltage[:past_end[0]]
+                filtered = filtered[:past_end[0]]
+        beats.append(detector.feed(time, filtered))
+        previous = numpy.concatenate((previous, time))
+        edges.append(previous[gap_edges(previous, max_gap, step)])
+        previous = previous[-2:]
+        if windows is not None:
+            windows.update(time, voltage)
+        if end_time is not None and past_end.size:
+            break
+    beats.append(detector.flush()[1])
+    beats = numpy.concatenate(beats)
+    beats = beats[~numpy.isin(beats, numpy.concatenate(edges + [[]]))]
+    # Beats are only final once the gap edges after them are known, so they
+    # are summarized all at once
+    return summary((extremes.min_time, extremes.max_time),
+                   (extremes.min_voltage, extremes.max_voltage),
+                   beats).to_dict()
+
+
+def detection_chunks(filepath, chunksize, max_gap=MAX_GAP, band=None,
+                     quality=None):
+    """ Reads a data file in cleaned chunks, along with the voltages that
+    beats are detected on
+
+    :param filepath: A String representing the path to the ECG data
+    :param chunksize: Number of rows per chunk
+    :param max_gap: Longest run of invalid samples to fill in
+    :param band: (low, high) cutoff frequencies (in Hz) of a causal
+    band-pass filter.  If None, beats are detected on the voltages as they
+    are
+    :param quality: dataQuality.QualityReport to count the anomalies found
+    in (see clean_chunks)
+    :return: Generator of (time, voltage, detection voltage) chunks
+    """
+    chunks = clean_chunks(read_chunks(filepath, chunksize), max_gap, quality)
+    if band is None:
+        return ((time, voltage, voltage) for time, voltage in chunks)
+    return bandpassFilter.filter_chunks(chunks, band)
+
+
+# PARALLEL ANALYSIS FUNCTIONS
+def split_csv(filepath, num_segments):
+    """ Splits a csv file into byte ranges of about equal size that start
+    and end on line boundaries
+
+    :param filepath: A String representing the path to the ECG data (csv
+    file)
+    :param num_segments: Number of ranges wanted
+    :return: List of byte offsets, from 0 to the file size, bounding the
+    ranges (fewer than num_segments + 1 for very short files)
+    """
+    size = os.path.getsize(filepath)
+    offsets = [0]
+    with open(filepath, "rb") as file:
+        for segment in range(1, num_segments):
+            file.seek(max(size * segment // num_segments - 1, offsets[-1]))
+            file.readline()
+            if file.tell() > offsets[-1] and file.tell() < size:
+                offsets.append(file.tell())
+    offsets.append(size)
+    return offsets
+
+
+def read_segment(filepath, begin, end, rows):
+    """ Reads a byte range of a csv file along with the rows around it
+
+    :param filepath: A String representing the path to the ECG data (csv
+    file)
+    :param begin: Byte offset of the first line of the range
+    :param end: Byte offset just past the last line of the range
+    :param rows: Number of non-blank lines to read on either side of the
+    range (fewer at either end of the file)
+    :return: Bytes of the lines before the range, of the range, and of the
+    lines after it
+    """
+    size = os.path.getsize(filepath)
+    block = 64 * rows + 64
+    with open(filepath, "rb") as file:
+        while True:
+            start = max(begin - block, 0)
+            file.seek(start)
+            lines = file.read(begin - start).splitlines(True)
+            # The first line read may be cut off
+            if start > 0:
+                lines = lines[1:]
+            lines = [line for line in lines if line.strip()]
+            if len(lines) >= rows or start == 0:
+                break
+            block *= 4
+        before = b"".join(lines[-rows:] if rows else [])
+        file.seek(begin)
+        data = file.read(end - begin)
+        block = 64 * rows + 64
+        while True:
+            file.seek(end)
+            lines = file.read(block).splitlines(True)
+            if end + block < size:
+                # The last line read may be cut off
+                lines = lines[:-1]
+            lines = [line for line in lines if line.strip()]
+            if len(lines) >= rows or end + block >= size:
+                break
+            block *= 4
+        after = b"".join(lines[:rows])
+    return before, data, after
+
+
+def clean_segment(filepath, begin, end, max_gap, shared_dir):
+    """ Parses, converts, interpolates and clips one byte range of a csv
+    file inside a worker process.  Enough rows on either side are read for
+    every row of the range to be interpolated exactly as it would be with
+    the whole file in memory; only the range's own rows are kept, and only
+    their anomalies are counted.
+
+    :param filepath: A String representing the path to the ECG data (csv
+    file)
+    :param begin: Byte offset of the first line of the range
+    :param end: Byte offset just past the last line of the range
+    :param max_gap: Longest run of invalid samples to fill in
+    :param shared_dir: Directory (in shared memory where available) to
+    write the cleaned rows to
+    :return: String filepath of a (2, n) .npy file of the cleaned times and
+    voltages, and the dataQuality.QualityReport of the range
+    """
+    import numpy
+    # Filling a row may take valid rows up to max_gap + 1 rows away, whose
+    # times may in turn be filled from rows as far again
+    parts = read_segment(filepath, begin, end, 2 * max_gap + 2)
+    times = []
+    voltages = []
+    time_invalid = []
+    voltage_invalid = []
+    quality = dataQuality.QualityReport()
+    for position, part in enumerate(parts):
+        if part.strip():
+            time, voltage = read_csv_dataframe(io.BytesIO(part))
+        else:
+            time = voltage = numpy.array([], dtype=float)
+        # The rows on either side belong to other workers' reports
+        report = quality if position == 1 else dataQuality.QualityReport()
+        time, invalid = convert_to_floats(time, report, "time")
+        times.append(time)
+        time_invalid.append(invalid)
+        voltage, invalid = convert_to_floats(voltage, report, "voltage")
+        voltages.append(voltage)
+        voltage_invalid.append(invalid)
+    first = times[0].size
+    stop = first + times[1].size
+    new_times, new_voltages = fill_invalid(
+        numpy.concatenate(times), numpy.concatenate(voltages),
+        numpy.concatenate(time_invalid), numpy.concatenate(voltage_invalid),
+        max_gap)
+    new_times = new_times[first:stop]
+    new_voltages = new_voltages[first:stop]
+    keep = numpy.isfinite(new_times) & numpy.isfinite(new_voltages)
+    add_dropped_rows(quality, keep.size - numpy.count_nonzero(keep))
+    path = os.path.join(shared_dir, "segment_{}.npy".format(begin))
+    numpy.save(path, numpy.vstack((new_times[keep],
+                                   voltage_clip(new_voltages[keep],
+                                                quality))))
+    return path, quality
+
+
+def parallel_preprocess_file(filepath, workers, max_gap=MAX_GAP,
+                             quality=None):
+    """ Reads in a single-lead csv file and runs every preprocessing step on
+    it, with the file split into one byte range per worker process.  The
+    workers hand their cleaned rows back through .npy files in shared
+    memory rather than pickling them, and the result is identical to that
+    of preprocess_file.
+
+    :param filepath: A String representing the path to the ECG data (csv
+    file)
+    :param workers: Number of worker processes
+    :param max_gap: Longest run of invalid samples to fill in
+    :param quality: dataQuality.QualityReport to merge the reports of the
+    workers into.  If None, they are merged into a report of their own,
+    which is logged
+    :return: Arrays of cleaned time and voltage data
+    """
+    import numpy
+    from concurrent.futures import ProcessPoolExecutor
+    offsets = split_csv(filepath, workers)
+    shared_dir = tempfile.mkdtemp(dir=SHARED_DIR if os.path.isdir(
+        SHARED_DIR) else None)
+    try:
+        with ProcessPoolExecutor(workers, initializer=configure_logging,
+                                 initargs=('a',)) as pool:
+            results = list(pool.map(
+                clean_segment, itertools.repeat(filepath), offsets[:-1],
+                offsets[1:], itertools.repeat(max_gap),
+                itertools.repeat(shared_dir)))
+        segments = [numpy.load(path, mmap_mode="r") for path, _ in results]
+        time = numpy.concatenate([segment[0] for segment in segments])
+        voltage = numpy.concatenate([segment[1] for segment in segments])
+        del segments
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+    with dataQuality.collecting(quality) as quality:
+        for _, report in results:
+            quality.merge(report)
+    logging.info("Csv file read and cleaned in %d segments"
+                 % len(results))
+    return time, voltage
 
 
-def dict_to_json(metrics, input_filepath):
+def detect_segment(shared_path, begin, stop, threshold, max_gap, step):
+    """ Finds the candidate beats (local maxima above the threshold) of one
+    range of samples inside a worker process.  The range starts and ends on
+    samples below the threshold, so no candidate straddles its edges.
+
+    :param shared_path: String filepath of a (2, n) .npy file of the times
+    and detection voltages of the whole recording
+    :param begin: Index of the first sample of the range
+    :param stop: Index of the last sample of the range (which the next range
+    starts on)
+    :param threshold: Absolute voltage that a beat must exceed
+    :param max_gap: Longest run of missing samples that is not a gap
+    :param step: Typical step between the samples of the whole recording
+    (see gap_edges)
+    :return: Arrays of the sample indices of the candidates, and of whether
+    each lies on the edge of a gap
+    """
+    import numpy
+    data = numpy.load(shared_path, mmap_mode="r")
+    detector = StreamingBeatDetector(threshold)
+    indices = detector.feed_indices(data[0, begin:stop + 1],
+                                    data[1, begin:stop + 1])[0] + begin
+    # Whether a sample bounds a gap depends on the two steps on either
+    # side of it
+    first = max(begin - 2, 0)
+    edges = gap_edges(data[0, first:stop + 3], max_gap,
+                      step)[indices - first]
+    return indices, edges
+
+
+def parallel_beat_indices(analysis, workers):
+    """ Detects the beats of an ECGAnalysis with the recording split into
+    one range of samples per worker process.  The ranges overlap by one
+    sample below the peak threshold, on which no candidate beat can lie, so
+    every candidate is found by exactly one worker; the candidates are then
+    stitched together, and the refractory rule is applied to all of them in
+    order, as StreamingBeatDetector does.  The beats are identical to those
+    of analysis.beat_indices.
+
+    :param analysis: ECGAnalysis of a single-lead recording
+    :param workers: Number of worker processes
+    :return: Numpy array of the sample indices of the beats
+    """
+    import numpy
+    from concurrent.futures import ProcessPoolExecutor
+    voltages = analysis.detection_voltages
+    if voltages.size == 0:
+        return numpy.array([], dtype=int)
+    threshold = analysis.detection_threshold
+    # Each range ends on the first sample below the threshold from an even
+    # split on
+    cool = voltages <= threshold
+    bounds = [0]
+    for split in range(1, workers):
+        target = max(voltages.size * split // workers, bounds[-1] + 1)
+        if cool[target:].any():
+            bounds.append(target + int(numpy.argmax(cool[target:])))
+    bounds = sorted(set(bounds + [voltages.size - 1]))
+    shared_dir = tempfile.mkdtemp(dir=SHARED_DIR if os.path.isdir(
+        SHARED_DIR) else None)
+    try:
+        shared_path = os.path.join(shared_dir, "detection.npy")
+        numpy.save(shared_path, numpy.vstack((analysis.times, voltages)))
+        with ProcessPoolExecutor(workers, initializer=configure_logging,
+                                 initargs=('a',)) as pool:
+            results = list(pool.map(
+                detect_segment, itertools.repeat(shared_path), bounds[:-1],
+                bounds[1:], itertools.repeat(threshold),
+                itertools.repeat(analysis.max_gap),
+                itertools.repeat(typical_step(analysis.times))))
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+    indices = numpy.concatenate([result[0] for result in results] +
+                                [numpy.array([], dtype=int)])
+    edges = numpy.concatenate([result[1] for result in results] +
+                              [numpy.array([], dtype=bool)])
+    indices, unique = numpy.unique(indices, return_index=True)
+    edges = edges[unique]
+    detector = StreamingBeatDetector(threshold, analysis.refractory,
+                                     analysis.min_prominence)
+    beats = detector.select_candidates(indices, analysis.times[indices],
+                                       voltages)[0]
+    beats = numpy.concatenate((beats, detector.flush()[0]))
+    return beats[~edges[numpy.searchsorted(indices, beats)]]
+
+
+def parallel_metrics_to_dict(times, voltages=None, workers=2,
+                             max_gap=MAX_GAP, band=None):
+    """ Creates the same metrics dictionary as metrics_to_dict, with beat
+    detection spread across worker processes (see parallel_beat_indices)
+
+    :param times: Array of time data, or an ECGRecord holding both the time
+    and voltage data (voltages is then omitted)
+    :param voltages: Array of voltage data
+    :param workers: Number of worker processes
+    :param max_gap: Longest run of missing samples that is not a gap (see
+    gap_edges)
+    :param band: (low, high) cutoff frequencies (in Hz) of a band-pass
+    filter applied before beat detection.  If None, nothing is filtered
+    :return: Dictionary of metrics (beat times kept as a numpy array)
+    """
+    analysis = ECGAnalysis(times, voltages, max_gap=max_gap, band=band)
+    beat_indices = parallel_beat_indices(analysis, workers)
+    return ECGAnalysis(analysis.record, max_gap=max_gap,
+                       band=band, time_range=analysis.time_range,
+                       voltage_extremes=analysis.voltage_extremes,
+                       beat_indices=beat_indices).to_dict()
+
+
+def dict_to_json(metrics, input_filepath, beats_format="json"):
     """ Outputs metrics dictionary as a JSON file with the same name (and
     directory) as the original csv file from the beginning of the pipeline.
+    The file is written piece by piece, so arrays such as the beat times are
+    never converted to Python lists in full.
 
     :param metrics: Dictionary of metrics
     :param input_filepath: The filepath of the inputted csv
+    :param beats_format: "json" to write the beat times into the JSON file,
+    or "npy" to write them to a .npy sidecar file (one per lead) that the
+    JSON file references by name
     :return: String representing filepath of new JSON file
     """
+    if beats_format not in BEATS_FORMATS:
+        raise ValueError("Unknown beats format: {}".format(beats_format))
     json_filepath = input_filepath[:-3] + "json"
+    if beats_format == "npy":
+        if "leads" in metrics:
+            leads = collections.OrderedDict(
+                (name, beats_to_npy(lead, input_filepath, number))
+                for number, (name, lead) in enumerate(
+                    metrics["leads"].items(), 1))
+            metrics = dict(metrics, leads=leads)
+        else:
+            metrics = beats_to_npy(metrics, input_filepath)
     with open(json_filepath, "w") as file:
-        json.dump(metrics, file)
+        write_json(metrics, file)
     logging.info("JSON file written: %s" % json_filepath)
     return json_filepath
 
 
+def beats_to_npy(metrics, input_filepath, lead=None):
+    """ Saves the beat times of one set of metrics to a .npy sidecar file
+    named after the input file plus a _beats suffix (and the lead number)
+
+    :param metrics: Dictionary of metrics
+    :param input_filepath: The filepath of the inputted csv
+    :param lead: Int number of the lead, or None for a single-lead recording
+    :return: Copy of the metrics whose beats entry names the sidecar file
+    (relative to the JSON file), its dtype and its number of beats
+    """
+    import numpy
+    beats = numpy.asarray(metrics["beats"], dtype=float)
+    suffix = "_beats.npy" if lead is None else "_beats_{}.npy".format(lead)
+    npy_filepath = input_filepath[:-4] + suffix
+    numpy.save(npy_filepath, beats)
+    logging.info("Beat times written: %s" % npy_filepath)
+    return dict(metrics, beats={"file": os.path.basename(npy_filepath),
+                                "dtype": beats.dtype.str,
+                                "count": beats.size})
+
+
+def write_json(value, file):
+    """ Writes a value as JSON, converting only OUTPUT_CHUNK entries of each
+    one-dimensional array to Python objects at a time.  The text is the same
+    as that of json.dump.
+
+    :param value: Dictionary, array or other value that json can serialize
+    (with to_json_type)
+    :param file: Text file to write to
+    :return: Void
+    """
+    import numpy
+    if isinstance(value, dict):
+        file.write("{")
+        for position, (key, item) in enumerate(value.items()):
+            if position:
+                file.write(", ")
+            file.write(json.dumps(str(key)) + ": ")
+            write_json(item, file)
+        file.write("}")
+    elif isinstance(value, numpy.ndarray) and value.ndim == 1:
+        file.write("[")
+        for begin in range(0, value.size, OUTPUT_CHUNK):
+            if begin:
+                file.write(", ")
+            file.write(json.dumps(
+                value[begin:begin + OUTPUT_CHUNK].tolist())[1:-1])
+        file.write("]")
+    else:
+        json.dump(value, file, default=to_json_type)
+
+
+def to_json_type(value):
+    """ Converts numpy arrays and scalars into their native Python
+    equivalents so that they can be written by the json module.
+
+    :param value: Object that the json module could not serialize
+    :return: List or Python scalar equivalent of the value, raises TypeError
+    for any other type
+    """
+    import numpy
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError("Object of type {} is not JSON serializable"
+                    .format(type(value).__name__))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("filepath", help="Filepath of the data file")
+    parser.add_argument("filepath", help="Filepath of the data file (csv, or "
+                                         "raw binary with a .hdr sidecar)")
     parser.add_argument("endtime", help="Time (in seconds) at which the "
                                         "data should end")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream the file this many rows at a time "
+                             "instead of reading it all into memory")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory in which to cache preprocessed "
+                             "recordings between runs")
+    parser.add_argument("--timing", action="store_true",
+                        help="Write a per-stage timing report (wall time, "
+                             "CPU time, peak memory, rows) next to the "
+                             "metrics JSON file")
+    parser.add_argument("--cprofile", default=None,
+                        help="Filepath to dump cProfile statistics to")
+    parser.add_argument("--window", type=float, default=None,
+                        help="Also write heart rate, beat count and voltage "
+                             "extremes for every window of this many "
+                             "seconds to a _windows.json file")
+    parser.add_argument("--window-step", type=float, default=None,
+                        help="Seconds between the starts of consecutive "
+                             "windows (defaults to --window; smaller steps "
+                             "give overlapping windows)")
+    parser.add_argument("--start", type=float, default=None,
+                        help="Time (in seconds) at which the data should "
+                             "start; csv files are then read only around "
+                             "[start, endtime] through a .idx time index")
+    parser.add_argument("--index-every", type=int, default=None,
+                        help="Rows between two entries of a new .idx time "
+                             "index (default {})"
+                             .format(timeIndex.DEFAULT_EVERY))
+    parser.add_argument("--beats-format", choices=BEATS_FORMATS,
+                        default="json",
+                        help="Write the beat times into the metrics JSON "
+                             "file, or to a _beats.npy file that it names")
+    parser.add_argument("--windows-format", choices=WINDOWS_FORMATS,
+                        default="json",
+                        help="Write the windowed metrics as one JSON object "
+                             "or as NDJSON with one line per window")
+    parser.add_argument("--dtype", choices=("float64", "float32"),
+                        default="float64",
+                        help="Storage type of the voltages held in memory; "
+                             "float32 halves their size")
+    parser.add_argument("--time-repair", choices=TIME_REPAIRS,
+                        default="sort",
+                        help="Sort (and deduplicate) times that are out of "
+                             "order, only drop duplicate and negative "
+                             "times, or reject any bad time data")
+    parser.add_argument("--max-gap", type=int, default=MAX_GAP,
+                        help="Longest run of missing or non-numeric samples "
+                             "to fill in by interpolation; longer runs are "
+                             "dropped and excluded from beat detection")
+    parser.add_argument("--bandpass", type=float, nargs=2, default=None,
+                        metavar=("LOW", "HIGH"),
+                        help="Remove baseline wander and noise with a "
+                             "band-pass filter between these frequencies "
+                             "(in Hz, e.g. {} {}) before beat detection"
+                             .format(*bandpassFilter.BANDPASS))
+    parser.add_argument("--result-cache", default=None,
+                        help="Directory in which to cache analysis results "
+                             "by file contents and parameters; a cached "
+                             "result also answers shorter end times")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Clean and analyze the recording in this many "
+                             "worker processes")
     args = parser.parse_args()
-    main(args.filepath, args.endtime)
+    main(args.filepath, args.endtime, chunksize=args.chunksize,
+         cache_dir=args.cache_dir, timing=args.timing,
+         profile_filepath=args.cprofile, window=args.window,
+         step=args.window_step, start=args.start,
+         index_every=args.index_every, beats_format=args.beats_format,
+         windows_format=args.windows_format, dtype=args.dtype,
+         time_repair=args.time_repair, max_gap=args.max_gap,
+         band=args.bandpass, result_cache_dir=args.result_cache,
+         workers=args.workers)
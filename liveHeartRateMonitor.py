@@ -0,0 +1,382 @@
+import logging
+import json
+import argparse
+import asyncio
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+import heartRateMonitor
+
+READ_BYTES = 64 * 1024
+
+
+class Patient(object):
+    """ Rolling state of one monitored patient: an OnlineHeartRateMonitor fed
+    with every valid sample received for that patient so far.  Samples that
+    are not numbers, or that do not come after the latest accepted sample,
+    are dropped and counted.
+    """
+
+    def __init__(self, patient_id, window=10.0):
+        """ Creates the patient state
+
+        :param patient_id: String identifying the patient
+        :param window: Length (in seconds) of the sliding window
+        """
+        self.patient_id = patient_id
+        self.monitor = heartRateMonitor.OnlineHeartRateMonitor(window)
+        self.lock = asyncio.Lock()
+        self.last_time = -math.inf
+        self.num_samples = 0
+        self.num_dropped = 0
+
+    def update(self, times, voltages):
+        """ Feeds a batch of samples to the monitor.  Runs on an executor
+        thread, never on the event loop.
+
+        :param times: Array of time data for this batch
+        :param voltages: Array of voltage data for this batch
+        :return: Float representing the current mean heart rate in bpm
+        """
+        import numpy
+        times = numpy.asarray(times, dtype=float)
+        voltages = numpy.asarray(voltages, dtype=float)
+        valid = numpy.isfinite(times) & numpy.isfinite(voltages)
+        times, voltages = times[valid], voltages[valid]
+        # Keep only samples later than every sample before them
+        previous = numpy.maximum.accumulate(
+            numpy.concatenate(([self.last_time], times)))[:-1]
+        ascending = times > previous
+        self.num_dropped += valid.size - int(ascending.sum())
+        times, voltages = times[ascending], voltages[ascending]
+        if times.size:
+            self.last_time = times[-1]
+            self.num_samples += times.size
+        return self.monitor.update(times,
+                                   heartRateMonitor.voltage_clip(voltages))
+
+    def update_lines(self, lines):
+        """ Parses "time,voltage" lines and feeds them to the monitor
+
+        :param lines: List of bytes, one csv row each
+        :return: Float representing the current mean heart rate in bpm
+        """
+        return self.update(*parse_lines(lines))
+
+    def to_dict(self):
+        """ Collects the rolling metrics of the patient
+
+        :return: Dictionary with the same fields as metrics_to_dict, computed
+        over the sliding window, plus sample counts
+        """
+        return {"mean_hr_bpm": self.monitor.mean_hr_bpm,
+                "voltage_extremes": self.monitor.voltage_extremes,
+                "duration": self.monitor.duration,
+                "num_beats": self.monitor.num_beats,
+                "beats": self.monitor.beats,
+                "num_samples": self.num_samples,
+                "num_dropped": self.num_dropped}
+
+
+def parse_lines(lines):
+    """ Casts "time,voltage" rows as floats
+
+    :param lines: List of bytes (or strings), one csv row each
+    :returns: Float64 arrays containing time and voltage values,
+    respectively; entries that are not numbers are NaN
+    """
+    import numpy
+    time = []
+    voltage = []
+    for line in lines:
+        if not line.strip():
+            continue
+        fields = line.split(b"," if isinstance(line, bytes) else ",")
+        fields = fields + [""] * (2 - len(fields))
+        time.append(heartRateMonitor.parse_float(fields[0]))
+        voltage.append(heartRateMonitor.parse_float(fields[1]))
+    return numpy.array(time, dtype=float), numpy.array(voltage, dtype=float)
+
+
+class LiveMonitor(object):
+    """ Event-loop front end that follows many patients at once.  Each source
+    (a TCP connection, a pipe or a replayed csv file) is read by its own
+    coroutine, and all parsing and beat detection runs on a thread pool so
+    the loop only moves bytes.  Batches for one patient are applied in
+    order; different patients are updated concurrently.
+    """
+
+    def __init__(self, window=10.0, workers=None):
+        """ Creates the monitor
+
+        :param window: Length (in seconds) of each patient's sliding window
+        :param workers: Number of executor threads (defaults to the CPU
+        count)
+        """
+        self.window = window
+        self.patients = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers or
+                                           os.cpu_count() or 1)
+
+    def patient(self, patient_id):
+        """ Looks up a patient, registering new ones
+
+        :param patient_id: String identifying the patient
+        :returns: The Patient
+        """
+        if patient_id not in self.patients:
+            logging.info("Monitoring patient %s" % patient_id)
+            self.patients[patient_id] = Patient(patient_id, self.window)
+        return self.patients[patient_id]
+
+    async def ingest(self, patient_id, function, *args):
+        """ Runs one update of a patient on the executor
+
+        :param patient_id: String identifying the patient
+        :param function: Unbound Patient method to run (Patient.update or
+        Patient.update_lines)
+        :param args: Arguments of the method
+        :returns: Float representing the current mean heart rate in bpm
+        """
+        patient = self.patient(patient_id)
+        loop = asyncio.get_event_loop()
+        async with patient.lock:
+            return await loop.run_in_executor(self.executor, function,
+                                              patient, *args)
+
+    async def read_stream(self, patient_id, reader):
+        """ Follows a stream of "time,voltage" lines until it closes
+
+        :param patient_id: String identifying the patient
+        :param reader: asyncio.StreamReader of the feed
+        :returns: Void
+        """
+        remainder = b""
+        while True:
+            data = await reader.read(READ_BYTES)
+            if not data:
+                break
+            lines = (remainder + data).split(b"\n")
+            remainder = lines.pop()
+            if lines:
+                await self.ingest(patient_id, Patient.update_lines, lines)
+        if remainder:
+            await self.ingest(patient_id, Patient.update_lines, [remainder])
+        logging.info("Feed of patient %s closed" % patient_id)
+
+    async def handle_connection(self, reader, writer):
+        """ Serves one TCP feed, whose first line names the patient and
+        whose following lines are "time,voltage" samples
+
+        :param reader: asyncio.StreamReader of the connection
+        :param writer: asyncio.StreamWriter of the connection
+        :returns: Void
+        """
+        try:
+            patient_id = (await reader.readline()).decode().strip()
+            if not patient_id:
+                logging.warning("Feed closed without a patient id")
+                return
+            await self.read_stream(patient_id, reader)
+        except (ConnectionError, UnicodeDecodeError) as error:
+            logging.error("Feed failed: %s" % error)
+        finally:
+            writer.close()
+
+    async def replay_csv(self, patient_id, filepath, speed=1.0,
+                         batch_seconds=0.25):
+        """ Plays a csv recording back as a live feed
+
+        :param patient_id: String identifying the patient
+        :param filepath: A String representing the path to the ECG data (csv
+        file)
+        :param speed: Playback speed relative to real time; math.inf sends
+        the batches as fast as they are analyzed
+        :param batch_seconds: Recording time (in seconds) sent per batch
+        :returns: Void
+        """
+        import numpy
+        loop = asyncio.get_event_loop()
+        times, voltages = await loop.run_in_executor(
+            self.executor, heartRateMonitor.extract_file, filepath)
+        times = numpy.asarray(times, dtype=float)
+        voltages = numpy.asarray(voltages, dtype=float)
+        if times.size == 0:
+            return
+        # Pace by the latest valid time so far, which is defined even when
+        # some time entries are missing
+        clock = numpy.fmax.accumulate(times)
+        first = clock[numpy.isfinite(clock)][:1]
+        first = float(first[0]) if first.size else 0.0
+        last = numpy.nanmax(clock) if numpy.isfinite(clock).any() else first
+        count = int((last - first) // batch_seconds) + 1
+        edges = first + batch_seconds * numpy.arange(1, count + 1)
+        stops = numpy.searchsorted(clock, edges, side="right")
+        stops[-1:] = times.size
+        start_time = loop.time()
+        begin = 0
+        for edge, stop in zip(edges, stops):
+            if speed != math.inf:
+                delay = start_time + (edge - first) / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if stop > begin:
+                await self.ingest(patient_id, Patient.update,
+                                  times[begin:stop], voltages[begin:stop])
+            begin = stop
+
+    async def snapshot(self):
+        """ Collects the rolling metrics of every patient
+
+        :returns: Dictionary mapping patient ids to their metrics
+        """
+        metrics = {}
+        for patient_id, patient in list(self.patients.items()):
+            async with patient.lock:
+                metrics[patient_id] = patient.to_dict()
+        return metrics
+
+    async def write_snapshot(self, output_filepath):
+        """ Writes the rolling metrics of every patient to a JSON file,
+        replacing it atomically
+
+        :param output_filepath: Path to the JSON file
+        :returns: Void
+        """
+        metrics = await self.snapshot()
+        temporary = output_filepath + ".tmp"
+        with open(temporary, "w") as outfile:
+            json.dump(metrics, outfile, default=heartRateMonitor.to_json_type)
+        os.replace(temporary, output_filepath)
+
+    async def report(self, output_filepath, interval=1.0):
+        """ Rewrites the snapshot file every interval seconds until
+        cancelled
+
+        :param output_filepath: Path to the JSON file
+        :param interval: Seconds between snapshots
+        :returns: Void
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.write_snapshot(output_filepath)
+
+    def close(self):
+        """ Shuts down the executor
+
+        :returns: Void
+        """
+        self.executor.shutdown()
+
+
+def replay_ids(filepaths, copies=1):
+    """ Names the patients of replayed files after the files
+
+    :param filepaths: List of csv files to replay
+    :param copies: Number of simultaneous feeds to replay per file
+    :returns: List of (patient id, filepath) tuples
+    """
+    feeds = []
+    for filepath in filepaths:
+        name = os.path.splitext(os.path.basename(filepath))[0]
+        for copy in range(copies):
+            patient_id = name if copies == 1 else "%s-%d" % (name, copy)
+            feeds.append((patient_id, filepath))
+    return feeds
+
+
+async def run(monitor, host=None, port=None, replays=(), speed=1.0,
+              output_filepath="live.json", interval=1.0):
+    """ Runs the TCP listener and the replayed feeds.  Returns once every
+    replay has finished if no port is given; otherwise serves until
+    cancelled.
+
+    :param monitor: The LiveMonitor
+    :param host: Host name or address to listen on
+    :param port: Port to listen on, or None for no listener
+    :param replays: List of (patient id, filepath) tuples to replay
+    :param speed: Playback speed of the replays relative to real time
+    :param output_filepath: Path to the snapshot JSON file
+    :param interval: Seconds between snapshots
+    :returns: Void
+    """
+    reporter = asyncio.ensure_future(monitor.report(output_filepath,
+                                                    interval))
+    server = None
+    try:
+        if port is not None:
+            server = await asyncio.start_server(monitor.handle_connection,
+                                                host, port)
+            logging.info("Listening for feeds on %s:%d"
+                         % server.sockets[0].getsockname()[:2])
+        await asyncio.gather(*[monitor.replay_csv(patient_id, filepath,
+                                                  speed)
+                               for patient_id, filepath in replays])
+        if server is not None:
+            # Serve until cancelled
+            await asyncio.Event().wait()
+    finally:
+        reporter.cancel()
+        if server is not None:
+            server.close()
+        await monitor.write_snapshot(output_filepath)
+
+
+def main(host="127.0.0.1", port=None, replay=(), copies=1, speed=1.0,
+         output_filepath="live.json", interval=1.0, window=10.0,
+         workers=None):
+    """ Driver function that follows live ECG feeds until they end or the
+    program is interrupted
+
+    :param host: Host name or address to listen on
+    :param port: Port to listen on, or None for no listener
+    :param replay: List of csv files to play back as live feeds
+    :param copies: Number of simultaneous feeds to replay per file
+    :param speed: Playback speed of the replays relative to real time
+    :param output_filepath: Path to the snapshot JSON file
+    :param interval: Seconds between snapshots
+    :param window: Length (in seconds) of each patient's sliding window
+    :param workers: Number of executor threads (defaults to the CPU count)
+    :returns: Void
+    """
+    heartRateMonitor.configure_logging()
+    monitor = LiveMonitor(window, workers)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(run(monitor, host, port,
+                                    replay_ids(replay, copies), speed,
+                                    output_filepath, interval))
+    except KeyboardInterrupt:
+        loop.run_until_complete(monitor.write_snapshot(output_filepath))
+    finally:
+        monitor.close()
+        loop.close()
+        logging.info("Followed %d patients" % len(monitor.patients))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Host name or address to listen on")
+    parser.add_argument("--port", type=int, default=None,
+                        help="Port to listen on for TCP feeds; each feed "
+                             "sends the patient id, then time,voltage lines")
+    parser.add_argument("--replay", nargs="*", default=[],
+                        help="Csv files to play back as live feeds")
+    parser.add_argument("--copies", type=int, default=1,
+                        help="Number of simultaneous feeds per replayed file")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Playback speed relative to real time")
+    parser.add_argument("--output", default="live.json",
+                        help="Path to the snapshot JSON file")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Seconds between snapshots")
+    parser.add_argument("--window", type=float, default=10.0,
+                        help="Length in seconds of the sliding window")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of executor threads (defaults to the "
+                             "number of CPUs)")
+    args = parser.parse_args()
+    main(args.host, args.port, args.replay, args.copies, args.speed,
+         args.output, args.interval, args.window, args.workers)
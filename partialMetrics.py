@@ -0,0 +1,216 @@
+import math
+
+
+class PartialMetrics(object):
+    """ Summary metrics of one range of samples, in a form that can be merged
+    with the summary of the range that follows it.  Besides the time and
+    voltage extremes and the beat count, it keeps the first and last beat
+    times and running statistics of the RR intervals (the times between
+    consecutive beats): their count, mean and sum of squared deviations, and
+    the sum of squared differences between successive intervals.  Merging
+    two summaries costs the same however long their ranges are, and gives
+    the summary of the joined range, including the interval that bridges the
+    two; the heart rate variability figures (SDNN and RMSSD) follow from it
+    without another pass over the beats.  The beat times themselves are only
+    kept if asked for.
+
+    Merging is associative, so chunks, segments or files may be reduced in
+    any grouping, but not commutative: the ranges must be merged in time
+    order.  A new PartialMetrics (with no arguments) summarizes no samples,
+    and merging it changes nothing.
+    """
+
+    def __init__(self, time_range=None, voltage_extremes=None, beats=None,
+                 keep_beats=True):
+        """ Creates the summary of one range of samples
+
+        :param time_range: Tuple of the first and last times of the range,
+        or None if it holds no samples
+        :param voltage_extremes: Tuple containing min and max voltages of the
+        range, or None if it holds no samples
+        :param beats: Array of the ascending times of the beats in the
+        range, or None if there are none
+        :param keep_beats: True to keep the beat times, so that merged
+        summaries can list every beat
+        """
+        import numpy
+        self.keep_beats = keep_beats
+        self.min_time, self.max_time = (math.inf, -math.inf) \
+            if time_range is None else map(float, time_range)
+        self.min_voltage, self.max_voltage = (math.inf, -math.inf) \
+            if voltage_extremes is None else map(float, voltage_extremes)
+        beats = numpy.empty(0) if beats is None else numpy.asarray(
+            beats, dtype=float)
+        self.num_beats = int(beats.size)
+        self.first_beat = float(beats[0]) if beats.size else None
+        self.last_beat = float(beats[-1]) if beats.size else None
+        intervals = numpy.diff(beats)
+        self.num_intervals = int(intervals.size)
+        self.mean_interval = float(intervals.mean()) if intervals.size \
+            else 0.0
+        self.interval_squares = float(
+            ((intervals - self.mean_interval) ** 2).sum())
+        self.first_interval = float(intervals[0]) if intervals.size \
+            else None
+        self.last_interval = float(intervals[-1]) if intervals.size \
+            else None
+        self.successive_squares = float((numpy.diff(intervals) ** 2).sum())
+        # Arrays of beat times, joined only when the beats are asked for
+        self._beats = [beats] if keep_beats and beats.size else []
+
+    @classmethod
+    def from_arrays(cls, times=None, voltages=None, beats=None,
+                    keep_beats=True):
+        """ Creates the summary of one range of samples from its data
+
+        :param times: Array of time data of the range, or None
+        :param voltages: Array of voltage data of the range, or None
+        :param beats: Array of the ascending times of the beats in the
+        range, or None if there are none
+        :param keep_beats: True to keep the beat times
+        :return: PartialMetrics
+        """
+        import numpy
+        time_range = None
+        voltage_extremes = None
+        if times is not None and len(times):
+            times = numpy.asarray(times, dtype=float)
+            time_range = (times.min(), times.max())
+        if voltages is not None and len(voltages):
+            voltages = numpy.asarray(voltages, dtype=float)
+            voltage_extremes = (voltages.min(), voltages.max())
+        return cls(time_range, voltage_extremes, beats, keep_beats)
+
+    def merge(self, other):
+        """ Merges the summary of the range that follows this one into this
+        summary
+
+        :param other: PartialMetrics of a later range of samples
+        :return: This PartialMetrics, now summarizing both ranges
+        """
+        self.min_time = min(self.min_time, other.min_time)
+        self.max_time = max(self.max_time, other.max_time)
+        self.min_voltage = min(self.min_voltage, other.min_voltage)
+        self.max_voltage = max(self.max_voltage, other.max_voltage)
+        if self.keep_beats:
+            self._beats.extend(other._beats)
+        if other.num_beats == 0:
+            return self
+        if self.num_beats == 0:
+            for name in ["num_beats", "first_beat", "last_beat",
+                         "num_intervals", "mean_interval",
+                         "interval_squares", "first_interval",
+                         "last_interval", "successive_squares"]:
+                setattr(self, name, getattr(other, name))
+            return self
+        bridge = other.first_beat - self.last_beat
+        successive = [bridge - self.last_interval
+                      if self.last_interval is not None else 0.0,
+                      other.first_interval - bridge
+                      if other.first_interval is not None else 0.0]
+        self.successive_squares += other.successive_squares + \
+            successive[0] ** 2 + successive[1] ** 2
+        self._merge_intervals(1, bridge, 0.0)
+        self._merge_intervals(other.num_intervals, other.mean_interval,
+                              other.interval_squares)
+        if self.first_interval is None:
+            self.first_interval = bridge
+        self.last_interval = bridge if other.last_interval is None \
+            else other.last_interval
+        self.num_beats += other.num_beats
+        self.last_beat = other.last_beat
+        return self
+
+    def _merge_intervals(self, count, mean, squares):
+        """ Adds the statistics of a later run of RR intervals to the running
+        ones, with the pairwise update of Chan et al., which does not lose
+        precision the way sums of squares do
+
+        :param count: Number of intervals in the run
+        :param mean: Mean of the intervals in the run
+        :param squares: Sum of squared deviations from that mean
+        :return: Void
+        """
+        if count == 0:
+            return
+        total = self.num_intervals + count
+        delta = mean - self.mean_interval
+        self.mean_interval += delta * count / total
+        self.interval_squares += squares + \
+            delta ** 2 * self.num_intervals * count / total
+        self.num_intervals = total
+
+    @property
+    def beats(self):
+        """ Numpy array of the times (floats) of the beats, or None if they
+        were not kept
+        """
+        import numpy
+        if not self.keep_beats:
+            return None
+        if len(self._beats) != 1:
+            self._beats = [numpy.concatenate(self._beats + [[]])]
+        return self._beats[0]
+
+    @property
+    def duration(self):
+        """ Float representing the time (in seconds) covered by the ranges
+        """
+        return self.max_time - self.min_time
+
+    @property
+    def mean_hr_bpm(self):
+        """ Float representing the average heart rate in bpm
+        """
+        return self.num_beats / self.duration * 60
+
+    @property
+    def sdnn(self):
+        """ Float standard deviation (in seconds) of the RR intervals, or
+        None if there are fewer than two
+        """
+        if self.num_intervals < 2:
+            return None
+        return math.sqrt(self.interval_squares / (self.num_intervals - 1))
+
+    @property
+    def rmssd(self):
+        """ Float root mean square (in seconds) of the differences between
+        successive RR intervals, or None if there are fewer than two
+        intervals
+        """
+        if self.num_intervals < 2:
+            return None
+        return math.sqrt(self.successive_squares /
+                         (self.num_intervals - 1))
+
+    def to_dict(self):
+        """ Creates the metrics dictionary of the summarized ranges
+
+        :return: Dictionary of metrics (beat times kept as a numpy array,
+        and left out if they were not kept), with the heart rate variability
+        figures in milliseconds
+        """
+        metrics = {"mean_hr_bpm": self.mean_hr_bpm,
+                   "voltage_extremes": (self.min_voltage, self.max_voltage),
+                   "duration": self.duration,
+                   "num_beats": self.num_beats}
+        if self.keep_beats:
+            metrics["beats"] = self.beats
+        metrics["sdnn_ms"] = None if self.sdnn is None else self.sdnn * 1000
+        metrics["rmssd_ms"] = None if self.rmssd is None else \
+            self.rmssd * 1000
+        return metrics
+
+
+def merge_all(partials, keep_beats=True):
+    """ Reduces the summaries of consecutive ranges of samples into one
+
+    :param partials: Iterable of PartialMetrics, in time order
+    :param keep_beats: True to keep the beat times
+    :return: PartialMetrics of all the ranges
+    """
+    total = PartialMetrics(keep_beats=keep_beats)
+    for partial in partials:
+        total.merge(partial)
+    return total
@@ -0,0 +1,122 @@
+import logging
+import hashlib
+import os
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+
+def cache_key(filepath, version, content_hash=False):
+    """ Builds the cache key of a recording.  By default the key is made from
+    the file's absolute path, size and modification time, which is cheap to
+    compute; a hash of the file's contents can be used instead when files are
+    copied or touched without being changed.
+
+    :param filepath: A String representing the path to the ECG data
+    :param version: String identifying the preprocessing code, so that
+    entries made by older code are never reused
+    :param content_hash: True to key on the file's contents instead of its
+    path, size and modification time
+    :returns: String key, prefixed by the version
+    """
+    digest = hashlib.sha1()
+    if content_hash:
+        with open(filepath, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+    else:
+        stat = os.stat(filepath)
+        digest.update("{}|{}|{}".format(os.path.abspath(filepath),
+                                        stat.st_size,
+                                        stat.st_mtime_ns).encode())
+    return "{}-{}".format(version, digest.hexdigest())
+
+
+def load_recording(cache_dir, key):
+    """ Loads cleaned time and voltage data from the cache, memory-mapped so
+    that nothing is read from disk until it is used.  A hit marks the entry
+    as most recently used.
+
+    :param cache_dir: A String representing the cache directory
+    :param key: Cache key from cache_key
+    :returns: Read-only time and voltage arrays (the voltages as a (samples x
+    leads) view for multi-lead recordings), or None on a cache miss
+    """
+    import numpy
+    entry = os.path.join(cache_dir, key + ".npy")
+    try:
+        data = numpy.load(entry, mmap_mode="r")
+    except (IOError, OSError, ValueError):
+        return None
+    os.utime(entry, None)
+    logging.info("Cache hit: %s" % entry)
+    if data.shape[0] > 2:
+        return data[0], data[1:].T
+    return data[0], data[1]
+
+
+def store_recording(cache_dir, key, times, voltages,
+                    max_bytes=DEFAULT_MAX_BYTES):
+    """ Stores cleaned time and voltage data in the cache as a single (2, n)
+    float64 .npy file (with one more row per extra lead), then evicts the
+    least recently used entries until the cache fits in max_bytes.  Entries
+    left by other preprocessing versions are evicted first.
+
+    :param cache_dir: A String representing the cache directory
+    :param key: Cache key from cache_key
+    :param times: Array of cleaned time data
+    :param voltages: Array of cleaned voltage data, or (samples x leads)
+    array of multi-lead voltage data
+    :param max_bytes: Size cap (in bytes) of the whole cache directory
+    :returns: String representing filepath of the new cache entry
+    """
+    import numpy
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    entry = os.path.join(cache_dir, key + ".npy")
+    temp_entry = "{}.{}.tmp".format(entry, os.getpid())
+    with open(temp_entry, "wb") as file:
+        numpy.save(file, numpy.vstack(
+            (times, numpy.transpose(voltages))).astype(float))
+    os.replace(temp_entry, entry)
+    logging.info("Cache entry written: %s" % entry)
+    evict(cache_dir, max_bytes, key.split("-")[0])
+    return entry
+
+
+def evict(cache_dir, max_bytes, version, extension=".npy"):
+    """ Deletes cache entries, stale versions first and then least recently
+    used, until the cache directory holds at most max_bytes
+
+    :param cache_dir: A String representing the cache directory
+    :param max_bytes: Size cap (in bytes) of the entries with this extension
+    :param version: String identifying the current preprocessing code
+    :param extension: File extension of the entries, so that other kinds of
+    entries sharing the directory are left alone
+    :returns: List of the filepaths that were deleted
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(extension):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+        except OSError:
+            # Already evicted by another process
+            continue
+        current = name.startswith(version + "-")
+        entries.append((current, stat.st_mtime, stat.st_size, name))
+    entries.sort()
+    total = sum(entry[2] for entry in entries)
+    removed = []
+    for current, mtime, size, name in entries:
+        if total <= max_bytes and current:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+            removed.append(os.path.join(cache_dir, name))
+        except OSError:
+            pass
+        total -= size
+    for filepath in removed:
+        logging.info("Cache entry evicted: %s" % filepath)
+    return removed
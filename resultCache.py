@@ -0,0 +1,196 @@
+import logging
+import collections
+import hashlib
+import json
+import os
+import recordingCache
+
+# Total size (in bytes) of the arrays held by the in-memory tier
+DEFAULT_MEMORY_BYTES = 256 * 1024 ** 2
+DEFAULT_MAX_BYTES = recordingCache.DEFAULT_MAX_BYTES
+RESULT_EXTENSION = ".npz"
+
+
+class ResultCache(object):
+    """ Cache of analysis results, held in a least recently used in-memory
+    tier and optionally in a directory on disk.  An entry is a dictionary
+    of JSON values and numpy arrays, keyed by the contents of the recording,
+    the analysis parameters and the code version (see key).  On disk, each
+    entry is a single .npz file holding its arrays, plus its other values
+    as JSON.
+    """
+
+    def __init__(self, cache_dir=None, memory_bytes=DEFAULT_MEMORY_BYTES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        """ Creates the cache
+
+        :param cache_dir: Directory of the on-disk tier.  If None, results
+        are only kept in memory
+        :param memory_bytes: Size cap (in bytes) of the arrays held in
+        memory; a larger entry is only kept on disk
+        :param max_bytes: Size cap (in bytes) of the entries on disk
+        """
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._sizes = {}
+        # Content hashes by (path, size, modification time), so that a file
+        # is hashed once for any number of queries
+        self._hashes = {}
+
+    def key(self, filepath, version, params):
+        """ Builds the key of an analysis of a recording
+
+        :param filepath: A String representing the path to the ECG data
+        :param version: String identifying the preprocessing and analysis
+        code (without "-"), so that results of older code are never reused
+        :param params: Dictionary of the analysis parameters (JSON values)
+        :returns: String key, prefixed by the version
+        """
+        stat = os.stat(filepath)
+        stamp = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        if stamp not in self._hashes:
+            self._hashes[stamp] = recordingCache.cache_key(
+                filepath, version, content_hash=True)
+        digest = hashlib.sha1(self._hashes[stamp].encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return "{}-{}".format(version, digest.hexdigest())
+
+    def get(self, key):
+        """ Looks an entry up in memory, then on disk.  A hit marks the
+        entry as most recently used.
+
+        :param key: Key from the key method
+        :returns: Dictionary entry, or None on a cache miss
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            logging.info("Result cache hit in memory: %s" % key)
+            return self._entries[key]
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, key + RESULT_EXTENSION)
+        entry = load_entry(path)
+        if entry is None:
+            return None
+        os.utime(path, None)
+        logging.info("Result cache hit: %s" % path)
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """ Stores an entry in memory and on disk
+
+        :param key: Key from the key method
+        :param entry: Dictionary of JSON values and numpy arrays (nested in
+        dictionaries and lists)
+        :returns: Void
+        """
+        self._remember(key, entry)
+        if self.cache_dir is None:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = os.path.join(self.cache_dir, key + RESULT_EXTENSION)
+        save_entry(path, entry)
+        logging.info("Result cache entry written: %s" % path)
+        recordingCache.evict(self.cache_dir, self.max_bytes,
+                             key.split("-")[0], RESULT_EXTENSION)
+
+    def _remember(self, key, entry):
+        """ Adds an entry to the in-memory tier, evicting the least recently
+        used entries until the tier fits in memory_bytes
+
+        :param key: Key from the key method
+        :param entry: Dictionary entry
+        :returns: Void
+        """
+        size = sum(array.nbytes for array in entry_arrays(entry))
+        self._entries.pop(key, None)
+        self._sizes.pop(key, None)
+        if size > self.memory_bytes:
+            return
+        self._entries[key] = entry
+        self._sizes[key] = size
+        while sum(self._sizes.values()) > self.memory_bytes:
+            oldest = next(iter(self._entries))
+            del self._entries[oldest]
+            del self._sizes[oldest]
+
+
+def entry_arrays(value):
+    """ Finds every numpy array nested in an entry
+
+    :param value: Dictionary entry, or any value nested in one
+    :returns: Generator of numpy arrays
+    """
+    import numpy
+    if isinstance(value, numpy.ndarray):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            for array in entry_arrays(item):
+                yield array
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            for array in entry_arrays(item):
+                yield array
+
+
+def save_entry(path, entry):
+    """ Writes an entry to a .npz file: each array under its own name, and
+    everything else as JSON, in which the arrays are replaced by their
+    names.  The file is written under a temporary name and then renamed, so
+    readers never see half of it.
+
+    :param path: A String representing the path of the .npz file
+    :param entry: Dictionary of JSON values and numpy arrays
+    :returns: Void
+    """
+    import numpy
+    arrays = {}
+
+    def encode(value):
+        if isinstance(value, numpy.ndarray):
+            name = "array_{}".format(len(arrays))
+            arrays[name] = value
+            return {"__array__": name}
+        if isinstance(value, dict):
+            return {key: encode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [encode(item) for item in value]
+        if isinstance(value, numpy.generic):
+            return value.item()
+        return value
+
+    meta = json.dumps(encode(entry))
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "wb") as file:
+        numpy.savez(file, __meta__=numpy.array(meta), **arrays)
+    os.replace(temp_path, path)
+
+
+def load_entry(path):
+    """ Reads an entry written by save_entry
+
+    :param path: A String representing the path of the .npz file
+    :returns: Dictionary entry, or None if there is no readable entry
+    """
+    import numpy
+    try:
+        with numpy.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+    def decode(value):
+        if isinstance(value, dict):
+            if list(value) == ["__array__"]:
+                return arrays[value["__array__"]]
+            return {key: decode(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [decode(item) for item in value]
+        return value
+
+    return decode(json.loads(str(arrays.pop("__meta__"))))
@@ -0,0 +1,275 @@
+import logging
+import json
+import argparse
+import io
+import os
+import threading
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import heartRateMonitor
+import binaryRecording
+import dataQuality
+
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+BINARY_CONTENT_TYPES = ("application/octet-stream",)
+HEADER_TYPES = {"sample_rate": float, "gain": float, "offset": float,
+                "dtype": str, "start_time": float, "header_bytes": int}
+
+
+def analyze_payload(payload, content_type, params):
+    """ Runs the full pipeline on an uploaded recording inside a worker
+    process, with the same parsing, cleaning and analysis as
+    heartRateMonitor.analyze_file
+
+    :param payload: Bytes of a csv file (with one or more leads, see
+    heartRateMonitor.read_lead_names), or of raw binary samples
+    :param content_type: Content type of the payload; application/octet-stream
+    marks raw binary samples, anything else is parsed as csv
+    :param params: Dictionary of query parameters: endtime, time_repair,
+    max_gap and band ("low,high" in Hz), as the options of
+    heartRateMonitor.py, plus the sample_rate, gain, offset, dtype,
+    start_time and header_bytes of binary payloads
+    :returns: String of the metrics JSON, with the "quality" section of
+    the anomalies found while cleaning the recording
+    """
+    import numpy
+    options = analysis_options(params)
+    names = ["voltage"]
+    if content_type in BINARY_CONTENT_TYPES:
+        header = binaryRecording.check_header(
+            {key: HEADER_TYPES[key](value) for key, value in params.items()
+             if key in HEADER_TYPES})
+        samples = numpy.frombuffer(payload, dtype=numpy.dtype(
+            header["dtype"]), offset=header["header_bytes"])
+        time, voltage = binaryRecording.scale_samples(samples, header)
+    else:
+        text = io.TextIOWrapper(io.BytesIO(payload), newline="")
+        names = heartRateMonitor.csv_lead_names(text)[0]
+        text.seek(0)
+        time, voltage = heartRateMonitor.extract_csv(text, len(payload))
+    quality = dataQuality.QualityReport()
+    time, voltage = heartRateMonitor.preprocess(
+        time, voltage, max_gap=options["max_gap"], quality=quality)
+    time, voltage, report = heartRateMonitor.check_time_data(
+        time, voltage, options["time_repair"], quality)
+    record = heartRateMonitor.checked_record(time, voltage, report)
+    del time, voltage
+    record = heartRateMonitor.user_specify_time(record, None,
+                                                params.get("endtime"))
+    metrics = heartRateMonitor.metrics_to_dict(
+        record, names=names if len(names) > 1 else None,
+        max_gap=options["max_gap"], band=options["band"])
+    heartRateMonitor.add_quality(metrics, quality)
+    return json.dumps(metrics, default=heartRateMonitor.to_json_type)
+
+
+def analysis_options(params):
+    """ Converts the analysis options of a request's query parameters, with
+    the defaults of heartRateMonitor.py
+
+    :param params: Dictionary of query parameters
+    :returns: Dictionary of the time_repair, max_gap (int) and band ((low,
+    high) tuple of floats, or None) options
+    """
+    options = {"time_repair": params.get("time_repair", "sort"),
+               "max_gap": int(params.get("max_gap",
+                                         heartRateMonitor.MAX_GAP)),
+               "band": None}
+    if "band" in params:
+        options["band"] = tuple(float(value)
+                                for value in params["band"].split(","))
+        if len(options["band"]) != 2:
+            raise ValueError("band takes two frequencies: low,high")
+    return options
+
+
+def warm_up():
+    """ Imports the heavy packages once when a worker process starts, so
+    that no request pays for them
+
+    :returns: Void
+    """
+    heartRateMonitor.configure_logging('a')
+    import numpy
+    import pandas
+    logging.info("Worker %d ready (numpy %s, pandas %s)"
+                 % (os.getpid(), numpy.__version__, pandas.__version__))
+
+
+class AnalysisServer(socketserver.ThreadingMixIn, HTTPServer):
+    """ HTTP server that handles each request on its own thread and runs the
+    analyses on a bounded pool of warm worker processes.  Requests beyond
+    the pool's queue limit are turned away with 503 instead of piling up.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, max_pending=None,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        """ Creates the server and starts its worker pool
+
+        :param address: (host, port) tuple to listen on; port 0 picks a free
+        port
+        :param workers: Number of worker processes (defaults to the CPU count)
+        :param max_pending: Most requests accepted at once, running or queued
+        (defaults to twice the number of workers)
+        :param max_bytes: Largest accepted payload, in bytes
+        """
+        HTTPServer.__init__(self, address, AnalysisRequestHandler)
+        workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=workers,
+                                        initializer=warm_up)
+        # Start every worker now rather than on the first requests
+        for future in [self.pool.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+        if max_pending is None:
+            max_pending = 2 * workers
+        self.capacity = max_pending
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def server_close(self):
+        """ Stops listening and shuts down the worker pool
+
+        :returns: Void
+        """
+        HTTPServer.server_close(self)
+        self.pool.shutdown()
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """ Handles GET /health and POST /analyze requests
+    """
+
+    def do_GET(self):
+        """ Reports whether the service is up and how busy it is
+
+        :returns: Void
+        """
+        if urlparse(self.path).path != "/health":
+            self.send_json(404, {"error": "Not found"})
+            return
+        self.send_json(200, {"status": "ok",
+                             "in_flight": self.server.in_flight,
+                             "capacity": self.server.capacity})
+
+    def do_POST(self):
+        """ Analyzes the uploaded recording and replies with its metrics
+
+        :returns: Void
+        """
+        url = urlparse(self.path)
+        if url.path != "/analyze":
+            self.send_json(404, {"error": "Not found"})
+            return
+        # Turn the request away before reading its body, so that a busy
+        # service does not buffer payloads it will not analyze
+        if not self.server.slots.acquire(blocking=False):
+            self.close_connection = True
+            self.send_json(503, {"error": "Service busy, retry later"},
+                           {"Retry-After": "1"})
+            return
+        with self.server._lock:
+            self.server.in_flight += 1
+        try:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                self.close_connection = True
+                self.send_json(400, {"error": "Invalid Content-Length"})
+                return
+            if length > self.server.max_bytes:
+                self.close_connection = True
+                self.send_json(413, {"error": "Payload too large"})
+                return
+            payload = self.rfile.read(length)
+            params = {key: values[-1] for key, values in
+                      parse_qs(url.query).items()}
+            content_type = self.headers.get("Content-Type", "text/csv")
+            future = self.server.pool.submit(
+                analyze_payload, payload, content_type.split(";")[0].strip(),
+                params)
+            metrics = future.result()
+        except (ValueError, TypeError, KeyError) as error:
+            logging.warning("Bad request: %s" % error)
+            self.send_json(400, {"error": "{}: {}".format(
+                type(error).__name__, error)})
+        except Exception as error:
+            logging.error("Analysis failed: %s" % error)
+            self.send_json(500, {"error": "{}: {}".format(
+                type(error).__name__, error)})
+        else:
+            self.send_json(200, metrics)
+        finally:
+            with self.server._lock:
+                self.server.in_flight -= 1
+            self.server.slots.release()
+
+    def send_json(self, status, body, headers=None):
+        """ Writes a JSON response
+
+        :param status: HTTP status code
+        :param body: Dictionary (or already formatted JSON string) to send as
+        the response body
+        :param headers: Dictionary of extra response headers
+        :returns: Void
+        """
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """ Sends the server's access log to log.txt instead of stderr
+
+        :returns: Void
+        """
+        logging.info("%s %s" % (self.address_string(), format % args))
+
+
+def serve(host="127.0.0.1", port=8590, workers=None, max_pending=None):
+    """ Driver function that runs the analysis service until interrupted
+
+    :param host: Host name or address to listen on
+    :param port: Port to listen on
+    :param workers: Number of worker processes (defaults to the CPU count)
+    :param max_pending: Most requests accepted at once, running or queued
+    :returns: Void
+    """
+    heartRateMonitor.configure_logging()
+    server = AnalysisServer((host, port), workers, max_pending)
+    logging.info("Service listening on %s:%d" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info("Service stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Host name or address to listen on")
+    parser.add_argument("--port", type=int, default=8590,
+                        help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes (defaults to the "
+                             "number of CPUs)")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Most requests accepted at once before "
+                             "replying 503 (defaults to twice the workers)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.max_pending)
@@ -0,0 +1,94 @@
+import logging
+import contextlib
+import json
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then reported as None
+    resource = None
+
+
+class StageTimer(object):
+    """ Records the wall time, CPU time, peak resident memory and rows
+    processed of each stage of the pipeline.  A disabled timer records
+    nothing, so the pipeline can always be written against one.
+    """
+
+    def __init__(self, enabled=True):
+        """ Creates the timer
+
+        :param enabled: False to make every stage a no-op
+        """
+        self.enabled = enabled
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """ Context manager that times the code inside it as one stage.  The
+        yielded dictionary's "rows" entry can be set inside the block once
+        the number of rows processed is known.
+
+        :param name: Name of the stage
+        :param rows: Number of rows processed, if already known
+        :returns: Generator yielding the stage's record dictionary
+        """
+        record = {"stage": name, "rows": rows}
+        if not self.enabled:
+            yield record
+            return
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = time.perf_counter() - wall_start
+            record["cpu_seconds"] = time.process_time() - cpu_start
+            record["peak_rss_mb"] = peak_rss_mb()
+            self.stages.append(record)
+            logging.info("Stage %s: %.4f s wall, %.4f s cpu, %s rows"
+                         % (name, record["wall_seconds"],
+                            record["cpu_seconds"], record["rows"]))
+
+    def report(self):
+        """ Builds the structured timing report
+
+        :returns: Dictionary with every stage's record and the totals
+        """
+        return {"stages": self.stages,
+                "total_wall_seconds": sum(record["wall_seconds"]
+                                          for record in self.stages),
+                "total_cpu_seconds": sum(record["cpu_seconds"]
+                                         for record in self.stages),
+                "peak_rss_mb": peak_rss_mb()}
+
+    def to_json(self, input_filepath):
+        """ Writes the timing report next to the metrics JSON file, with the
+        same name as the input file plus a _timing suffix
+
+        :param input_filepath: The filepath of the inputted data file
+        :returns: String representing filepath of the timing JSON file
+        """
+        json_filepath = input_filepath[:-4] + "_timing.json"
+        report = self.report()
+        report["file"] = input_filepath
+        with open(json_filepath, "w") as file:
+            json.dump(report, file, indent=2)
+        logging.info("Timing report written: %s" % json_filepath)
+        return json_filepath
+
+
+def peak_rss_mb():
+    """ Finds the peak resident memory of the current process so far
+
+    :returns: Float representing peak RSS in megabytes, or None where the
+    resource module is unavailable
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / 1024.0 ** 2
+    return peak / 1024.0
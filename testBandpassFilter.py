@@ -0,0 +1,104 @@
+import pytest
+import numpy
+
+
+def drifting_signal():
+    """ Makes a 360 Hz signal of 1 Hz spikes on top of a slow, large
+    baseline drift
+
+    :returns: Arrays of time and voltage data, and the indices of the spikes
+    """
+    times = numpy.arange(3600) / 360.0
+    spikes = numpy.arange(100, 3600, 360)
+    voltages = 2.0 * numpy.sin(2 * numpy.pi * 0.05 * times) + 0.3 * times
+    voltages[spikes] += 1.0
+    voltages[spikes - 1] += 0.5
+    voltages[spikes + 1] += 0.5
+    return times, voltages, spikes
+
+
+def test_estimate_sample_rate():
+    """ Tests the function "estimate_sample_rate" from bandpassFilter.py
+
+    :returns: passes if the rate is found from the median time step, and
+    None returned without two distinct times, fails otherwise
+    """
+    from bandpassFilter import estimate_sample_rate
+    times = numpy.arange(100) / 250.0
+    times[50] = times[49]
+    assert estimate_sample_rate(times) == pytest.approx(250.0)
+    assert estimate_sample_rate([1.0]) is None
+    assert estimate_sample_rate([1.0, 1.0]) is None
+
+
+def test_design_bandpass():
+    """ Tests the function "design_bandpass" from bandpassFilter.py
+
+    :returns: passes if the filter passes the band, falls back to a
+    high-pass filter near the Nyquist frequency and rejects an empty band,
+    fails otherwise
+    """
+    import scipy.signal
+    from bandpassFilter import design_bandpass
+    sos = design_bandpass(360.0, (0.5, 40.0))
+    frequencies, response = scipy.signal.sosfreqz(sos, [0.01, 10.0, 170.0],
+                                                  fs=360.0)
+    assert abs(response[0]) < 0.01
+    assert abs(response[1]) == pytest.approx(1.0, abs=0.05)
+    assert abs(response[2]) < 0.01
+    sos = design_bandpass(60.0, (0.5, 40.0))
+    response = scipy.signal.sosfreqz(sos, [29.0], fs=60.0)[1]
+    assert abs(response[0]) == pytest.approx(1.0, abs=0.05)
+    with pytest.raises(ValueError):
+        design_bandpass(360.0, (40.0, 0.5))
+
+
+def test_bandpass_filter():
+    """ Tests the function "bandpass_filter" from bandpassFilter.py
+
+    :returns: passes if the baseline drift is removed without moving the
+    spikes, for one lead and for several leads at once, fails otherwise
+    """
+    from bandpassFilter import bandpass_filter
+    times, voltages, spikes = drifting_signal()
+    filtered = bandpass_filter(times, voltages)
+    assert abs(filtered).max() < 1.5
+    threshold = 0.5 * filtered.max()
+    peaks = numpy.flatnonzero((filtered[1:-1] > threshold) &
+                              (filtered[1:-1] >= filtered[:-2]) &
+                              (filtered[1:-1] >= filtered[2:])) + 1
+    numpy.testing.assert_array_equal(peaks, spikes)
+    leads = numpy.stack((voltages, -voltages), axis=1)
+    numpy.testing.assert_allclose(bandpass_filter(times, leads),
+                                  numpy.stack((filtered, -filtered), axis=1))
+    assert bandpass_filter(times[:3], voltages[:3]).shape == (3,)
+    numpy.testing.assert_array_equal(bandpass_filter(times[:1],
+                                                     voltages[:1]),
+                                     voltages[:1])
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 1000])
+def test_streaming_bandpass_filter(chunksize):
+    """ Tests the class "StreamingBandpassFilter" and the function
+    "filter_chunks" from bandpassFilter.py
+
+    :param chunksize: Number of samples per chunk
+    :returns: passes if filtering chunk by chunk gives the output of one
+    pass over the whole signal, which starts without a step response, fails
+    otherwise
+    """
+    from bandpassFilter import StreamingBandpassFilter, filter_chunks
+    times, voltages, spikes = drifting_signal()
+    expected = StreamingBandpassFilter(360.0).filter(voltages)
+    assert abs(expected[:50]).max() < 0.1
+    chunks = [(times[i:i + chunksize], voltages[i:i + chunksize])
+              for i in range(0, times.size, chunksize)]
+    filtered = list(filter_chunks(chunks))
+    assert len(filtered) == len(chunks)
+    for (time, voltage), (new_time, new_voltage, _) in zip(chunks,
+                                                           filtered):
+        assert new_time is time and new_voltage is voltage
+    numpy.testing.assert_allclose(
+        numpy.concatenate([chunk[2] for chunk in filtered]), expected)
+    assert list(filter_chunks(chunks[:1]))[0][2].size == min(chunksize,
+                                                             times.size)
@@ -0,0 +1,62 @@
+import pytest
+import json
+import os
+import shutil
+
+
+@pytest.fixture
+def data_dir(tmpdir):
+    """ Creates a directory holding two good csv files and one bad one
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: String representing the path to the directory
+    """
+    shutil.copy("test_data1.csv", str(tmpdir.join("a.csv")))
+    shutil.copy("test_data1.csv", str(tmpdir.join("b.csv")))
+    tmpdir.join("bad.csv").write("hello\n")
+    tmpdir.join("notes.txt").write("not ecg data\n")
+    return str(tmpdir)
+
+
+def test_find_files(data_dir):
+    """ Tests the function "find_files" from batchHeartRateMonitor.py
+
+    :param data_dir: Directory of sample files
+    :returns: passes if only csv files are found, for a directory or a glob
+    pattern, fails otherwise
+    """
+    from batchHeartRateMonitor import find_files
+    names = [os.path.basename(path) for path in find_files(data_dir)]
+    assert names == ["a.csv", "b.csv", "bad.csv"]
+    assert len(find_files(os.path.join(data_dir, "?.csv"))) == 2
+
+
+def test_analyze_one(data_dir):
+    """ Tests the function "analyze_one" from batchHeartRateMonitor.py
+
+    :param data_dir: Directory of sample files
+    :returns: passes if errors are recorded instead of raised, fails otherwise
+    """
+    from batchHeartRateMonitor import analyze_one
+    result = analyze_one(os.path.join(data_dir, "missing.csv"), 10)
+    assert result["status"] == "failed"
+    assert result["error"].startswith("FileNotFoundError")
+
+
+def test_batch_main(data_dir):
+    """ Tests the function "batch_main" from batchHeartRateMonitor.py
+
+    :param data_dir: Directory of sample files
+    :returns: passes if each good file gets its JSON output and the manifest
+    records every file's status, fails otherwise
+    """
+    from batchHeartRateMonitor import batch_main
+    manifest_filepath = os.path.join(data_dir, "manifest.json")
+    manifest = batch_main(data_dir, 10, workers=2,
+                          manifest_filepath=manifest_filepath)
+    assert manifest["num_files"] == 3
+    assert manifest["num_failed"] == 1
+    with open(manifest_filepath, "r") as file:
+        assert json.load(file)["files"][0]["status"] == "ok"
+    with open(os.path.join(data_dir, "a.json"), "r") as file:
+        assert json.load(file)["num_beats"] == 13
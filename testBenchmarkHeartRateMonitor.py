@@ -0,0 +1,100 @@
+import pytest
+import json
+import numpy
+
+
+def test_synthetic_ecg():
+    """ Tests the function "synthetic_ecg" from benchmarkHeartRateMonitor.py
+
+    :returns: passes if the signal has the requested size, heart rate,
+    missing values and spikes, fails otherwise
+    """
+    from benchmarkHeartRateMonitor import synthetic_ecg
+    from heartRateMonitor import get_num_beats
+    times, voltages = synthetic_ecg(60.0, 250.0, heart_rate=90.0)
+    assert times.size == voltages.size == 15000
+    assert times[1] == pytest.approx(0.004)
+    assert get_num_beats(times, voltages) == 90
+
+    times, voltages = synthetic_ecg(60.0, 250.0, missing_rate=0.1,
+                                    spike_rate=0.01)
+    assert numpy.isnan(voltages).mean() == pytest.approx(0.1, abs=0.02)
+    assert (voltages > 300.0).mean() == pytest.approx(0.01, abs=0.005)
+
+
+def test_write_synthetic_csv(tmpdir):
+    """ Tests the function "write_synthetic_csv" from
+    benchmarkHeartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if a file written in several pieces reads back as one
+    continuous signal, fails otherwise
+    """
+    from benchmarkHeartRateMonitor import write_synthetic_csv
+    from heartRateMonitor import extract_file
+    filepath = str(tmpdir.join("synthetic.csv"))
+    assert write_synthetic_csv(filepath, 10.0, 100.0, chunk_seconds=3.0,
+                               missing_rate=0.1) == 1000
+    times, voltages = extract_file(filepath)
+    assert numpy.diff(times) == pytest.approx(numpy.full(999, 0.01))
+    assert numpy.isnan(voltages).any()
+
+
+def test_run_benchmarks(tmpdir):
+    """ Tests the functions "run_benchmarks" and "compare_benchmarks" from
+    benchmarkHeartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if every stage is timed for every size, beat detection
+    agrees with peakutils, and the results file can be compared against
+    another, fails otherwise
+    """
+    from benchmarkHeartRateMonitor import run_benchmarks, \
+        compare_benchmarks, STAGES
+    output = str(tmpdir.join("benchmark.json"))
+    run_benchmarks([1000, 2000], output)
+    with open(output, "r") as file:
+        report = json.load(file)
+    assert [result["num_samples"] for result in report["results"]] == \
+        [1000, 2000]
+    assert sorted(report["results"][0]["stages"]) == sorted(STAGES)
+    assert report["results"][1]["detectors"]["matches_peakutils"]
+    rows = compare_benchmarks(output, output)
+    assert len(rows) == 2 * (len(STAGES) + 1)
+    assert all(row[4] == pytest.approx(1.0) for row in rows)
+
+
+def test_import_stays_light():
+    """ Tests that importing heartRateMonitor.py loads no heavy packages.
+    The import time itself depends on the machine, so it is left to the
+    benchmark report rather than checked here.
+
+    :returns: passes if the import loads none of numpy, pandas, peakutils
+    or scipy, fails otherwise
+    """
+    from benchmarkHeartRateMonitor import measure_import_time
+    seconds, heavy_modules = measure_import_time()
+    assert heavy_modules == []
+
+
+@pytest.mark.parametrize("filepath", ["missing.csv", "README.md"])
+def test_cli_validation_stays_light(filepath):
+    """ Tests that the heartRateMonitor.py command line rejects bad input
+    without importing heavy packages
+
+    :param filepath: A file that fails validation
+    :returns: passes if validation fails before numpy, pandas or peakutils
+    are imported, fails otherwise
+    """
+    import subprocess
+    import sys
+    script = ("import sys, heartRateMonitor\n"
+              "try:\n"
+              "    heartRateMonitor.analyze_file({!r}, 10)\n"
+              "except (FileNotFoundError, TypeError):\n"
+              "    pass\n"
+              "print([name for name in ('numpy', 'pandas', 'peakutils')\n"
+              "       if name in sys.modules])".format(filepath))
+    output = subprocess.check_output([sys.executable, "-c", script],
+                                     universal_newlines=True)
+    assert output.strip() == "[]"
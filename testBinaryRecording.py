@@ -0,0 +1,120 @@
+import pytest
+import json
+import numpy
+
+
+@pytest.fixture
+def binary_file(tmpdir):
+    """ Writes a short int16 recording (a triangle wave, one beat every four
+    samples at 2 Hz) with its sidecar header
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: String representing the path to the binary file
+    """
+    from binaryRecording import write_binary
+    filepath = str(tmpdir.join("ecg.bin"))
+    write_binary(filepath, numpy.tile([0.0, 0.5, 1.0, 0.5], 10), 2.0,
+                 gain=200.0, offset=1024.0, start_time=1.0)
+    return filepath
+
+
+def test_read_header(binary_file):
+    """ Tests the function "read_header" from binaryRecording.py
+
+    :param binary_file: Filepath of a binary recording
+    :returns: passes if header values and defaults are read, fails otherwise
+    """
+    from binaryRecording import read_header
+    header = read_header(binary_file)
+    assert header["sample_rate"] == 2.0
+    assert header["dtype"] == "<i2"
+    assert header["header_bytes"] == 0
+
+
+@pytest.mark.parametrize("header", [None, {"gain": 2.0},
+                                    {"sample_rate": 0}])
+def test_read_header_invalid(tmpdir, header):
+    """ Tests that "read_header" from binaryRecording.py rejects missing or
+    invalid headers
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param header: Header contents, or None for no header file
+    :returns: passes if the proper exception is raised, fails otherwise
+    """
+    from binaryRecording import read_header
+    if header is None:
+        with pytest.raises(FileNotFoundError):
+            read_header(str(tmpdir.join("ecg.bin")))
+    else:
+        tmpdir.join("ecg.hdr").write(json.dumps(header))
+        with pytest.raises(ValueError):
+            read_header(str(tmpdir.join("ecg.bin")))
+
+
+def test_read_binary(binary_file):
+    """ Tests the function "read_binary" from binaryRecording.py
+
+    :param binary_file: Filepath of a binary recording
+    :returns: passes if voltages are scaled and times synthesized from the
+    sample rate, fails otherwise
+    """
+    from binaryRecording import read_binary
+    times, voltages = read_binary(binary_file)
+    assert times[:3] == pytest.approx([1.0, 1.5, 2.0])
+    assert voltages[:4] == pytest.approx([0.0, 0.5, 1.0, 0.5])
+    assert voltages.size == 40
+
+
+def test_read_binary_float_view(tmpdir):
+    """ Tests that "read_binary" from binaryRecording.py does not copy
+    unscaled float64 recordings, and skips fixed-size file headers
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if the voltages are a view of the memory-mapped file,
+    fails otherwise
+    """
+    from binaryRecording import read_binary
+    filepath = str(tmpdir.join("ecg.bin"))
+    with open(filepath, "wb") as file:
+        file.write(b"HEADER!!")
+        numpy.arange(5, dtype="<f8").tofile(file)
+    tmpdir.join("ecg.hdr").write(json.dumps({"sample_rate": 1.0,
+                                             "dtype": "<f8",
+                                             "header_bytes": 8}))
+    times, voltages = read_binary(filepath)
+    assert isinstance(voltages, numpy.memmap)
+    assert voltages == pytest.approx([0, 1, 2, 3, 4])
+
+
+def test_read_binary_chunks(binary_file):
+    """ Tests the function "read_binary_chunks" from binaryRecording.py
+
+    :param binary_file: Filepath of a binary recording
+    :returns: passes if the chunks join back into the full recording, fails
+    otherwise
+    """
+    from binaryRecording import read_binary, read_binary_chunks
+    chunks = list(read_binary_chunks(binary_file, 7))
+    assert len(chunks) == 6
+    times, voltages = read_binary(binary_file)
+    assert numpy.concatenate([chunk[0] for chunk in chunks]) == \
+        pytest.approx(times)
+    assert numpy.concatenate([chunk[1] for chunk in chunks]) == \
+        pytest.approx(voltages)
+
+
+@pytest.mark.parametrize("chunksize", [None, 5])
+def test_analyze_binary_file(binary_file, chunksize):
+    """ Tests that "analyze_file" from heartRateMonitor.py accepts binary
+    recordings
+
+    :param binary_file: Filepath of a binary recording
+    :param chunksize: Number of samples to stream at a time, or None
+    :returns: passes if the beats of the triangle wave are found, fails
+    otherwise
+    """
+    from heartRateMonitor import analyze_file
+    with open(analyze_file(binary_file, 100, chunksize), "r") as file:
+        metrics = json.load(file)
+    assert metrics["num_beats"] == 10
+    assert metrics["beats"][:2] == pytest.approx([2.0, 4.0])
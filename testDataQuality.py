@@ -0,0 +1,110 @@
+import pytest
+import logging
+import numpy
+
+
+def test_quality_report(monkeypatch):
+    """ Tests the class "QualityReport" from dataQuality.py
+
+    :param monkeypatch: pytest fixture used to capture warnings
+    :returns: passes if anomalies are counted by kind with the first few
+    examples, reports merge in order, and one warning is logged per kind,
+    fails otherwise
+    """
+    from dataQuality import QualityReport
+    warnings = []
+    monkeypatch.setattr(logging, "warning", warnings.append)
+    first = QualityReport()
+    first.add("voltage_above_300", "Clipped", 2, numpy.array([400.0, 500.0]))
+    first.add("time_non_float", "Bad times", 0, ["never"])
+    second = QualityReport()
+    second.add("voltage_above_300", "Clipped", 3, [600.0, 700.0, 800.0])
+    second.add("voltage_non_float", "Bad voltages", 1, ["x"])
+    first.merge(second)
+    assert first.to_dict() == {
+        "voltage_above_300": {"count": 5,
+                              "examples": [400.0, 500.0, 600.0]},
+        "voltage_non_float": {"count": 1, "examples": ["x"]}}
+    first.log()
+    assert warnings == ["Clipped: 5 (e.g. 400.0, 500.0, 600.0)",
+                        "Bad voltages: 1 (e.g. 'x')"]
+
+
+def test_collecting(monkeypatch):
+    """ Tests the function "collecting" from dataQuality.py
+
+    :param monkeypatch: pytest fixture used to capture warnings
+    :returns: passes if a given report is added to without being logged,
+    and a report of its own is logged at the end of the block, fails
+    otherwise
+    """
+    from dataQuality import QualityReport, collecting
+    warnings = []
+    monkeypatch.setattr(logging, "warning", warnings.append)
+    report = QualityReport()
+    with collecting(report) as quality:
+        assert quality is report
+        quality.add("rows_dropped", "Dropped", 4)
+    assert warnings == []
+    with collecting() as quality:
+        quality.add("rows_dropped", "Dropped", 4)
+        assert warnings == []
+    assert warnings == ["Dropped: 4"]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (numpy.float64(1.5), 1.5), (7, 7.0), ("bad", "bad"),
+    (numpy.str_("1,2"), "1,2"), (True, "True"), (numpy.bool_(False),
+                                                 "False"),
+    (None, "None")])
+def test_example_value(value, expected):
+    """ Tests the function "example_value" from dataQuality.py
+
+    :param value: Offending value
+    :param expected: Its JSON value
+    :returns: passes if numbers become floats and everything else
+    (booleans included) strings, fails otherwise
+    """
+    from dataQuality import example_value
+    assert example_value(value) == expected
+    assert type(example_value(value)) == type(expected)
+
+
+def test_configure_queue_logging(tmpdir, monkeypatch):
+    """ Tests the function "configure_queue_logging" from dataQuality.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param monkeypatch: pytest fixture used to give the root logger no
+    handlers for the test
+    :returns: passes if records reach the file through a queue, a second
+    call changes nothing, and a handler inherited from another process is
+    replaced, fails otherwise
+    """
+    import time
+    import logging.handlers
+    from dataQuality import configure_queue_logging
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "handlers", [])
+    monkeypatch.setattr(root, "level", root.level)
+    filepath = str(tmpdir.join("log.txt"))
+    with open(filepath, "w") as file:
+        file.write("old\n")
+    configure_queue_logging(filepath, 'w', logging.INFO, '%(message)s',
+                            None)
+    assert len(root.handlers) == 1
+    assert isinstance(root.handlers[0], logging.handlers.QueueHandler)
+    configure_queue_logging(filepath, 'w', logging.INFO, '%(message)s',
+                            None)
+    assert len(root.handlers) == 1
+    logging.info("queued")
+    for attempt in range(100):
+        with open(filepath, "r") as file:
+            if file.read() == "queued\n":
+                break
+        time.sleep(0.01)
+    with open(filepath, "r") as file:
+        assert file.read() == "queued\n"
+    root.handlers[0].pid = -1
+    configure_queue_logging(filepath, 'a', logging.INFO, '%(message)s',
+                            None)
+    assert len(root.handlers) == 1 and root.handlers[0].pid != -1
@@ -0,0 +1,119 @@
+import pytest
+import numpy
+
+
+def test_from_arrays():
+    """ Tests the method "from_arrays" of ECGRecord from ecgRecord.py
+
+    :returns: passes if evenly spaced times are dropped in favour of the
+    sample rate and reproduced exactly, and other times are kept, fails
+    otherwise
+    """
+    from ecgRecord import ECGRecord
+    times = 12.5 + numpy.arange(1000) / 360.0
+    voltages = numpy.sin(times)
+    record = ECGRecord.from_arrays(times, voltages)
+    assert record.uniform
+    assert record.sample_rate == 360.0
+    assert record.nbytes == voltages.nbytes
+    numpy.testing.assert_array_equal(record.times, times)
+    times[500] += 1e-4
+    record = ECGRecord.from_arrays(times, voltages, "float32")
+    assert not record.uniform
+    assert record.voltages.dtype == numpy.float32
+    assert record.nbytes == times.nbytes + voltages.nbytes // 2
+    numpy.testing.assert_array_equal(record.times, times)
+
+
+def test_uniform_sample_rate():
+    """ Tests the function "uniform_sample_rate" from ecgRecord.py
+
+    :returns: passes if the rate of evenly spaced times is found, and None
+    returned otherwise, fails otherwise
+    """
+    from ecgRecord import uniform_sample_rate
+    assert uniform_sample_rate([float("0.00{}".format(n))
+                                for n in range(10)]) == 1000.0
+    assert uniform_sample_rate([0.0, 0.5, 1.5]) is None
+    assert uniform_sample_rate([0.0, 0.5, 0.5, 1.0]) is None
+    assert uniform_sample_rate([1.0]) is None
+    assert uniform_sample_rate([1.0, 1.0]) is None
+    assert uniform_sample_rate(numpy.arange(100000) * 0.004) == 250.0
+
+
+@pytest.mark.parametrize("decimals", [3, 6])
+def test_rounded_times(decimals):
+    """ Tests the functions "time_decimals" and "uniform_sample_rate" from
+    ecgRecord.py on 360 Hz times printed with few decimals
+
+    :param decimals: Number of decimals the times are printed with
+    :returns: passes if the printed decimals and the exact sample rate are
+    found, and the implicit time axis gives back the printed times, fails
+    otherwise
+    """
+    from ecgRecord import ECGRecord, time_decimals, uniform_sample_rate
+    times = numpy.array([float("{:.{}f}".format(n / 360.0, decimals))
+                         for n in range(20000)])
+    assert time_decimals(times) == decimals
+    assert time_decimals(times + 1e-9) is None
+    assert uniform_sample_rate(times) == 360.0
+    record = ECGRecord.from_arrays(times, numpy.zeros(times.size))
+    assert record.uniform and record.decimals == decimals
+    numpy.testing.assert_array_equal(record.times, times)
+    numpy.testing.assert_array_equal(record[100:200].times, times[100:200])
+    assert record.time_at(777) == times[777]
+    assert record.search(times[777]) == 777
+    times[5000] += 10.0 ** -decimals
+    assert uniform_sample_rate(times) is None
+
+
+@pytest.mark.parametrize("uniform", [True, False])
+def test_slicing(uniform):
+    """ Tests slicing an ECGRecord from ecgRecord.py
+
+    :param uniform: True for an implicit time axis
+    :returns: passes if slices share the record's data and keep its times,
+    fails otherwise
+    """
+    from ecgRecord import ECGRecord
+    times = 3.0 + numpy.arange(100) / 7.0
+    if not uniform:
+        times[-1] += 1.0
+    record = ECGRecord.from_arrays(times, numpy.arange(200.0).reshape(100, 2))
+    assert record.uniform == uniform
+    for key in [slice(10, 20), slice(None, -5), slice(90, 10),
+                slice(5, 50, 3)]:
+        part = record[key]
+        assert len(part) == 0 or numpy.shares_memory(part.voltages,
+                                                     record.voltages)
+        numpy.testing.assert_array_equal(part.times, times[key])
+        numpy.testing.assert_array_equal(part.voltages,
+                                         record.voltages[key])
+    numpy.testing.assert_array_equal(record[10:50][5:10].times, times[15:20])
+    with pytest.raises(TypeError):
+        record[3]
+
+
+@pytest.mark.parametrize("uniform", [True, False])
+def test_time_slice(uniform):
+    """ Tests the methods "search" and "time_slice" of ECGRecord from
+    ecgRecord.py
+
+    :param uniform: True for an implicit time axis
+    :returns: passes if samples are found as by numpy.searchsorted, fails
+    otherwise
+    """
+    from ecgRecord import ECGRecord
+    times = numpy.arange(1000) / 360.0
+    if not uniform:
+        times[0] -= 1.0
+    record = ECGRecord.from_arrays(times, numpy.zeros(1000))[100:900]
+    times = times[100:900]
+    for time in list(times[[0, 1, 399, -1]]) + [-5.0, 0.5, 1.2345, 100.0]:
+        for side in ["left", "right"]:
+            assert record.search(time, side) == numpy.searchsorted(
+                times, time, side=side)
+    numpy.testing.assert_array_equal(record.time_slice(1.0, 2.0).times,
+                                     times[(times >= 1.0) & (times <= 2.0)])
+    assert len(record.time_slice(2.0, 1.0)) == 0
+    assert record.time_at(-1) == times[-1]
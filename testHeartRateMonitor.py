@@ -1,5 +1,6 @@
 import pytest
 import json
+import numpy
 
 
 @pytest.mark.parametrize("filepath", ["notonmymachine.txt",
@@ -36,14 +37,15 @@ def test_extract_file():
     False otherwise
     """
     from heartRateMonitor import extract_file
-    assert extract_file("dummy.csv")[0] == [0, 1, 2]
-    assert extract_file("dummy.csv")[1] == [0, 1, 3]
+    assert extract_file("dummy.csv")[0] == pytest.approx([0, 1, 2])
+    assert extract_file("dummy.csv")[1] == pytest.approx([0, 1, 3])
+    assert isinstance(extract_file("dummy.csv")[0], numpy.ndarray)
 
 
 def test_convert_to_floats():
     """ Tests the function "convert_to_floats" from heartRateMonitor.py
 
-    :returns: True if floats successfully casted and interpolation indices
+    :returns: True if floats successfully casted and interpolation mask
     correctly generated, False otherwise
     """
     from heartRateMonitor import convert_to_floats
@@ -51,11 +53,16 @@ def test_convert_to_floats():
     # Test integers and parseable strings
     assert convert_to_floats([32.4, 234, '24'])[0] == pytest\
         .approx([32.4, float(234), float(24)])
-    assert convert_to_floats([32.4, 234, '24'])[1] == []
+    assert not convert_to_floats([32.4, 234, '24'])[1].any()
 
-    # Test that correct indices are returned for nan, bools, and non-parseable
-    # strings
-    assert convert_to_floats(['hello', float('nan'), True])[1] == [0, 1, 2]
+    # Test that nan, bools, and non-parseable strings are flagged
+    assert convert_to_floats(['hello', float('nan'), True])[1].tolist() == \
+        [True, True, True]
+    assert numpy.isnan(convert_to_floats(['hello', 1.0, True])[0]).tolist() \
+        == [True, False, True]
+
+    # Test arrays parsed straight from a csv
+    assert convert_to_floats(numpy.array([1, 2, 3]))[0].dtype == numpy.float64
 
 
 def test_interpolate():
@@ -64,41 +71,50 @@ def test_interpolate():
     :returns: True if data successfully interpolated, False otherwise
     """
     from heartRateMonitor import interpolate
+    nan = float('nan')
+    none = [False, False, False]
+    middle = [False, True, False]
+    first = [True, False, False]
+    last = [False, False, True]
+    time_mask = [False, False, False, True, False]
+    voltage_mask = [False, True, False, False, False]
 
     # No interpolation case
-    assert interpolate([0.0, 1.0, 2.0], [1.0, 2.0, 3.0], [], []
+    assert interpolate([0.0, 1.0, 2.0], [1.0, 2.0, 3.0], none, none
                        )[0] == pytest.approx([0.0, 1.0, 2.0])
-    assert interpolate([0.0, 1.0, 2.0], [1.0, 2.0, 3.0], [], []
+    assert interpolate([0.0, 1.0, 2.0], [1.0, 2.0, 3.0], none, none
                        )[1] == pytest.approx([1.0, 2.0, 3.0])
 
-    # Time interpolation case
-    assert interpolate([0.0, 'hi', 2.0], [1.0, 2.3, 3.0], [1], []
-                       )[0] == pytest.approx([0.0, 1.3, 2.0])
-    assert interpolate([0.0, 'hi', 2.0], [1.0, 2.3, 3.0], [1], []
+    # Time interpolation case (linear in the sample index)
+    assert interpolate([0.0, nan, 2.0], [1.0, 2.3, 3.0], middle, none
+                       )[0] == pytest.approx([0.0, 1.0, 2.0])
+    assert interpolate([0.0, nan, 2.0], [1.0, 2.3, 3.0], middle, none
                        )[1] == pytest.approx([1.0, 2.3, 3.0])
 
     # Voltage interpolation case
-    assert interpolate([0.0, 1.8, 2.0], [1.0, 'hi', 3.0], [], [1]
+    assert interpolate([0.0, 1.8, 2.0], [1.0, nan, 3.0], none, middle
                        )[0] == pytest.approx([0.0, 1.8, 2.0])
-    assert interpolate([0.0, 1.8, 2.0], [1.0, 'hi', 3.0], [], [1]
+    assert interpolate([0.0, 1.8, 2.0], [1.0, nan, 3.0], none, middle
                        )[1] == pytest.approx([1.0, 2.8, 3.0])
 
     # Time AND voltage interpolation case
-    assert interpolate([0.0, 1.8, 2.0, 'hi', 4], [1.0, 'hi', 3.0, 4.0, 5.0],
-                       [3], [1])[0] == pytest.approx([0.0, 1.8, 2.0, 3.0, 4.0])
-    assert interpolate([0.0, 1.8, 2.0, 'hi', 4], [1.0, 'hi', 3.0, 4.0, 5.0],
-                       [3], [1])[1] == pytest.approx([1.0, 2.8, 3.0, 4.0, 5.0])
+    assert interpolate([0.0, 1.8, 2.0, nan, 4], [1.0, nan, 3.0, 4.0, 5.0],
+                       time_mask, voltage_mask)[0] == pytest.approx(
+                           [0.0, 1.8, 2.0, 3.0, 4.0])
+    assert interpolate([0.0, 1.8, 2.0, nan, 4], [1.0, nan, 3.0, 4.0, 5.0],
+                       time_mask, voltage_mask)[1] == pytest.approx(
+                           [1.0, 2.8, 3.0, 4.0, 5.0])
 
     # First entry case
-    assert interpolate(['hi', 1.0, 2.0], [1.0, 2.0, 3.0], [0], []
+    assert interpolate([nan, 1.0, 2.0], [1.0, 2.0, 3.0], first, none
                        )[0] == pytest.approx([1.0, 2.0])
-    assert interpolate(['hi', 1.0, 2.0], [1.0, 2.0, 3.0], [0], []
+    assert interpolate([nan, 1.0, 2.0], [1.0, 2.0, 3.0], first, none
                        )[1] == pytest.approx([2.0, 3.0])
 
     # Last entry case
-    assert interpolate([0.0, 1.0, 'hi'], [1.0, 2.0, 3.0], [2], []
+    assert interpolate([0.0, 1.0, nan], [1.0, 2.0, 3.0], last, none
                        )[0] == pytest.approx([0.0, 1.0])
-    assert interpolate([0.0, 1.0, 'hi'], [1.0, 2.0, 3.0], [2], []
+    assert interpolate([0.0, 1.0, nan], [1.0, 2.0, 3.0], last, none
                        )[1] == pytest.approx([1.0, 2.0])
 
 
@@ -130,6 +146,46 @@ def test_check_time_data(times):
         check_time_data(times)
 
 
+@pytest.mark.parametrize("repair, times, expected", [
+    ("reject", [0.0, 0.5, 1.0], [0.0, 0.5, 1.0]),
+    ("reject", [0.0, 0.25, 1.0], [0.0, 0.25, 1.0]),
+    ("dedupe", [-1.0, 0.0, 0.5, 0.5, 1.0], [0.0, 0.5, 1.0]),
+    ("sort", [0.0, 1.0, 0.5, -2.0, 1.0, 1.5], [0.0, 0.5, 1.0, 1.5])])
+def test_check_time_data_repair(repair, times, expected):
+    """ Tests the repairs of the function "check_time_data" from
+    heartRateMonitor.py
+
+    :param repair: "reject", "dedupe" or "sort"
+    :param times: List of time data
+    :param expected: List of the repaired time data
+    :returns: passes if ascending data is accepted and bad data repaired
+    with the voltages kept in line, fails otherwise
+    """
+    from heartRateMonitor import check_time_data
+    voltages = numpy.array(times) * 10 + numpy.arange(len(times)) * 0.001
+    new_times, new_voltages, report = check_time_data(times, voltages,
+                                                      repair)
+    numpy.testing.assert_array_equal(new_times, expected)
+    # Samples keep their own voltage, and the first of equal times is kept
+    numpy.testing.assert_array_equal(numpy.round(new_voltages, 1),
+                                     numpy.array(expected) * 10)
+    assert numpy.all(numpy.diff(new_voltages[new_times == 1.0]) >= 0)
+    assert report["num_samples"] == len(times)
+    uniform = numpy.all(numpy.diff(expected) == 0.5)
+    assert report["sample_rate"] == (2.0 if uniform else None)
+    if repair == "sort":
+        assert report["num_out_of_order"] == 1
+        assert report["num_duplicates"] == 1
+        assert report["num_negative"] == 1
+        assert new_voltages[2] == pytest.approx(10.001)
+    with pytest.raises(ValueError):
+        check_time_data([0.0, 1.0, 0.5], repair="dedupe")
+    with pytest.raises(ValueError):
+        check_time_data([0.0, 1.0, 1.0], repair="reject")
+    with pytest.raises(ValueError):
+        check_time_data([0.0, 1.0], repair="shuffle")
+
+
 def test_user_specify_time():
     """ Tests the function "user_specify_time" from heartRateMonitor.py
 
@@ -233,7 +289,7 @@ def test_metrics_to_dict():
     assert metrics_to_dict(times, voltages)["voltage_extremes"] == (0, 2)
     assert metrics_to_dict(times, voltages)["duration"] == 10
     assert metrics_to_dict(times, voltages)["num_beats"] == 2
-    assert metrics_to_dict(times, voltages)["beats"] == [2, 6]
+    assert metrics_to_dict(times, voltages)["beats"] == pytest.approx([2, 6])
 
 
 def test_dict_to_json():
@@ -253,3 +309,1199 @@ def test_dict_to_json():
         assert ret_dict["duration"] == 10
         assert ret_dict["num_beats"] == 2
         assert ret_dict["beats"] == [2, 6]
+
+
+def test_interpolate_adjacent_invalid():
+    """ Tests that "interpolate" from heartRateMonitor.py fills runs of up to
+    max_gap invalid entries and drops longer ones
+
+    :returns: passes if short runs are interpolated and long runs dropped,
+    fails otherwise
+    """
+    from heartRateMonitor import interpolate
+    nan = float('nan')
+    times = [0.0, 1.0, 2.0, 3.0, 4.0]
+    voltages = [1.0, nan, nan, 4.0, 5.0]
+    mask = [False, True, True, False, False]
+    new_times, new_voltages = interpolate(times, voltages, [False] * 5, mask)
+    assert new_times == pytest.approx(times)
+    assert new_voltages == pytest.approx([1.0, 2.0, 3.0, 4.0, 5.0])
+    new_times, new_voltages = interpolate(times, voltages, [False] * 5, mask,
+                                          max_gap=1)
+    assert new_times == pytest.approx([0.0, 3.0, 4.0])
+    assert new_voltages == pytest.approx([1.0, 4.0, 5.0])
+
+
+@pytest.mark.parametrize("max_gap", [1, 3, 10])
+def test_fill_invalid_runs(max_gap):
+    """ Tests the function "fill_invalid" from heartRateMonitor.py on runs of
+    invalid entries of several lengths
+
+    :param max_gap: Longest run of invalid entries to fill
+    :returns: passes if runs of up to max_gap entries between valid ones are
+    filled along a linear time axis, and longer runs and runs at the ends
+    are left as NaN, fails otherwise
+    """
+    from heartRateMonitor import fill_invalid
+    times = numpy.arange(40) * 0.5
+    voltages = numpy.sin(times)
+    time_invalid = numpy.zeros(40, dtype=bool)
+    voltage_invalid = numpy.zeros(40, dtype=bool)
+    voltage_invalid[[0, 1, 39]] = True
+    voltage_invalid[5:7] = True
+    voltage_invalid[10:14] = True
+    time_invalid[20:25] = True
+    time_invalid[30] = True
+    voltage_invalid[30] = True
+    new_times, new_voltages = fill_invalid(
+        numpy.where(time_invalid, numpy.nan, times),
+        numpy.where(voltage_invalid, numpy.nan, voltages), time_invalid,
+        voltage_invalid, max_gap)
+    for start, stop in [(5, 7), (10, 14), (20, 25), (30, 31)]:
+        filled = stop - start <= max_gap
+        assert numpy.isfinite(new_times[start:stop]).all() == (
+            filled or not time_invalid[start])
+        assert numpy.isfinite(new_voltages[start:stop]).all() == (
+            filled or not voltage_invalid[start])
+        if filled:
+            assert new_times[start:stop] == pytest.approx(
+                times[start:stop])
+            expected = numpy.interp(times[start:stop],
+                                    times[[start - 1, stop]],
+                                    voltages[[start - 1, stop]])
+            if not voltage_invalid[start]:
+                expected = voltages[start:stop]
+            assert new_voltages[start:stop] == pytest.approx(expected)
+    assert numpy.isnan(new_voltages[[0, 1, 39]]).all()
+    assert new_voltages[2] == voltages[2]
+
+
+def test_gap_edges():
+    """ Tests the function "gap_edges" from heartRateMonitor.py
+
+    :returns: passes if only the samples bounding a long step are flagged,
+    fails otherwise
+    """
+    from heartRateMonitor import gap_edges
+    times = [0.0, 1.0, 2.0, 9.0, 10.0, 11.0, 14.0, 15.0]
+    assert gap_edges(times, 5).tolist() == [False, False, True, True, False,
+                                            False, False, False]
+    assert gap_edges(times, 1).tolist() == [False, False, True, True, False,
+                                            True, True, False]
+
+
+@pytest.mark.parametrize("times, expected", [
+    ([0.0, 9.0, 10.0, 11.0, 12.0, 13.0], [0, 1]),
+    ([0.0, 1.0, 2.0, 9.0, 16.0, 17.0, 18.0, 19.0], [2, 3, 4]),
+    ([0.0, 1.0, 2.0, 3.0, 4.0, 11.0], [4, 5])])
+def test_gap_edges_typical_step(times, expected):
+    """ Tests the function "gap_edges" from heartRateMonitor.py on a gap at
+    the start, two gaps back to back and a gap at the end
+
+    :param times: Array of time data
+    :param expected: Indices of the samples bounding a gap
+    :returns: passes if every gap is found against the typical step, also
+    in the part of the times around the gaps given that step, fails
+    otherwise
+    """
+    from heartRateMonitor import gap_edges, typical_step
+    assert numpy.flatnonzero(gap_edges(times, 5)).tolist() == expected
+    assert typical_step(times) == 1.0
+    part = times[expected[0]:expected[-1] + 1]
+    assert gap_edges(part, 5, typical_step(times)).all()
+
+
+def test_main():
+    """ Tests the function "main" from heartRateMonitor.py on the sample data
+
+    :return: passes if the JSON output matches the metrics computed directly
+    from the csv, fails otherwise
+    """
+    from heartRateMonitor import main
+    main("test_data1.csv", 10)
+    with open("test_data1.json", "r") as testfile:
+        ret_dict = json.load(testfile)
+    assert ret_dict["duration"] == pytest.approx(10.0)
+    assert ret_dict["num_beats"] == len(ret_dict["beats"])
+    assert ret_dict["num_beats"] > 0
+
+
+def test_ecg_analysis(monkeypatch):
+    """ Tests the class "ECGAnalysis" from heartRateMonitor.py
+
+    :param monkeypatch: pytest fixture used to count peak detection calls
+    :return: passes if every metric is correct and peak detection only runs
+    once, fails otherwise
+    """
+    from heartRateMonitor import ECGAnalysis, StreamingBeatDetector
+    calls = []
+    feed_indices = StreamingBeatDetector.feed_indices
+
+    def counting_feed_indices(*args, **kwargs):
+        calls.append(1)
+        return feed_indices(*args, **kwargs)
+    monkeypatch.setattr(StreamingBeatDetector, "feed_indices",
+                        counting_feed_indices)
+
+    metrics = ECGAnalysis(times, voltages).to_dict()
+    assert metrics["mean_hr_bpm"] == 2/10*60
+    assert metrics["voltage_extremes"] == (0, 2)
+    assert metrics["duration"] == 10
+    assert metrics["num_beats"] == 2
+    assert metrics["beats"] == pytest.approx([2, 6])
+    assert len(calls) == 1
+
+
+def test_ecg_analysis_known_values():
+    """ Tests that "ECGAnalysis" from heartRateMonitor.py uses the time
+    range, voltage extremes and detection voltages it is given
+
+    :return: passes if the given values are used instead of computed, fails
+    otherwise
+    """
+    from heartRateMonitor import ECGAnalysis
+    detection = numpy.array([0, 0, 0, 0, 0, 0, 2, 0, 0, 0], dtype=float)
+    analysis = ECGAnalysis(times[:10], voltages, time_range=(0.0, 12.0),
+                           voltage_extremes=(-1.0, 2.0),
+                           detection_voltages=detection)
+    assert analysis.duration == 12.0
+    assert analysis.voltage_extremes == (-1.0, 2.0)
+    assert list(analysis.beat_times) == [6]
+
+
+def test_read_chunks():
+    """ Tests the function "read_chunks" from heartRateMonitor.py using the
+    dummy csv file, "dummy.csv"
+
+    :returns: passes if the file is split into chunks of the requested size,
+    fails otherwise
+    """
+    from heartRateMonitor import read_chunks
+    chunks = list(read_chunks("dummy.csv", 2))
+    assert len(chunks) == 2
+    assert chunks[0][0] == pytest.approx([0, 1])
+    assert chunks[1][1] == pytest.approx([3])
+
+
+def test_clean_chunks():
+    """ Tests the function "clean_chunks" from heartRateMonitor.py
+
+    :returns: passes if invalid values on chunk boundaries are interpolated
+    (or dropped at the ends) like the in-memory pipeline, fails otherwise
+    """
+    from heartRateMonitor import clean_chunks
+    chunks = [([0.0, 1.0], ['hi', 2.0]), ([2.0], ['hi']),
+              ([3.0, 4.0], [500.0, 'hi'])]
+    cleaned = list(clean_chunks(chunks))
+    new_times = numpy.concatenate([chunk[0] for chunk in cleaned])
+    new_voltages = numpy.concatenate([chunk[1] for chunk in cleaned])
+    assert new_times == pytest.approx([1.0, 2.0, 3.0])
+    assert new_voltages == pytest.approx([2.0, 251.0, 300.0])
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 3, 5])
+def test_streaming_beat_detector(chunksize):
+    """ Tests the class "StreamingBeatDetector" from heartRateMonitor.py
+
+    :param chunksize: Number of samples fed to the detector at a time
+    :returns: passes if the beats match peakutils for any chunk size,
+    including flat-topped peaks split across chunks, fails otherwise
+    """
+    import peakutils
+    from heartRateMonitor import StreamingBeatDetector
+    signal = numpy.array([0, 0, 2, 1, 3, 3, 3, 3, 0, 5, 5, 1, 4, 4, 4, 5, 0,
+                          2, 2], dtype=float)
+    signal_times = numpy.arange(signal.size) * 0.5
+    expected = signal_times[peakutils.peak.indexes(signal, thres=1.5,
+                                                   thres_abs=True)]
+    detector = StreamingBeatDetector(1.5)
+    found = [detector.feed(signal_times[i:i + chunksize],
+                           signal[i:i + chunksize])
+             for i in range(0, signal.size, chunksize)]
+    assert numpy.concatenate(found) == pytest.approx(expected)
+
+
+def test_ecg_analysis_matches_peakutils():
+    """ Tests that "ECGAnalysis" from heartRateMonitor.py finds the same
+    beats as peakutils on the sample data when no refractory period is used
+
+    :returns: passes if the beat indices are equal, fails otherwise
+    """
+    import peakutils
+    from heartRateMonitor import extract_file, ECGAnalysis
+    time, voltage = extract_file("test_data1.csv")
+    expected = peakutils.peak.indexes(voltage, thres=0.80)
+    found = ECGAnalysis(time, voltage, refractory=0.0).beat_indices
+    assert list(found) == list(expected)
+
+
+def test_refractory_period():
+    """ Tests the refractory period of "StreamingBeatDetector" from
+    heartRateMonitor.py
+
+    :returns: passes if only the tallest of several close peaks is kept,
+    fails otherwise
+    """
+    from heartRateMonitor import StreamingBeatDetector
+    signal = numpy.array([0, 3, 2, 4, 2, 3, 0, 0, 0, 0, 3, 0, 0])
+    signal_times = numpy.arange(signal.size) * 0.05
+    detector = StreamingBeatDetector(1.0, refractory=0.2)
+    indices = numpy.concatenate((detector.feed_indices(signal_times,
+                                                       signal)[0],
+                                 detector.flush()[0]))
+    assert list(indices) == [3, 10]
+
+
+def test_min_prominence():
+    """ Tests the minimum prominence of "StreamingBeatDetector" from
+    heartRateMonitor.py
+
+    :returns: passes if peaks that barely rise above the preceding trough
+    are skipped, fails otherwise
+    """
+    from heartRateMonitor import StreamingBeatDetector
+    signal = numpy.array([0, 5, 0, 4, 3.5, 4, 0, 1, 0])
+    detector = StreamingBeatDetector(0.5, min_prominence=2.0)
+    indices = numpy.concatenate((detector.feed_indices(
+        numpy.arange(signal.size), signal)[0], detector.flush()[0]))
+    assert list(indices) == [1, 3]
+
+
+@pytest.mark.parametrize("refractory, min_prominence", [(0.0, 0.0),
+                                                        (0.2, 0.0),
+                                                        (0.2, 2.0)])
+def test_select_candidates(refractory, min_prominence):
+    """ Tests the method "select_candidates" of "StreamingBeatDetector" from
+    heartRateMonitor.py
+
+    :param refractory: Shortest time (in seconds) between two beats
+    :param min_prominence: Least rise of a beat above the preceding trough
+    :returns: passes if selecting the candidates of a detector without
+    rules gives the beats of feeding the samples, fails otherwise
+    """
+    from heartRateMonitor import StreamingBeatDetector
+    signal = numpy.array([0, 3, 2, 4, 2, 3, 0, 5, 0, 4, 3.5, 4, 0, 3, 0])
+    signal_times = numpy.arange(signal.size) * 0.05
+    candidates = StreamingBeatDetector(1.0).feed_indices(signal_times,
+                                                         signal)[0]
+    detector = StreamingBeatDetector(1.0, refractory, min_prominence)
+    expected = numpy.concatenate((detector.feed_indices(signal_times,
+                                                        signal)[0],
+                                  detector.flush()[0]))
+    detector = StreamingBeatDetector(1.0, refractory, min_prominence)
+    indices = numpy.concatenate((detector.select_candidates(
+        candidates, signal_times[candidates], signal)[0],
+        detector.flush()[0]))
+    assert list(indices) == list(expected)
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 3, 7, 50])
+def test_streaming_refractory(chunksize):
+    """ Tests that the refractory and prominence rules of
+    "StreamingBeatDetector" from heartRateMonitor.py do not depend on how
+    the data is split into chunks
+
+    :param chunksize: Number of samples fed to the detector at a time
+    :returns: passes if the chunked beats equal the whole-signal beats,
+    fails otherwise
+    """
+    from heartRateMonitor import StreamingBeatDetector
+    random = numpy.random.RandomState(4)
+    signal = numpy.round(random.normal(size=400), 1)
+    signal_times = numpy.arange(signal.size) * 0.01
+    whole = StreamingBeatDetector(0.5, 0.05, 1.0)
+    expected = numpy.concatenate((whole.feed(signal_times, signal),
+                                  whole.flush()[1]))
+    detector = StreamingBeatDetector(0.5, 0.05, 1.0)
+    found = [detector.feed(signal_times[i:i + chunksize],
+                           signal[i:i + chunksize])
+             for i in range(0, signal.size, chunksize)]
+    found.append(detector.flush()[1])
+    assert numpy.concatenate(found) == pytest.approx(expected)
+    assert numpy.diff(expected).min() >= 0.05
+
+
+@pytest.mark.parametrize("endtime", [10, "none", 100])
+def test_stream_metrics_to_dict(endtime):
+    """ Tests the function "stream_metrics_to_dict" from heartRateMonitor.py
+    against the in-memory pipeline on the sample data
+
+    :param endtime: Time (in seconds) at which the data should end
+    :returns: passes if the chunked metrics equal the in-memory metrics,
+    fails otherwise
+    """
+    from heartRateMonitor import extract_file, convert_to_floats, \
+        interpolate, voltage_clip, user_specify_time, metrics_to_dict, \
+        stream_metrics_to_dict
+    time, voltage = extract_file("test_data1.csv")
+    time, time_invalid = convert_to_floats(time)
+    voltage, voltage_invalid = convert_to_floats(voltage)
+    time, voltage = interpolate(time, voltage, time_invalid, voltage_invalid)
+    time, voltage = user_specify_time(time, voltage_clip(voltage), endtime)
+    expected = metrics_to_dict(time, voltage)
+    metrics = stream_metrics_to_dict("test_data1.csv", endtime, 777)
+    assert metrics["mean_hr_bpm"] == expected["mean_hr_bpm"]
+    assert metrics["voltage_extremes"] == expected["voltage_extremes"]
+    assert metrics["duration"] == expected["duration"]
+    assert metrics["num_beats"] == expected["num_beats"]
+    assert metrics["beats"] == pytest.approx(expected["beats"])
+
+
+def test_online_heart_rate_monitor():
+    """ Tests the class "OnlineHeartRateMonitor" from heartRateMonitor.py
+
+    :returns: passes if batches fed to a window covering the whole recording
+    give the same beats and heart rate as the batch functions, fails otherwise
+    """
+    from heartRateMonitor import OnlineHeartRateMonitor
+    sample_times = times[:len(voltages)]
+    monitor = OnlineHeartRateMonitor(window=100.0)
+    for i in range(0, len(voltages), 3):
+        mean_hr = monitor.update(sample_times[i:i + 3], voltages[i:i + 3])
+    assert monitor.beats == pytest.approx([2, 6])
+    assert monitor.duration == 9
+    assert mean_hr == pytest.approx(2 / 9 * 60)
+    assert monitor.voltage_extremes == (0, 2)
+
+
+def test_online_heart_rate_monitor_window():
+    """ Tests that "OnlineHeartRateMonitor" from heartRateMonitor.py only
+    keeps beats and samples inside its sliding window
+
+    :returns: passes if old beats leave the window and the rolling heart rate
+    follows the signal, fails otherwise
+    """
+    from heartRateMonitor import OnlineHeartRateMonitor
+    # One beat per second, sampled every 0.25 s, for 60 s
+    signal_times = numpy.arange(240) * 0.25
+    signal = numpy.tile([0.0, 1.0, 0.0, 0.0], 60)
+    monitor = OnlineHeartRateMonitor(window=10.0)
+    for i in range(0, signal.size, 4):
+        monitor.update(signal_times[i:i + 4], signal[i:i + 4])
+    assert monitor.duration == pytest.approx(10.0)
+    assert monitor.num_beats == 10
+    assert monitor.beats[0] >= signal_times[-1] - 10.0
+    assert monitor.mean_hr_bpm == pytest.approx(60.0)
+
+
+def test_analyze_file_cache(tmpdir, monkeypatch):
+    """ Tests that "analyze_file" from heartRateMonitor.py reuses cached
+    preprocessed data
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param monkeypatch: pytest fixture used to block csv parsing
+    :returns: passes if a repeat analysis skips csv parsing and gives the same
+    metrics, fails otherwise
+    """
+    import shutil
+    import heartRateMonitor
+    filepath = str(tmpdir.join("ecg.csv"))
+    cache_dir = str(tmpdir.join("cache"))
+    shutil.copy("test_data1.csv", filepath)
+    with open(heartRateMonitor.analyze_file(filepath, 10, None, cache_dir),
+              "r") as file:
+        first = json.load(file)
+
+    def fail(filepath):
+        raise AssertionError("csv parsed despite cache")
+    monkeypatch.setattr(heartRateMonitor, "extract_file", fail)
+    with open(heartRateMonitor.analyze_file(filepath, 5, None, cache_dir),
+              "r") as file:
+        second = json.load(file)
+    assert second["beats"] == first["beats"][:len(second["beats"])]
+    assert second["duration"] == pytest.approx(5.0)
+
+
+def test_main_timing(tmpdir):
+    """ Tests the timing and profiling options of "main" from
+    heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if the timing report lists every stage with its rows and
+    the cProfile dump is written, fails otherwise
+    """
+    import shutil
+    import pstats
+    from heartRateMonitor import main
+    filepath = str(tmpdir.join("ecg.csv"))
+    profile_filepath = str(tmpdir.join("ecg.prof"))
+    shutil.copy("test_data1.csv", filepath)
+    main(filepath, 10, timing=True, profile_filepath=profile_filepath)
+    with open(str(tmpdir.join("ecg_timing.json")), "r") as file:
+        report = json.load(file)
+    stages = [record["stage"] for record in report["stages"]]
+    assert stages == ["extract_file", "convert_to_floats", "interpolate",
+                      "voltage_clip", "check_time_data", "user_specify_time",
+                      "metrics_to_dict", "dict_to_json"]
+    assert report["stages"][0]["rows"] == 10000
+    assert pstats.Stats(profile_filepath).total_calls > 0
+
+
+@pytest.mark.parametrize("step", [None, 5, 2.5])
+def test_windowed_metrics(step):
+    """ Tests the class "WindowedMetrics" from heartRateMonitor.py against
+    the metrics of each window computed directly
+
+    :param step: Time (in seconds) between the starts of consecutive windows
+    :returns: passes if every window matches, however the samples are
+    chunked, fails otherwise
+    """
+    from heartRateMonitor import WindowedMetrics, preprocess_file, \
+        get_beats_times
+    time, voltage = preprocess_file("test_data1.csv")
+    beats = get_beats_times(time, voltage)
+    windows = WindowedMetrics(10, step)
+    windows.update(time, voltage)
+    metrics = windows.to_dict(beats)
+    chunked = WindowedMetrics(10, step)
+    for start in range(0, time.size, 777):
+        chunked.update(time[start:start + 777], voltage[start:start + 777])
+    assert chunked.to_dict(beats)["voltage_min"] == \
+        pytest.approx(metrics["voltage_min"])
+    assert metrics["start"][0] == time[0]
+    assert metrics["start"][-1] + 10 >= time[-1]
+    for index, start in enumerate(metrics["start"]):
+        inside = (time >= start) & (time < start + 10)
+        num_beats = ((beats >= start) & (beats < start + 10)).sum()
+        duration = min(start + 10, time[-1]) - start
+        assert metrics["num_beats"][index] == num_beats
+        assert metrics["mean_hr_bpm"][index] == \
+            pytest.approx(num_beats / duration * 60)
+        assert metrics["voltage_min"][index] == voltage[inside].min()
+        assert metrics["voltage_max"][index] == voltage[inside].max()
+
+
+def test_windowed_metrics_gap():
+    """ Tests that "WindowedMetrics" from heartRateMonitor.py reports
+    windows without samples as NaN
+
+    :returns: passes if the empty window has NaN extremes and no beats,
+    fails otherwise
+    """
+    from heartRateMonitor import WindowedMetrics
+    windows = WindowedMetrics(1.0)
+    windows.update([0.0, 0.5], [1.0, 2.0])
+    windows.update([2.5, 3.0], [3.0, 4.0])
+    metrics = windows.to_dict([0.5, 2.5])
+    assert list(metrics["num_beats"]) == [1, 0, 1, 0]
+    assert numpy.isnan(metrics["voltage_max"][1])
+    assert list(metrics["voltage_max"][[0, 2, 3]]) == [2.0, 3.0, 4.0]
+    with pytest.raises(ValueError):
+        WindowedMetrics(10, 3)
+
+
+@pytest.mark.parametrize("chunksize", [None, 1000])
+def test_main_windows(tmpdir, chunksize):
+    """ Tests the windowed output of "main" from heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param chunksize: Number of csv rows to hold in memory at once
+    :returns: passes if a windows file is written next to the summary and
+    its beats add up to the summary, fails otherwise
+    """
+    import shutil
+    from heartRateMonitor import main
+    filepath = str(tmpdir.join("ecg.csv"))
+    shutil.copy("test_data1.csv", filepath)
+    main(filepath, 25, chunksize, window=10)
+    with open(str(tmpdir.join("ecg.json")), "r") as file:
+        summary = json.load(file)
+    with open(str(tmpdir.join("ecg_windows.json")), "r") as file:
+        windows = json.load(file)
+    assert windows["start"] == pytest.approx([0, 10, 20])
+    assert windows["duration"] == pytest.approx([10, 10, 5])
+    assert sum(windows["num_beats"]) == summary["num_beats"]
+
+
+def write_leads(filepath, header):
+    """ Writes a three-lead csv file whose leads are scaled copies of the
+    sample data
+
+    :param filepath: A String representing the path of the new csv file
+    :param header: True to start the file with a header row
+    :returns: Arrays of the sample time and voltage data
+    """
+    from heartRateMonitor import extract_file
+    time, voltage = extract_file("test_data1.csv")
+    with open(filepath, "w") as file:
+        if header:
+            file.write("time,I,II,III\n")
+        for row in zip(time, voltage, 2 * voltage, -voltage):
+            file.write(",".join(repr(float(value)) for value in row) + "\n")
+    return time, voltage
+
+
+@pytest.mark.parametrize("small_file_bytes", [0, 10 ** 9])
+def test_extract_file_leads(tmpdir, monkeypatch, small_file_bytes):
+    """ Tests the function "extract_file" from heartRateMonitor.py on a
+    multi-lead csv file, with both the pandas and the csv module readers
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param monkeypatch: pytest fixture used to pick the csv reader
+    :param small_file_bytes: Size below which the csv module reader is used
+    :returns: passes if the header row is skipped and the voltages come back
+    as one column per lead, fails otherwise
+    """
+    import heartRateMonitor
+    monkeypatch.setattr(heartRateMonitor, "SMALL_FILE_BYTES",
+                        small_file_bytes)
+    filepath = str(tmpdir.join("leads.csv"))
+    time, voltage = write_leads(filepath, header=True)
+    assert heartRateMonitor.read_lead_names(filepath) == \
+        (["I", "II", "III"], True)
+    new_time, new_voltage = heartRateMonitor.extract_file(filepath)
+    assert new_voltage.shape == (time.size, 3)
+    assert new_time == pytest.approx(time, nan_ok=True)
+    assert new_voltage[:, 1] == pytest.approx(2 * voltage, nan_ok=True)
+
+
+def test_read_lead_names(tmpdir):
+    """ Tests the function "read_lead_names" from heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if leads are named from the header row, or numbered
+    when there is none, fails otherwise
+    """
+    from heartRateMonitor import read_lead_names
+    filepath = str(tmpdir.join("leads.csv"))
+    tmpdir.join("leads.csv").write("\n0,1,2,3\n")
+    assert read_lead_names(filepath) == (["lead_1", "lead_2", "lead_3"],
+                                         False)
+    assert read_lead_names("test_data1.csv") == (["voltage"], False)
+
+
+def test_interpolate_leads():
+    """ Tests the function "interpolate" from heartRateMonitor.py on
+    multi-lead data
+
+    :returns: passes if each lead is interpolated on its own and rows that
+    cannot be repaired in any lead are dropped, fails otherwise
+    """
+    from heartRateMonitor import convert_to_floats, interpolate
+    time, time_invalid = convert_to_floats([0.0, 1.0, 2.0, 3.0])
+    voltage, voltage_invalid = convert_to_floats(
+        numpy.array([[1.0, 'a'], ['b', 4.0], [3.0, 6.0], [5.0, 'c']],
+                    dtype=object))
+    assert voltage_invalid.tolist() == [[False, True], [True, False],
+                                        [False, False], [False, True]]
+    new_time, new_voltage = interpolate(time, voltage, time_invalid,
+                                        voltage_invalid)
+    assert new_time == pytest.approx([1.0, 2.0])
+    assert new_voltage.tolist() == [[2.0, 4.0], [3.0, 6.0]]
+
+
+def test_analyze_file_leads(tmpdir):
+    """ Tests the function "analyze_file" from heartRateMonitor.py on a
+    multi-lead csv file, with and without the cache
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if every lead has the metrics of the same data analyzed
+    on its own, fails otherwise
+    """
+    from heartRateMonitor import analyze_file
+    filepath = str(tmpdir.join("leads.csv"))
+    write_leads(filepath, header=True)
+    with open(analyze_file("test_data1.csv", 10), "r") as file:
+        single = json.load(file)
+    del single["quality"]
+    cache_dir = str(tmpdir.join("cache"))
+    for attempt in range(2):
+        with open(analyze_file(filepath, 10, cache_dir=cache_dir)) as file:
+            metrics = json.load(file)
+        assert metrics["num_leads"] == 3
+        assert metrics["leads"]["I"] == single
+        assert metrics["leads"]["II"]["beats"] == single["beats"]
+        assert metrics["leads"]["III"]["voltage_extremes"] == \
+            [-single["voltage_extremes"][1], -single["voltage_extremes"][0]]
+    with pytest.raises(ValueError):
+        analyze_file(filepath, 10, chunksize=100)
+
+
+def test_user_specify_time_start():
+    """ Tests the start time of the function "user_specify_time" from
+    heartRateMonitor.py
+
+    :returns: passes if time and voltage data are trimmed to the window
+    between a valid start time and the end time, fails otherwise
+    """
+    from heartRateMonitor import user_specify_time
+    times = [0.0, 0.01, 0.02, 0.03]
+    voltages = [0.0, 100.0, 200.0, 300.0]
+    assert user_specify_time(times, voltages, 0.02, 0.01)[0] == \
+        pytest.approx([0.01, 0.02])
+    assert user_specify_time(times, voltages, 0.02, 0.005)[1] == \
+        pytest.approx([100.0, 200.0])
+    assert user_specify_time(times, voltages, None, 0.015)[0] == \
+        pytest.approx([0.02, 0.03])
+    # Invalid start times, or a start after the end, are ignored
+    for start in [-1, "abc", 0.04]:
+        assert user_specify_time(times, voltages, 0.01, start)[0] == \
+            pytest.approx([0.0, 0.01])
+    assert user_specify_time(times, voltages, 0.01, 0.02)[0] == \
+        pytest.approx([0.0, 0.01])
+
+
+@pytest.mark.parametrize("start, endtime", [(3.0, 6.0), (0.0, 2.5),
+                                            (8.5, None)])
+def test_analyze_file_start(tmpdir, monkeypatch, start, endtime):
+    """ Tests that "analyze_file" from heartRateMonitor.py reads only the
+    window around [start, endtime] of a csv file
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param monkeypatch: pytest fixture used to block whole-file parsing
+    :param start: Time (in seconds) at which the data should start
+    :param endtime: Time (in seconds) at which the data should end
+    :returns: passes if the metrics match those of the whole file trimmed
+    to the window, fails otherwise
+    """
+    import shutil
+    import heartRateMonitor
+    filepath = str(tmpdir.join("ecg.csv"))
+    shutil.copy("test_data1.csv", filepath)
+    time, voltage = heartRateMonitor.preprocess_file(filepath)
+    time, voltage = heartRateMonitor.user_specify_time(time, voltage,
+                                                       endtime, start)
+    expected = json.loads(json.dumps(heartRateMonitor.metrics_to_dict(
+        time, voltage), default=heartRateMonitor.to_json_type))
+
+    def fail(filepath):
+        raise AssertionError("whole csv file parsed")
+    monkeypatch.setattr(heartRateMonitor, "extract_file", fail)
+    with open(heartRateMonitor.analyze_file(filepath, endtime, start=start,
+                                            index_every=100)) as file:
+        metrics = json.load(file)
+    assert metrics.pop("quality") == {}
+    assert metrics == expected
+    names = [str(path) for path in tmpdir.listdir()]
+    assert str(tmpdir.join("ecg.idx")) in names
+
+
+@pytest.mark.parametrize("start, endtime", [(3.0, 6.0), (1.5, 9.5)])
+def test_analyze_file_start_gaps(tmpdir, start, endtime):
+    """ Tests that "analyze_file" from heartRateMonitor.py reads enough rows
+    around a window to fill in the invalid samples on its edges, even with
+    an index entry for every row
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param start: Time (in seconds) at which the data should start
+    :param endtime: Time (in seconds) at which the data should end
+    :returns: passes if the metrics match those of the whole file trimmed
+    to the window, fails otherwise
+    """
+    import heartRateMonitor
+    with open("test_data1.csv", "r") as file:
+        rows = [line.split(",") for line in file.read().splitlines()]
+    times = [float(time) for time, voltage in rows]
+    first = int(numpy.searchsorted(times, start))
+    last = int(numpy.searchsorted(times, endtime, side="right")) - 1
+    # Each edge row has a run of invalid voltages reaching past the rows
+    # next to it, whose times are invalid too
+    for row in range(first - 4, first + 1):
+        rows[row][1] = ""
+    for row in range(first - 3, first):
+        rows[row][0] = ""
+    for row in range(last, last + 5):
+        rows[row][1] = ""
+    for row in range(last + 1, last + 4):
+        rows[row][0] = ""
+    filepath = str(tmpdir.join("ecg.csv"))
+    with open(filepath, "w") as file:
+        file.write("\n".join(",".join(row) for row in rows) + "\n")
+    time, voltage = heartRateMonitor.preprocess_file(filepath)
+    time, voltage = heartRateMonitor.user_specify_time(time, voltage,
+                                                       endtime, start)
+    expected = json.loads(json.dumps(heartRateMonitor.metrics_to_dict(
+        time, voltage), default=heartRateMonitor.to_json_type))
+    with open(heartRateMonitor.analyze_file(filepath, endtime, start=start,
+                                            index_every=1)) as file:
+        metrics = json.load(file)
+    assert "rows_dropped" not in metrics.pop("quality")
+    assert metrics == expected
+
+
+def test_analyze_file_leads_start(tmpdir):
+    """ Tests that "analyze_file" from heartRateMonitor.py skips the header
+    row of a multi-lead csv file when reading a window from its start
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if the windowed metrics match those of the whole file
+    trimmed to the window, fails otherwise
+    """
+    from heartRateMonitor import analyze_file
+    filepath = str(tmpdir.join("leads.csv"))
+    write_leads(filepath, header=True)
+    with open(analyze_file(filepath, 4)) as file:
+        whole = json.load(file)
+    with open(analyze_file(filepath, 4, start=0.0, index_every=50)) as file:
+        window = json.load(file)
+    assert window == whole
+
+
+def test_write_json(monkeypatch):
+    """ Tests the function "write_json" from heartRateMonitor.py
+
+    :param monkeypatch: pytest fixture used to shrink the output chunks
+    :returns: passes if the text written matches that of json.dumps, fails
+    otherwise
+    """
+    import io
+    import heartRateMonitor
+    monkeypatch.setattr(heartRateMonitor, "OUTPUT_CHUNK", 3)
+    value = {"beats": numpy.arange(10) / 3.0,
+             "leads": {"I": {"voltage_extremes": (-0.5, 1.0),
+                             "num_beats": numpy.int64(7),
+                             "beats": numpy.array([numpy.nan, 2.0])}},
+             "empty": numpy.empty(0), "name": "x\"y", "mean_hr_bpm": 71.5}
+    file = io.StringIO()
+    heartRateMonitor.write_json(value, file)
+    assert file.getvalue() == json.dumps(
+        value, default=heartRateMonitor.to_json_type)
+
+
+def test_dict_to_json_npy(tmpdir):
+    """ Tests the "npy" beats format of the function "dict_to_json" from
+    heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if the beat times of each lead are saved to sidecar
+    files named in the JSON file, fails otherwise
+    """
+    from heartRateMonitor import dict_to_json
+    beats = numpy.array([0.5, 1.25, 2.0])
+    filepath = str(tmpdir.join("ecg.csv"))
+    with open(dict_to_json({"num_beats": 3, "beats": beats}, filepath,
+                           "npy")) as file:
+        metrics = json.load(file)
+    assert metrics["beats"] == {"file": "ecg_beats.npy", "dtype": "<f8",
+                                "count": 3}
+    numpy.testing.assert_array_equal(
+        numpy.load(str(tmpdir.join("ecg_beats.npy"))), beats)
+    leads = {"num_leads": 2, "leads": {"I": {"beats": beats},
+                                       "II": {"beats": beats[:1]}}}
+    with open(dict_to_json(leads, filepath, "npy")) as file:
+        metrics = json.load(file)
+    assert metrics["leads"]["II"]["beats"]["file"] == "ecg_beats_2.npy"
+    numpy.testing.assert_array_equal(
+        numpy.load(str(tmpdir.join("ecg_beats_2.npy"))), beats[:1])
+    with pytest.raises(ValueError):
+        dict_to_json(leads, filepath, "csv")
+
+
+def test_main_ndjson(tmpdir, monkeypatch):
+    """ Tests the "ndjson" windows format of "main" from heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param monkeypatch: pytest fixture used to shrink the output chunks
+    :returns: passes if each line holds the metrics of one window, matching
+    the "json" format, fails otherwise
+    """
+    import shutil
+    import heartRateMonitor
+    monkeypatch.setattr(heartRateMonitor, "OUTPUT_CHUNK", 2)
+    filepath = str(tmpdir.join("ecg.csv"))
+    shutil.copy("test_data1.csv", filepath)
+    heartRateMonitor.main(filepath, 10, window=2.0, step=1.0)
+    with open(str(tmpdir.join("ecg_windows.json"))) as file:
+        windows = json.load(file)
+    heartRateMonitor.main(filepath, 10, window=2.0, step=1.0,
+                          windows_format="ndjson")
+    with open(str(tmpdir.join("ecg_windows.ndjson"))) as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == len(windows["start"])
+    for position, line in enumerate(lines):
+        assert line["window"] == 2.0
+        assert line["num_beats"] == windows["num_beats"][position]
+        assert line["mean_hr_bpm"] == windows["mean_hr_bpm"][position]
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_ecg_record_stages(dtype):
+    """ Tests that the stages of heartRateMonitor.py accept an ECGRecord in
+    place of time and voltage arrays
+
+    :param dtype: Storage type of the record's voltages
+    :returns: passes if each stage gives the same results as on the arrays
+    the record holds, fails otherwise
+    """
+    from ecgRecord import ECGRecord
+    from heartRateMonitor import preprocess_file, user_specify_time, \
+        metrics_to_dict, WindowedMetrics, preprocess
+    time, voltage = preprocess_file("test_data1.csv")
+    time = numpy.arange(time.size) / 1000.0
+    record = ECGRecord.from_arrays(time, voltage, dtype)
+    assert record.uniform
+    voltage = record.voltages.astype(float)
+    trimmed = user_specify_time(record, None, 6.5, 2.0)
+    assert numpy.shares_memory(trimmed.voltages, record.voltages)
+    time, voltage = user_specify_time(time, voltage, 6.5, 2.0)
+    numpy.testing.assert_array_equal(trimmed.times, time)
+    expected = metrics_to_dict(time, voltage)
+    metrics = metrics_to_dict(trimmed)
+    numpy.testing.assert_array_equal(metrics.pop("beats"),
+                                     expected.pop("beats"))
+    assert metrics == expected
+    windows = WindowedMetrics(1.0)
+    windows.update(trimmed)
+    assert windows.to_dict([])["voltage_min"][0] == voltage[:1000].min()
+    cleaned = preprocess(trimmed)
+    assert cleaned.uniform
+    assert cleaned.voltages.dtype == numpy.dtype(dtype)
+
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+@pytest.mark.parametrize("uniform", [True, False])
+def test_ecg_record_each_stage(dtype, uniform):
+    """ Tests each stage of heartRateMonitor.py on an ECGRecord
+
+    :param dtype: Storage type of the record's voltages
+    :param uniform: True for an implicit time axis
+    :returns: passes if every stage accepts the record, gives the same
+    results as on its arrays, and hands back records that keep their storage
+    type and time axis, fails otherwise
+    """
+    from ecgRecord import ECGRecord
+    from heartRateMonitor import preprocess_file, convert_to_floats, \
+        interpolate, voltage_clip, check_time_data, get_duration, \
+        get_voltage_extremes, get_beats_times, get_num_beats, \
+        get_mean_hr_bpm, StreamingBeatDetector, ECGAnalysis
+    time, voltage = preprocess_file("test_data1.csv")
+    time = numpy.arange(time.size) / 360.0
+    if not uniform:
+        time[-1] += 1.0
+    voltage[[100, 2000]] = [350.0, float("nan")]
+    record = ECGRecord.from_arrays(time, voltage, dtype)
+    assert record.uniform == uniform
+    voltage = record.voltages.astype(float)
+
+    def assert_kept(result):
+        assert isinstance(result, ECGRecord)
+        assert result.uniform == uniform
+        assert result.voltages.dtype == numpy.dtype(dtype)
+
+    converted, invalid = convert_to_floats(record)
+    assert_kept(converted)
+    numpy.testing.assert_array_equal(invalid, numpy.isnan(voltage))
+    repaired = interpolate(converted, None, numpy.zeros(time.size, bool),
+                           invalid)
+    assert_kept(repaired)
+    expected = interpolate(time, voltage, numpy.zeros(time.size, bool),
+                           invalid)
+    numpy.testing.assert_array_equal(repaired.times, expected[0])
+    numpy.testing.assert_allclose(repaired.voltages, expected[1], rtol=1e-6)
+    clipped = voltage_clip(repaired)
+    assert_kept(clipped)
+    assert clipped.voltages.max() == 300.0
+    checked, report = check_time_data(clipped)
+    assert_kept(checked)
+    assert report == check_time_data(clipped.times)[-1]
+    voltage = checked.voltages.astype(float)
+    time = checked.times
+    assert get_duration(checked) == get_duration(time)
+    assert get_voltage_extremes(checked) == get_voltage_extremes(voltage)
+    numpy.testing.assert_array_equal(get_beats_times(checked),
+                                     get_beats_times(time, voltage))
+    assert get_num_beats(checked) == get_num_beats(time, voltage)
+    assert get_mean_hr_bpm(checked) == get_mean_hr_bpm(time, voltage)
+    assert ECGAnalysis(checked).voltages is checked.voltages
+    threshold = 0.8 * voltage.max()
+    indices, times = StreamingBeatDetector(threshold).feed_indices(checked)
+    numpy.testing.assert_array_equal(indices, StreamingBeatDetector(
+        threshold).feed_indices(time, voltage)[0])
+    numpy.testing.assert_array_equal(times, time[indices])
+
+
+def test_analyze_file_float32(tmpdir):
+    """ Tests the float32 storage mode of "analyze_file" from
+    heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if the metrics match those of float64 storage up to
+    float32 rounding, fails otherwise
+    """
+    import shutil
+    from heartRateMonitor import analyze_file
+    filepath = str(tmpdir.join("ecg.csv"))
+    shutil.copy("test_data1.csv", filepath)
+    with open(analyze_file(filepath, 10)) as file:
+        expected = json.load(file)
+    with open(analyze_file(filepath, 10, dtype="float32")) as file:
+        metrics = json.load(file)
+    assert metrics["beats"] == expected["beats"]
+    assert metrics["voltage_extremes"] == pytest.approx(
+        expected["voltage_extremes"], rel=1e-6)
+
+
+def test_analyze_file_time_repair(tmpdir):
+    """ Tests the time repair options of "analyze_file" from
+    heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if shuffled and duplicated rows are sorted out by
+    default and rejected on request, fails otherwise
+    """
+    from heartRateMonitor import analyze_file
+    with open("test_data1.csv", "r") as file:
+        rows = file.read().splitlines()
+    filepath = str(tmpdir.join("ecg.csv"))
+    with open(filepath, "w") as file:
+        file.write("\n".join(rows[5000:] + rows[:5000] + rows[:10]))
+    with open(analyze_file("test_data1.csv", 10), "r") as file:
+        expected = json.load(file)
+    with open(analyze_file(filepath, 10), "r") as file:
+        metrics = json.load(file)
+    assert metrics["quality"].pop("time_out_of_order")["count"] == 2
+    assert metrics["quality"].pop("time_duplicate")["count"] == 10
+    assert metrics == expected
+    for repair in ["dedupe", "reject"]:
+        with pytest.raises(ValueError):
+            analyze_file(filepath, 10, time_repair=repair)
+
+
+@pytest.mark.parametrize("chunksize", [None, 500])
+def test_analyze_file_bandpass(tmpdir, chunksize):
+    """ Tests the band option of "analyze_file" from heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param chunksize: Number of rows per chunk (None to read the whole file)
+    :returns: passes if every beat of a recording with strong baseline drift
+    is found once it is filtered, within the causal filter's delay when
+    streamed, and the voltage extremes stay those of the raw data, fails
+    otherwise
+    """
+    from heartRateMonitor import analyze_file
+    from benchmarkHeartRateMonitor import synthetic_ecg
+    times, voltages = synthetic_ecg(30.0, noise=0.02)
+    expected = times[numpy.argmax(voltages[:360])] + numpy.arange(36) / 1.2
+    voltages += 1.5 * numpy.sin(2 * numpy.pi * 0.1 * times) + 0.05 * times
+    filepath = str(tmpdir.join("ecg.csv"))
+    with open(filepath, "w") as file:
+        file.write("\n".join("{!r},{!r}".format(float(time), float(voltage))
+                             for time, voltage in zip(times, voltages)))
+    with open(analyze_file(filepath, 100, chunksize), "r") as file:
+        assert json.load(file)["num_beats"] < 36
+    with open(analyze_file(filepath, 100, chunksize,
+                           band=(0.5, 40.0)), "r") as file:
+        metrics = json.load(file)
+    assert metrics["num_beats"] == 36
+    assert metrics["beats"] == pytest.approx(expected, abs=0.015)
+    assert metrics["voltage_extremes"] == [voltages.min(), voltages.max()]
+
+
+@pytest.mark.parametrize("uniform", [True, False])
+def test_cached_metrics(uniform):
+    """ Tests the functions "result_entry" and "cached_metrics" from
+    heartRateMonitor.py
+
+    :param uniform: True for evenly spaced samples
+    :returns: passes if the same range and prefixes away from any beat are
+    answered exactly as a new analysis would, and other queries are not
+    answered, fails otherwise
+    """
+    from heartRateMonitor import result_entry, cached_metrics, \
+        metrics_to_dict, user_specify_time
+    from benchmarkHeartRateMonitor import synthetic_ecg
+    from ecgRecord import ECGRecord
+    times, voltages = synthetic_ecg(30.0)
+    # Every beat the same, so the extremes are reached in the first one
+    voltages = numpy.round(voltages, 6)
+    if not uniform:
+        times[-1] += 0.001
+    full = ECGRecord.from_arrays(times, voltages)
+    assert full.uniform == uniform
+    record = user_specify_time(full, None, 25, 1.0)
+    entry = result_entry(full, record, metrics_to_dict(record))
+    assert cached_metrics(entry, 25.001, 1.0) is entry["metrics"]
+    for end in [20.0, 10.5]:
+        expected = metrics_to_dict(user_specify_time(full, None, end, 1.0))
+        metrics = cached_metrics(entry, end, 1.0)
+        assert metrics["num_beats"] == expected["num_beats"]
+        numpy.testing.assert_array_equal(metrics["beats"], expected["beats"])
+        assert metrics["duration"] == expected["duration"]
+        assert metrics["mean_hr_bpm"] == expected["mean_hr_bpm"]
+        assert metrics["voltage_extremes"] == expected["voltage_extremes"]
+    # Too close to a beat, a longer range, another start, and a range
+    # that ends before the voltage extremes are reached
+    for end, start in [(20.2, 1.0), (26.0, 1.0), (20.0, None),
+                       (20.0, 0.5), (1.1, 1.0)]:
+        assert cached_metrics(entry, end, start) is None
+    assert cached_metrics(None, 20.0) is None
+    entry = result_entry(full, record, metrics_to_dict(record), False)
+    assert cached_metrics(entry, 25.0, 1.0) is entry["metrics"]
+    assert cached_metrics(entry, 20.0, 1.0) is None
+
+
+def test_analyze_file_result_cache(tmpdir, monkeypatch):
+    """ Tests the result cache of "analyze_file" from heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param monkeypatch: pytest fixture for replacing module attributes
+    :returns: passes if repeated and shorter queries of the same contents
+    and parameters are answered without a new analysis, from memory or from
+    disk, and give the JSON of a new analysis, fails otherwise
+    """
+    import heartRateMonitor
+    from heartRateMonitor import analyze_file, main
+    from benchmarkHeartRateMonitor import write_synthetic_csv
+    from resultCache import ResultCache
+    filepath = str(tmpdir.join("ecg.csv"))
+    write_synthetic_csv(filepath, 30.0)
+    expected = {}
+    for end in [25, 20, 10.5]:
+        with open(analyze_file(filepath, end), "r") as file:
+            expected[end] = json.load(file)
+    calls = []
+    metrics_to_dict = heartRateMonitor.metrics_to_dict
+    monkeypatch.setattr(heartRateMonitor, "metrics_to_dict",
+                        lambda *args, **kwargs: calls.append(args) or
+                        metrics_to_dict(*args, **kwargs))
+    cache_dir = str(tmpdir.join("results"))
+    cache = ResultCache(cache_dir)
+    for end in [25, 25, 20, 10.5]:
+        with open(analyze_file(filepath, end, result_cache=cache),
+                  "r") as file:
+            assert json.load(file) == expected[end]
+    assert len(calls) == 1
+    analyze_file(filepath, 25, result_cache=cache, max_gap=4)
+    assert len(calls) == 2
+    main(filepath, 20, result_cache_dir=cache_dir)
+    assert len(calls) == 2
+    with open(filepath.replace(".csv", ".json"), "r") as file:
+        assert json.load(file) == expected[20]
+
+
+def test_split_csv(tmpdir):
+    """ Tests the functions "split_csv" and "read_segment" from
+    heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if the ranges start on line boundaries and cover the
+    file, and the rows around a range skip blank lines and stop at either
+    end of the file, fails otherwise
+    """
+    from heartRateMonitor import split_csv, read_segment
+    filepath = str(tmpdir.join("ecg.csv"))
+    lines = ["{},{}\n".format(i, i % 7) for i in range(200)]
+    lines[100] = "\n"
+    with open(filepath, "w") as file:
+        file.write("".join(lines))
+    offsets = split_csv(filepath, 4)
+    assert len(offsets) == 5
+    assert offsets[0] == 0 and offsets[-1] == tmpdir.join("ecg.csv").size()
+    with open(filepath, "rb") as file:
+        data = file.read()
+    for offset in offsets[1:-1]:
+        assert data[offset - 1:offset] == b"\n"
+    before, middle, after = read_segment(filepath, offsets[1], offsets[2], 3)
+    assert middle == data[offsets[1]:offsets[2]]
+    assert len(before.splitlines()) == 3 and len(after.splitlines()) == 3
+    assert data[:offsets[1]].endswith(before)
+    assert data[offsets[2]:].startswith(after.replace(b"\n\n", b"\n"))
+    before, middle, after = read_segment(filepath, 0, offsets[1], 3)
+    assert before == b""
+    assert read_segment(filepath, offsets[3], offsets[4], 3)[2] == b""
+    assert split_csv(filepath, 1) == [0, offsets[-1]]
+
+
+@pytest.mark.parametrize("workers, band", [(2, None), (3, None),
+                                           (3, (0.5, 40.0))])
+def test_analyze_file_workers(tmpdir, monkeypatch, workers, band):
+    """ Tests the workers option of "analyze_file" from heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param monkeypatch: pytest fixture for replacing module attributes
+    :param workers: Number of worker processes
+    :param band: (low, high) band-pass cutoffs in Hz, or None
+    :returns: passes if a recording with invalid entries, spikes and a gap
+    gives exactly the metrics of a serial analysis, and multi-lead
+    recordings are rejected, fails otherwise
+    """
+    import heartRateMonitor
+    from heartRateMonitor import analyze_file
+    from benchmarkHeartRateMonitor import synthetic_ecg
+    times, voltages = synthetic_ecg(60.0, noise=0.02, seed=1)
+    rows = ["{!r},{!r}".format(float(time), float(voltage))
+            for time, voltage in zip(times, voltages)]
+    for row in range(500, len(rows), 997):
+        rows[row] = "{!r},bad".format(float(times[row]))
+    for row in range(700, len(rows), 3001):
+        rows[row] = "{!r},400.0".format(float(times[row]))
+    rows[9000:9100] = ["{!r},".format(float(time))
+                       for time in times[9000:9100]]
+    filepath = str(tmpdir.join("ecg.csv"))
+    with open(filepath, "w") as file:
+        file.write("\n".join(rows))
+    with open(analyze_file(filepath, 100, band=band), "r") as file:
+        expected = json.load(file)
+    monkeypatch.setattr(heartRateMonitor, "SMALL_FILE_BYTES", 0)
+    with open(analyze_file(filepath, 100, band=band, workers=workers),
+              "r") as file:
+        assert json.load(file) == expected
+    leads = str(tmpdir.join("leads.csv"))
+    write_leads(leads, header=True)
+    with pytest.raises(ValueError):
+        analyze_file(leads, 100, workers=workers)
+
+
+@pytest.mark.parametrize("chunksize", [None, 700])
+def test_analyze_file_hrv(tmpdir, chunksize):
+    """ Tests the heart rate variability written by "analyze_file" from
+    heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param chunksize: Number of rows per chunk (None to read the whole file)
+    :returns: passes if SDNN and RMSSD are those of the RR intervals of the
+    written beats, whether the file is read in whole or streamed, fails
+    otherwise
+    """
+    from heartRateMonitor import analyze_file
+    from benchmarkHeartRateMonitor import write_synthetic_csv
+    filepath = str(tmpdir.join("ecg.csv"))
+    write_synthetic_csv(filepath, 30.0, noise=0.05)
+    with open(analyze_file(filepath, 25, chunksize), "r") as file:
+        metrics = json.load(file)
+    intervals = numpy.diff(metrics["beats"])
+    assert metrics["sdnn_ms"] == pytest.approx(
+        1000 * intervals.std(ddof=1), rel=1e-9, abs=1e-9)
+    assert metrics["rmssd_ms"] == pytest.approx(
+        1000 * numpy.sqrt(numpy.mean(numpy.diff(intervals) ** 2)),
+        rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("chunksize", [None, 500])
+def test_analyze_file_quality(tmpdir, monkeypatch, chunksize):
+    """ Tests the quality section written by "analyze_file" from
+    heartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :param monkeypatch: pytest fixture used to capture warnings
+    :returns: passes if invalid entries, clipped voltages and dropped rows
+    are counted once each, with examples, whether the file is read in whole
+    or streamed, and logged as one warning per kind, fails otherwise
+    """
+    import logging
+    from heartRateMonitor import analyze_file
+    from benchmarkHeartRateMonitor import synthetic_ecg
+    times, voltages = synthetic_ecg(30.0)
+    rows = ["{!r},{!r}".format(float(time), float(voltage))
+            for time, voltage in zip(times, voltages)]
+    for row in range(100, 1100, 100):
+        rows[row] = "{!r},bad{}".format(float(times[row]), row)
+    for row in range(1500, 1800, 100):
+        rows[row] = "{!r},{!r}".format(float(times[row]), 300.0 + row)
+    rows[5000:5020] = ["{!r},".format(float(time))
+                       for time in times[5000:5020]]
+    filepath = str(tmpdir.join("ecg.csv"))
+    with open(filepath, "w") as file:
+        file.write("\n".join(rows))
+    warnings = []
+    monkeypatch.setattr(logging, "warning", warnings.append)
+    with open(analyze_file(filepath, 100, chunksize), "r") as file:
+        quality = json.load(file)["quality"]
+    assert quality == {
+        "voltage_non_float": {"count": 30,
+                              "examples": ["bad100", "bad200", "bad300"]},
+        "voltage_above_300": {"count": 3,
+                              "examples": [1800.0, 1900.0, 2000.0]},
+        "rows_dropped": {"count": 20, "examples": []}}
+    assert len([warning for warning in warnings
+                if "Non-float" in warning]) == 1
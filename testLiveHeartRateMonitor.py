@@ -0,0 +1,137 @@
+import pytest
+import asyncio
+import json
+import math
+
+
+def run_loop(coroutine):
+    """ Runs a coroutine on a fresh event loop
+
+    :param coroutine: Coroutine to run
+    :returns: The result of the coroutine
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_parse_lines():
+    """ Tests the function "parse_lines" from liveHeartRateMonitor.py
+
+    :returns: passes if rows are cast as floats with NaN for bad entries,
+    fails otherwise
+    """
+    import numpy
+    from liveHeartRateMonitor import parse_lines
+    time, voltage = parse_lines([b"0.0,1.5", b"", b"0.5,bad", b"1.0\r"])
+    numpy.testing.assert_array_equal(time, [0.0, 0.5, 1.0])
+    numpy.testing.assert_array_equal(voltage, [1.5, numpy.nan, numpy.nan])
+
+
+def test_patient_update():
+    """ Tests the method "update" of Patient from liveHeartRateMonitor.py
+
+    :returns: passes if invalid and out of order samples are dropped, fails
+    otherwise
+    """
+    import numpy
+    from liveHeartRateMonitor import Patient
+
+    async def feed():
+        patient = Patient("a")
+        patient.update([0.0, 0.5, numpy.nan, 1.0], [0.0, 1.0, 0.0, 0.0])
+        patient.update([0.75, 1.5, 1.25, 2.0], [1.0, 0.0, 1.0, 0.0])
+        return patient.to_dict()
+
+    metrics = run_loop(feed())
+    assert metrics["num_samples"] == 5
+    assert metrics["num_dropped"] == 3
+    assert metrics["duration"] == 2.0
+    assert metrics["voltage_extremes"] == (0.0, 1.0)
+
+
+def test_replay_csv():
+    """ Tests the method "replay_csv" of LiveMonitor from
+    liveHeartRateMonitor.py
+
+    :returns: passes if concurrent replays of one file all end in the same
+    state, fails otherwise
+    """
+    from liveHeartRateMonitor import LiveMonitor
+    monitor = LiveMonitor(window=10.0, workers=4)
+
+    async def replay():
+        await asyncio.gather(*[monitor.replay_csv(str(n), "test_data1.csv",
+                                                  math.inf)
+                               for n in range(20)])
+        return await monitor.snapshot()
+
+    metrics = run_loop(replay())
+    monitor.close()
+    assert len(metrics) == 20
+    first = metrics["0"]
+    assert first["num_samples"] == 10000
+    assert first["duration"] == pytest.approx(10.0, abs=0.01)
+    assert 60 < first["mean_hr_bpm"] < 90
+    for patient in metrics.values():
+        assert patient["num_beats"] == first["num_beats"]
+        assert patient["voltage_extremes"] == first["voltage_extremes"]
+
+
+def test_tcp_feed():
+    """ Tests the method "handle_connection" of LiveMonitor from
+    liveHeartRateMonitor.py
+
+    :returns: passes if samples sent over TCP reach the patient named in the
+    first line, fails otherwise
+    """
+    from liveHeartRateMonitor import LiveMonitor
+    monitor = LiveMonitor(window=10.0, workers=1)
+    wave = [0.0, 1.0, 2.0, 1.0]
+    lines = "".join("%.2f,%.1f\n" % (n * 0.25, wave[n % 4])
+                    for n in range(40))
+
+    async def feed():
+        server = await asyncio.start_server(monitor.handle_connection,
+                                            "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"bed-7\n")
+        # Split a row between writes
+        writer.write(lines[:100].encode())
+        await writer.drain()
+        writer.write(lines[100:].encode())
+        writer.write_eof()
+        # The service closes its end once the feed is analyzed
+        await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return await monitor.snapshot()
+
+    metrics = run_loop(feed())
+    monitor.close()
+    assert list(metrics) == ["bed-7"]
+    assert metrics["bed-7"]["num_samples"] == 40
+    assert metrics["bed-7"]["beats"][-1] == pytest.approx(9.5)
+
+
+def test_main(tmpdir):
+    """ Tests the function "main" from liveHeartRateMonitor.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if every replayed feed is in the snapshot file, fails
+    otherwise
+    """
+    from liveHeartRateMonitor import main
+    output = str(tmpdir.join("live.json"))
+    main(replay=["test_data1.csv"], copies=3, speed=math.inf,
+         output_filepath=output)
+    with open(output) as infile:
+        metrics = json.load(infile)
+    assert sorted(metrics) == ["test_data1-0", "test_data1-1",
+                               "test_data1-2"]
+    assert metrics["test_data1-0"]["num_beats"] > 0
@@ -0,0 +1,84 @@
+import pytest
+import numpy
+
+
+def random_beats(count=200, seed=0):
+    """ Makes the times of beats with irregular RR intervals
+
+    :param count: Number of beats
+    :param seed: Seed of the random number generator
+    :returns: Ascending array of beat times
+    """
+    generator = numpy.random.RandomState(seed)
+    return 1000.0 + numpy.cumsum(generator.uniform(0.6, 1.2, count))
+
+
+def test_partial_metrics():
+    """ Tests the class "PartialMetrics" from partialMetrics.py
+
+    :returns: passes if the metrics and the heart rate variability of one
+    range match those computed from its arrays, and figures that need more
+    beats are None, fails otherwise
+    """
+    from partialMetrics import PartialMetrics
+    beats = random_beats()
+    times = numpy.linspace(999.0, beats[-1] + 1.0, 5000)
+    voltages = numpy.sin(times)
+    metrics = PartialMetrics.from_arrays(times, voltages, beats).to_dict()
+    intervals = numpy.diff(beats)
+    assert metrics["duration"] == times[-1] - times[0]
+    assert metrics["voltage_extremes"] == (voltages.min(), voltages.max())
+    assert metrics["num_beats"] == beats.size
+    assert metrics["mean_hr_bpm"] == beats.size / metrics["duration"] * 60
+    numpy.testing.assert_array_equal(metrics["beats"], beats)
+    assert metrics["sdnn_ms"] == pytest.approx(
+        1000 * intervals.std(ddof=1), rel=1e-12)
+    assert metrics["rmssd_ms"] == pytest.approx(
+        1000 * numpy.sqrt(numpy.mean(numpy.diff(intervals) ** 2)),
+        rel=1e-12)
+    short = PartialMetrics((0.0, 2.0), (0.0, 1.0), [0.5, 1.5]).to_dict()
+    assert short["sdnn_ms"] is None and short["rmssd_ms"] is None
+    assert short["mean_hr_bpm"] == 60.0
+    assert "beats" not in PartialMetrics(
+        (0.0, 2.0), (0.0, 1.0), [0.5, 1.5], keep_beats=False).to_dict()
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_merge(seed):
+    """ Tests the method "merge" and the function "merge_all" from
+    partialMetrics.py
+
+    :param seed: Seed of the random splits
+    :returns: passes if merging the summaries of consecutive ranges, in any
+    grouping and including ranges with no or one beat, gives the summary of
+    the whole range, fails otherwise
+    """
+    from partialMetrics import PartialMetrics, merge_all
+    beats = random_beats(seed=seed)
+    times = numpy.linspace(999.0, beats[-1] + 1.0, 5000)
+    voltages = numpy.cos(3 * times)
+    whole = PartialMetrics.from_arrays(times, voltages, beats).to_dict()
+    generator = numpy.random.RandomState(seed)
+    splits = numpy.sort(generator.randint(0, times.size, 30))
+    splits = numpy.concatenate(([0], splits, splits[-1:], [times.size]))
+    # Each beat goes to the range of the last sample at or before it
+    beat_splits = numpy.searchsorted(beats, times[splits[1:-1]])
+    beat_splits = numpy.concatenate(([0], beat_splits, [beats.size]))
+    partials = [PartialMetrics.from_arrays(
+        times[begin:stop], voltages[begin:stop],
+        beats[beat_splits[number]:beat_splits[number + 1]])
+        for number, (begin, stop) in enumerate(zip(splits[:-1],
+                                                   splits[1:]))]
+    assert any(partial.num_beats == 0 for partial in partials)
+    metrics = merge_all(partials).to_dict()
+    numpy.testing.assert_array_equal(metrics.pop("beats"),
+                                     whole.pop("beats"))
+    assert metrics == pytest.approx(whole, rel=1e-12)
+    middle = len(partials) // 2
+    grouped = merge_all([merge_all(partials[:middle], keep_beats=False),
+                         merge_all(partials[middle:], keep_beats=False)],
+                        keep_beats=False).to_dict()
+    assert grouped == pytest.approx(whole, rel=1e-12)
+    empty = PartialMetrics()
+    assert empty.merge(merge_all(partials)).to_dict()["num_beats"] == \
+        beats.size
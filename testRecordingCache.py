@@ -0,0 +1,75 @@
+import pytest
+import os
+import shutil
+import numpy
+
+
+@pytest.fixture
+def csv_file(tmpdir):
+    """ Copies the sample data into a temporary directory
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: String representing the path to the copied csv file
+    """
+    filepath = str(tmpdir.join("ecg.csv"))
+    shutil.copy("test_data1.csv", filepath)
+    return filepath
+
+
+def test_cache_key(csv_file):
+    """ Tests the function "cache_key" from recordingCache.py
+
+    :param csv_file: Filepath of a csv file
+    :returns: passes if the key changes with the file and the version, fails
+    otherwise
+    """
+    from recordingCache import cache_key
+    key = cache_key(csv_file, "1")
+    assert key.startswith("1-")
+    assert cache_key(csv_file, "1") == key
+    assert cache_key(csv_file, "2") != key
+    assert cache_key(csv_file, "1", content_hash=True) != key
+    with open(csv_file, "a") as file:
+        file.write("10.5,0.1\n")
+    assert cache_key(csv_file, "1") != key
+
+
+def test_store_and_load_recording(tmpdir):
+    """ Tests the functions "store_recording" and "load_recording" from
+    recordingCache.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if stored arrays come back memory-mapped and unchanged,
+    and missing keys miss, fails otherwise
+    """
+    from recordingCache import store_recording, load_recording
+    cache_dir = str(tmpdir.join("cache"))
+    store_recording(cache_dir, "1-abc", [0.0, 0.5, 1.0], [1.0, 2.0, 3.0])
+    time, voltage = load_recording(cache_dir, "1-abc")
+    assert isinstance(time, numpy.memmap)
+    assert time == pytest.approx([0.0, 0.5, 1.0])
+    assert voltage == pytest.approx([1.0, 2.0, 3.0])
+    assert load_recording(cache_dir, "1-def") is None
+
+
+def test_evict(tmpdir):
+    """ Tests the function "evict" from recordingCache.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if stale versions and then least recently used entries
+    are deleted to respect the size cap, fails otherwise
+    """
+    from recordingCache import store_recording, load_recording, evict
+    cache_dir = str(tmpdir)
+    data = numpy.zeros(1000)
+    store_recording(cache_dir, "0-old", data, data)
+    for name in ["1-a", "1-b", "1-c"]:
+        store_recording(cache_dir, name, data, data)
+    assert not os.path.exists(os.path.join(cache_dir, "0-old.npy"))
+    os.utime(os.path.join(cache_dir, "1-a.npy"), (1, 1))
+    os.utime(os.path.join(cache_dir, "1-b.npy"), (2, 2))
+    load_recording(cache_dir, "1-a")
+    entry_size = os.path.getsize(os.path.join(cache_dir, "1-a.npy"))
+    removed = evict(cache_dir, 2 * entry_size, "1")
+    assert [os.path.basename(path) for path in removed] == ["1-b.npy"]
+    assert sorted(os.listdir(cache_dir)) == ["1-a.npy", "1-c.npy"]
@@ -0,0 +1,81 @@
+import pytest
+import os
+import shutil
+import numpy
+
+
+def test_key(tmpdir):
+    """ Tests the method "key" of ResultCache from resultCache.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if the key follows the file's contents, the parameters
+    and the version, but not the file's path, fails otherwise
+    """
+    from resultCache import ResultCache
+    copy = str(tmpdir.join("copy.csv"))
+    shutil.copy("test_data1.csv", copy)
+    cache = ResultCache()
+    key = cache.key("test_data1.csv", "1", {"start": None, "max_gap": 5})
+    assert key.startswith("1-")
+    assert cache.key(copy, "1", {"max_gap": 5, "start": None}) == key
+    assert cache.key(copy, "1", {"max_gap": 4, "start": None}) != key
+    assert cache.key(copy, "2", {"max_gap": 5, "start": None}) != key
+    with open(copy, "a") as file:
+        file.write("10.5,0.1\n")
+    assert cache.key(copy, "1", {"max_gap": 5, "start": None}) != key
+
+
+def test_get_and_put(tmpdir):
+    """ Tests the methods "get" and "put" of ResultCache from resultCache.py
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if entries come back from memory, and from disk with
+    their arrays and values intact, and the memory tier keeps to its size
+    cap, fails otherwise
+    """
+    from resultCache import ResultCache
+    cache_dir = str(tmpdir.join("results"))
+    cache = ResultCache(cache_dir, memory_bytes=600)
+    entry = {"metrics": {"beats": numpy.arange(50.0), "num_beats": 50,
+                         "voltage_extremes": (-0.5, 1.5)},
+             "next_time": float("inf"), "axis": None,
+             "leads": [{"hot_runs": numpy.zeros((2, 2))}]}
+    cache.put("1-a", entry)
+    assert cache.get("1-a") is entry
+    cache.put("1-b", entry)
+    assert cache.get("1-b") is entry
+    assert cache.get("1-c") is None
+    # Only one entry fits in memory, so "1-a" is read back from disk
+    loaded = cache.get("1-a")
+    assert loaded is not entry
+    numpy.testing.assert_array_equal(loaded["metrics"]["beats"],
+                                     numpy.arange(50.0))
+    assert loaded["metrics"]["voltage_extremes"] == [-0.5, 1.5]
+    assert loaded["next_time"] == float("inf")
+    assert loaded["axis"] is None
+    assert loaded["leads"][0]["hot_runs"].shape == (2, 2)
+    assert ResultCache(cache_dir).get("1-b")["metrics"]["num_beats"] == 50
+
+
+def test_put_evict(tmpdir):
+    """ Tests that "put" of ResultCache from resultCache.py keeps the disk
+    tier within its size cap
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: passes if stale versions and least recently used results are
+    evicted, and recordings cached in the same directory are not, fails
+    otherwise
+    """
+    from resultCache import ResultCache
+    from recordingCache import store_recording
+    cache_dir = str(tmpdir)
+    store_recording(cache_dir, "1-recording", numpy.zeros(10000),
+                    numpy.zeros(10000))
+    entry = {"beats": numpy.zeros(1000)}
+    ResultCache(cache_dir).put("0-old", entry)
+    cache = ResultCache(cache_dir, max_bytes=20000)
+    for key in ["1-a", "1-b", "1-c"]:
+        cache.put(key, entry)
+        os.utime(os.path.join(cache_dir, key + ".npz"), None)
+    assert sorted(os.listdir(cache_dir)) == ["1-b.npz", "1-c.npz",
+                                             "1-recording.npy"]
@@ -0,0 +1,227 @@
+import pytest
+import json
+import threading
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+
+@pytest.fixture(scope="module")
+def server():
+    """ Runs the analysis service with one worker on a free local port
+
+    :returns: The running AnalysisServer
+    """
+    from serviceHeartRateMonitor import AnalysisServer
+    server = AnalysisServer(("127.0.0.1", 0), workers=1, max_pending=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, path, payload, content_type="text/csv"):
+    """ Sends a POST request to the service
+
+    :param server: The running AnalysisServer
+    :param path: Path (and query string) of the request
+    :param payload: Bytes to upload
+    :param content_type: Content type of the payload
+    :returns: HTTP status code and decoded JSON body of the response
+    """
+    url = "http://127.0.0.1:%d%s" % (server.server_address[1], path)
+    request = Request(url, data=payload,
+                      headers={"Content-Type": content_type})
+    try:
+        with urlopen(request) as response:
+            return response.status, json.loads(response.read().decode())
+    except HTTPError as error:
+        return error.code, json.loads(error.read().decode())
+
+
+def test_analyze_csv(server):
+    """ Tests that the service analyzes an uploaded csv file
+
+    :param server: The running AnalysisServer
+    :returns: passes if the metrics match those of metrics_to_dict, fails
+    otherwise
+    """
+    with open("test_data1.csv", "rb") as file:
+        status, metrics = post(server, "/analyze?endtime=10", file.read())
+    assert status == 200
+    assert metrics["num_beats"] == 13
+    assert metrics["duration"] == pytest.approx(10.0)
+    assert metrics["voltage_extremes"] == [-0.645, 0.96]
+    assert metrics["quality"] == {}
+
+
+@pytest.mark.parametrize("query, max_gap, band", [
+    ("", 5, None), ("&max_gap=1&band=0.5,40", 1, (0.5, 40.0))])
+def test_analyze_csv_matches_cli(server, tmpdir, query, max_gap, band):
+    """ Tests that the service analyzes a csv file as heartRateMonitor.py
+    does
+
+    :param server: The running AnalysisServer
+    :param tmpdir: Temporary directory for the csv and JSON files
+    :param query: Analysis options of the request
+    :param max_gap: Longest run of invalid samples filled in by the CLI
+    :param band: Band-pass filter cutoffs used by the CLI
+    :returns: passes if the reply, quality section included, matches the
+    metrics JSON of analyze_file, fails otherwise
+    """
+    from heartRateMonitor import analyze_file
+    with open("test_data1.csv") as file:
+        lines = file.read().splitlines()
+    for row in range(1000, 1003):
+        lines[row] = lines[row].split(",")[0] + ","
+    filepath = str(tmpdir.join("gaps.csv"))
+    with open(filepath, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    with open(filepath, "rb") as file:
+        status, metrics = post(server, "/analyze?endtime=20" + query,
+                               file.read())
+    assert status == 200
+    with open(analyze_file(filepath, "20", max_gap=max_gap,
+                           band=band)) as file:
+        expected = json.load(file)
+    assert sorted(metrics) == sorted(expected)
+    assert sorted(metrics["quality"]) == sorted(expected["quality"])
+    assert metrics["quality"]["voltage_non_float"]["count"] == 3
+    assert metrics == expected
+
+
+@pytest.mark.parametrize("header", [True, False])
+def test_analyze_csv_leads(server, tmpdir, header):
+    """ Tests that the service analyzes an uploaded multi-lead csv file as
+    heartRateMonitor.py does
+
+    :param server: The running AnalysisServer
+    :param tmpdir: Temporary directory for the csv and JSON files
+    :param header: True to start the file with a row of lead names
+    :returns: passes if the reply holds the metrics of each lead by name,
+    as in the metrics JSON of analyze_file, fails otherwise
+    """
+    from heartRateMonitor import analyze_file
+    with open("test_data1.csv") as file:
+        rows = [line.strip().split(",") for line in file][:3000]
+    filepath = str(tmpdir.join("leads.csv"))
+    with open(filepath, "w") as file:
+        if header:
+            file.write("time,I,II\n")
+        for time, voltage in rows:
+            file.write("{},{},-{}\n".format(time, voltage, voltage))
+    with open(filepath, "rb") as file:
+        status, metrics = post(server, "/analyze", file.read())
+    assert status == 200
+    names = ["I", "II"] if header else ["lead_1", "lead_2"]
+    assert sorted(metrics["leads"]) == names
+    assert metrics["leads"][names[0]]["num_beats"] > 0
+    with open(analyze_file(filepath, "none")) as file:
+        expected = json.load(file)
+    assert metrics == expected
+
+
+def test_analyze_binary(server):
+    """ Tests that the service analyzes uploaded raw binary samples
+
+    :param server: The running AnalysisServer
+    :returns: passes if the beats of a triangle wave are found, fails
+    otherwise
+    """
+    import numpy
+    samples = numpy.tile([0, 100, 200, 100], 10).astype("<i2")
+    status, metrics = post(server, "/analyze?sample_rate=2&gain=200",
+                           samples.tobytes(), "application/octet-stream")
+    assert status == 200
+    assert metrics["num_beats"] == 10
+    assert metrics["beats"][0] == pytest.approx(1.0)
+
+
+def test_bad_request(server):
+    """ Tests that the service rejects binary samples without a sample rate
+
+    :param server: The running AnalysisServer
+    :returns: passes if the reply is 400, fails otherwise
+    """
+    status, body = post(server, "/analyze", b"\x00\x01",
+                        "application/octet-stream")
+    assert status == 400
+    assert "sample_rate" in body["error"]
+
+
+def test_backpressure(server):
+    """ Tests that the service turns requests away once it is full
+
+    :param server: The running AnalysisServer
+    :returns: passes if the reply is 503 while every slot is taken, fails
+    otherwise
+    """
+    for _ in range(server.capacity):
+        server.slots.acquire()
+    try:
+        status, body = post(server, "/analyze", b"0,1\n1,2\n2,1\n")
+    finally:
+        for _ in range(server.capacity):
+            server.slots.release()
+    assert status == 503
+
+
+def post_raw(server, headers):
+    """ Sends a POST /analyze request with the given headers and no body
+
+    :param server: The running AnalysisServer
+    :param headers: Dictionary of request headers
+    :returns: HTTP status code of the response
+    """
+    from http.client import HTTPConnection
+    connection = HTTPConnection("127.0.0.1", server.server_address[1],
+                                timeout=10)
+    try:
+        connection.putrequest("POST", "/analyze")
+        for key, value in headers.items():
+            connection.putheader(key, value)
+        connection.endheaders()
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+def test_busy_before_body(server):
+    """ Tests that a busy service replies without waiting for the body
+
+    :param server: The running AnalysisServer
+    :returns: passes if the reply is 503 although the announced body is
+    never sent, fails otherwise
+    """
+    for _ in range(server.capacity):
+        server.slots.acquire()
+    try:
+        status = post_raw(server, {"Content-Length": "1000"})
+    finally:
+        for _ in range(server.capacity):
+            server.slots.release()
+    assert status == 503
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_bad_content_length(server, length):
+    """ Tests that the service rejects an invalid Content-Length
+
+    :param server: The running AnalysisServer
+    :param length: Value of the Content-Length header
+    :returns: passes if the reply is 400, fails otherwise
+    """
+    assert post_raw(server, {"Content-Length": length}) == 400
+
+
+def test_health(server):
+    """ Tests the health check of the service
+
+    :param server: The running AnalysisServer
+    :returns: passes if the service reports its capacity, fails otherwise
+    """
+    url = "http://127.0.0.1:%d/health" % server.server_address[1]
+    with urlopen(url) as response:
+        body = json.loads(response.read().decode())
+    assert body == {"status": "ok", "in_flight": 0, "capacity": 2}
@@ -0,0 +1,50 @@
+import pytest
+
+
+def test_stage_timer():
+    """ Tests the class "StageTimer" from stageTimer.py
+
+    :returns: passes if each stage's times, memory and rows are recorded and
+    totalled, fails otherwise
+    """
+    from stageTimer import StageTimer
+    timer = StageTimer()
+    with timer.stage("first", 10):
+        sum(range(10000))
+    with timer.stage("second") as record:
+        record["rows"] = 5
+    report = timer.report()
+    assert [record["stage"] for record in report["stages"]] == \
+        ["first", "second"]
+    assert report["stages"][1]["rows"] == 5
+    assert report["stages"][0]["wall_seconds"] > 0
+    assert report["total_wall_seconds"] == pytest.approx(
+        sum(record["wall_seconds"] for record in report["stages"]))
+    assert report["peak_rss_mb"] is None or report["peak_rss_mb"] > 0
+
+
+def test_stage_timer_disabled():
+    """ Tests that a disabled "StageTimer" from stageTimer.py records nothing
+
+    :returns: passes if no stages are recorded, fails otherwise
+    """
+    from stageTimer import StageTimer
+    timer = StageTimer(enabled=False)
+    with timer.stage("first", 10) as record:
+        record["rows"] = 3
+    assert timer.stages == []
+
+
+def test_stage_timer_exception():
+    """ Tests that "StageTimer" from stageTimer.py still records a stage that
+    raises
+
+    :returns: passes if the failed stage is recorded and the exception
+    propagates, fails otherwise
+    """
+    from stageTimer import StageTimer
+    timer = StageTimer()
+    with pytest.raises(ValueError):
+        with timer.stage("failing"):
+            raise ValueError
+    assert timer.stages[0]["stage"] == "failing"
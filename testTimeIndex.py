@@ -0,0 +1,108 @@
+import pytest
+import os
+import numpy
+
+
+@pytest.fixture
+def csv_file(tmpdir):
+    """ Writes a csv recording of 1000 rows at 100 Hz, with a non-numeric
+    time in row 500
+
+    :param tmpdir: pytest fixture providing a temporary directory
+    :returns: String representing the path to the csv file
+    """
+    filepath = str(tmpdir.join("ecg.csv"))
+    rows = ["%.2f,%.1f" % (n / 100.0, n % 7) for n in range(1000)]
+    rows[500] = "bad,0.0"
+    with open(filepath, "w") as file:
+        file.write("\n".join(rows) + "\n")
+    return filepath
+
+
+def test_build_index(csv_file):
+    """ Tests the function "build_index" from timeIndex.py
+
+    :param csv_file: Filepath of a csv recording
+    :returns: passes if every Nth row with a numeric time is indexed at its
+    byte offset, fails otherwise
+    """
+    from timeIndex import build_index, index_path
+    index = build_index(csv_file, every=100)
+    assert os.path.exists(index_path(csv_file))
+    assert index_path(csv_file).endswith("ecg.idx")
+    expected = [n / 100.0 for n in range(0, 1000, 100) if n != 500]
+    numpy.testing.assert_array_equal(index["times"], expected)
+    assert index["last_time"] == 9.99
+    with open(csv_file, "rb") as file:
+        for time, offset in zip(index["times"], index["offsets"]):
+            file.seek(offset)
+            assert float(file.readline().split(b",")[0]) == time
+
+
+def test_load_index(csv_file):
+    """ Tests the functions "load_index" and "ensure_index" from
+    timeIndex.py
+
+    :param csv_file: Filepath of a csv recording
+    :returns: passes if an index is reused until its csv file changes, fails
+    otherwise
+    """
+    from timeIndex import load_index, ensure_index
+    assert load_index(csv_file) is None
+    built = ensure_index(csv_file, every=100)
+    loaded = load_index(csv_file)
+    numpy.testing.assert_array_equal(loaded["offsets"], built["offsets"])
+    assert loaded["every"] == 100
+    with open(csv_file, "a") as file:
+        file.write("10.00,1.0\n")
+    assert load_index(csv_file) is None
+    assert ensure_index(csv_file, every=100)["last_time"] == 10.0
+
+
+@pytest.mark.parametrize("start, end", [(2.5, 3.5), (0.0, 0.5), (None, 1.0),
+                                        (9.0, None), (4.5, 5.5)])
+def test_byte_range(csv_file, start, end):
+    """ Tests the function "byte_range" from timeIndex.py
+
+    :param csv_file: Filepath of a csv recording
+    :param start: Start of the window (None for the start of the file)
+    :param end: End of the window (None for the end of the file)
+    :returns: passes if the byte range holds the window with a row to spare
+    on either side, and less than two index intervals more, fails otherwise
+    """
+    from timeIndex import build_index, byte_range
+    index = build_index(csv_file, every=100)
+    begin, stop = byte_range(index, start, end)
+    with open(csv_file, "rb") as file:
+        file.seek(begin)
+        lines = file.read(stop - begin).splitlines()
+    times = [float(line.split(b",")[0]) for line in lines
+             if not line.startswith(b"bad")]
+    assert start is None or times[0] < start or begin == 0
+    assert end is None or times[-1] > end
+    assert start is not None or begin == 0
+    assert end is not None or stop == os.path.getsize(csv_file)
+    if start is not None and end is not None:
+        assert len(lines) < (end - start) * 100 + 2 * 200
+
+
+@pytest.mark.parametrize("every", [1, 3, 100])
+def test_byte_range_rows(csv_file, every):
+    """ Tests the "rows" parameter of the function "byte_range" from
+    timeIndex.py
+
+    :param csv_file: Filepath of a csv recording
+    :param every: Number of rows between two index entries
+    :returns: passes if the byte range holds at least the rows asked for on
+    either side of the window, fails otherwise
+    """
+    from timeIndex import build_index, byte_range
+    index = build_index(csv_file, every=every)
+    begin, stop = byte_range(index, 5.0, 6.0, rows=12)
+    with open(csv_file, "rb") as file:
+        file.seek(begin)
+        lines = file.read(stop - begin).splitlines()
+    times = [float(line.split(b",")[0]) for line in lines
+             if not line.startswith(b"bad")]
+    assert len([time for time in times if time < 5.0]) >= 12
+    assert len([time for time in times if time > 6.0]) >= 12
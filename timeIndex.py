@@ -0,0 +1,197 @@
+import logging
+import os
+
+INDEX_EXTENSION = ".idx"
+# Rows between two index entries.  A window read covers at most about two
+# of these intervals on either side of the window itself
+DEFAULT_EVERY = 1000
+BLOCK_BYTES = 16 * 1024 ** 2
+
+
+def index_path(filepath):
+    """ Names the sidecar index of a csv file: the same name with a .idx
+    extension
+
+    :param filepath: A String representing the path to the ECG data
+    :returns: String representing the path to the index
+    """
+    return os.path.splitext(filepath)[0] + INDEX_EXTENSION
+
+
+def build_index(filepath, every=DEFAULT_EVERY):
+    """ Scans a csv file once and writes a sparse index of it: the time and
+    byte offset of every Nth row, plus the time of the last row.  Rows
+    whose time is not a number, or is not later than the previous entry,
+    are left out, so the indexed times are strictly ascending.
+
+    :param filepath: A String representing the path to the ECG data (csv
+    file)
+    :param every: Number of rows between two index entries
+    :returns: Dictionary with the times, offsets, last_time, size and
+    mtime_ns of the file, and every
+    """
+    import numpy
+    stat = os.stat(filepath)
+    row_starts = []
+    rows = 0
+    position = 0
+    with open(filepath, "rb") as file:
+        while True:
+            block = file.read(BLOCK_BYTES)
+            if not block:
+                break
+            newlines = numpy.flatnonzero(
+                numpy.frombuffer(block, dtype=numpy.uint8) == ord("\n"))
+            # Rows start at the beginning of the file and after every
+            # newline that is not the last byte of the file
+            starts = position + newlines + 1
+            if position == 0:
+                starts = numpy.concatenate(([0], starts))
+            starts = starts[starts < stat.st_size]
+            row_starts.append(starts[(rows + numpy.arange(starts.size))
+                                     % every == 0])
+            rows += starts.size
+            position += len(block)
+        offsets = (numpy.concatenate(row_starts) if row_starts
+                   else numpy.array([], dtype=numpy.int64))
+        times = numpy.array([read_time(file, offset) for offset in offsets])
+        last_time = read_last_time(file, stat.st_size)
+    valid = numpy.isfinite(times)
+    times, offsets = times[valid], offsets[valid]
+    ascending = times > numpy.concatenate(
+        ([-numpy.inf], numpy.maximum.accumulate(times)[:-1]))
+    index = {"times": times[ascending],
+             "offsets": offsets[ascending].astype(numpy.int64),
+             "last_time": last_time,
+             "size": stat.st_size,
+             "mtime_ns": stat.st_mtime_ns,
+             "every": every}
+    write_index(filepath, index)
+    return index
+
+
+def read_time(file, offset):
+    """ Reads the time field of the row starting at a byte offset
+
+    :param file: Csv file opened in binary mode
+    :param offset: Byte offset of the start of the row
+    :returns: The time as a float, or NaN if it is not a number
+    """
+    file.seek(offset)
+    field = file.readline().split(b",")[0]
+    try:
+        return float(field)
+    except ValueError:
+        return float("nan")
+
+
+def read_last_time(file, size):
+    """ Reads the time field of the last row that has a numeric time
+
+    :param file: Csv file opened in binary mode
+    :param size: Size of the file in bytes
+    :returns: The time as a float, or NaN if no row has one
+    """
+    tail = 4096
+    while True:
+        file.seek(max(0, size - tail))
+        lines = file.read(tail).splitlines()
+        if size > tail:
+            # The first line may be cut off
+            lines = lines[1:]
+        for line in reversed(lines):
+            try:
+                return float(line.split(b",")[0])
+            except ValueError:
+                continue
+        if tail >= size:
+            return float("nan")
+        tail *= 4
+
+
+def write_index(filepath, index):
+    """ Writes an index next to its csv file, replacing any older one
+    atomically
+
+    :param filepath: A String representing the path to the ECG data
+    :param index: Dictionary from build_index
+    :returns: String representing the path to the index
+    """
+    import numpy
+    path = index_path(filepath)
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "wb") as file:
+        numpy.savez(file, **index)
+    os.replace(temp_path, path)
+    logging.info("Time index written: %s" % path)
+    return path
+
+
+def load_index(filepath):
+    """ Loads the index of a csv file, unless it is missing or the csv file
+    has changed since it was built
+
+    :param filepath: A String representing the path to the ECG data
+    :returns: Dictionary from build_index, or None
+    """
+    import numpy
+    try:
+        with numpy.load(index_path(filepath)) as data:
+            index = {key: data[key] for key in data.files}
+    except (IOError, OSError, ValueError):
+        return None
+    stat = os.stat(filepath)
+    if (int(index["size"]) != stat.st_size or
+            int(index["mtime_ns"]) != stat.st_mtime_ns):
+        logging.info("Time index is out of date: %s" % index_path(filepath))
+        return None
+    for key in ("last_time", "size", "mtime_ns", "every"):
+        index[key] = index[key].item()
+    return index
+
+
+def ensure_index(filepath, every=DEFAULT_EVERY):
+    """ Loads the index of a csv file, building it first if needed
+
+    :param filepath: A String representing the path to the ECG data
+    :param every: Number of rows between two index entries of a new index
+    :returns: Dictionary from build_index
+    """
+    index = load_index(filepath)
+    if index is None:
+        index = build_index(filepath, every)
+    return index
+
+
+def byte_range(index, start_time, end_time, rows=1):
+    """ Finds the bytes of a csv file that hold every row with a time in
+    [start_time, end_time], plus at least a number of rows on either side
+    so that values on the edges can still be interpolated
+
+    :param index: Dictionary from build_index
+    :param start_time: Earliest time needed (None for the start of the file)
+    :param end_time: Latest time needed (None for the end of the file)
+    :param rows: Number of rows wanted on either side of the window
+    :returns: Tuple of the first byte and the byte after the last
+    """
+    import numpy
+    times = index["times"]
+    offsets = index["offsets"]
+    every = index["every"]
+    begin = 0
+    if start_time is not None:
+        # The entry before the window is at least one row before it, and
+        # each earlier entry at least every rows further
+        entry = int(numpy.searchsorted(times, start_time, side="left")) - \
+            1 - int(numpy.ceil((rows - 1) / every))
+        if entry >= 0:
+            begin = int(offsets[entry])
+    stop = index["size"]
+    if end_time is not None:
+        # The rows up to the entry after the window's first one are at
+        # least every rows past the window
+        entry = int(numpy.searchsorted(times, end_time, side="right")) + \
+            max(int(numpy.ceil(rows / every)), 1)
+        if entry < offsets.size:
+            stop = int(offsets[entry])
+    return begin, stop